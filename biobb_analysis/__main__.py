@@ -0,0 +1,5 @@
+""" python -m biobb_analysis <block> [arguments] """
+import sys
+from biobb_analysis.cli import main
+
+sys.exit(main())
@@ -1,7 +1,10 @@
 """ Common functions for package biobb_analysis.ambertools """
 from pathlib import Path, PurePath
+import os
+import re
 import zipfile
 import shutil
+import uuid
 from biobb_common.tools import file_utils as fu
 
 
@@ -31,6 +34,28 @@ def check_traj_path(path, out_log, classname):
 		raise SystemExit(classname + ': Format %s in trajectory input file is not compatible' % file_extension[1:])
 	return path
 
+def check_traj_metadata(top_path, traj_path, in_parameters, out_log, classname):
+	""" Checks the trajectory against the topology and the frame parameters reading only the trajectory headers """
+	from biobb_analysis.native.metadata import probe, topology_atoms
+	metadata = probe(traj_path, top_path)
+	if not metadata or metadata['n_frames'] is None:
+		return metadata
+	fu.log('Trajectory %s: %d frames, %s atoms, %s box, %s ps between frames' % (traj_path, metadata['n_frames'],
+		   metadata['n_atoms'] or 'unknown', metadata['box'] or 'no', ('%g' % metadata['dt']) if metadata['dt'] else 'unknown'), out_log)
+	n_atoms = topology_atoms(top_path)
+	if n_atoms and metadata['n_atoms'] and n_atoms != metadata['n_atoms']:
+		fu.log(classname + ': Number of atoms of the topology (%d) and the trajectory (%d) do not match, exiting' % (n_atoms, metadata['n_atoms']), out_log)
+		raise SystemExit(classname + ': Number of atoms of the topology (%d) and the trajectory (%d) do not match' % (n_atoms, metadata['n_atoms']))
+	for key in ('snapshot', 'start'):
+		first = in_parameters.get(key)
+		if isinstance(first, int) and first > metadata['n_frames']:
+			fu.log(classname + ': %s %d is beyond the last frame of the trajectory (%d), exiting' % (key, first, metadata['n_frames']), out_log)
+			raise SystemExit(classname + ': %s %d is beyond the last frame of the trajectory (%d)' % (key, first, metadata['n_frames']))
+	end = in_parameters.get('end')
+	if isinstance(end, int) and end > metadata['n_frames']:
+		fu.log('End %d is beyond the last frame of the trajectory, only %d frames will be processed' % (end, metadata['n_frames']), out_log)
+	return metadata
+
 def check_out_path(path, out_log, classname):
 	""" Checks if output folder exists """
 	if PurePath(path).parent and not Path(PurePath(path).parent).exists():
@@ -80,6 +105,10 @@ def get_default_value(key):
 		"mask": "all-atoms",
 		"reference": "first",
 		"average": "MyAvg",
+		"average_cache": "auto",
+		# fraction of the available memory the cached frames can use
+		"average_cache_memory": 0.5,
+		"frames": "frames",
 		"instructions_file": "instructions.in",
 		"binary_path": "cpptraj",
 		# default conf for Average
@@ -303,6 +332,156 @@ def get_in_parameters(list, out_log, type = 'None'):
 
 	return start + " " + end + " " + step
 
+def get_snapshots(properties, out_log, classname):
+	""" Gets the list of snapshots, without repeated frames """
+	snapshots = properties.get('snapshots')
+	if not snapshots:
+		return []
+	if not isinstance(snapshots, list) or not all(isinstance(s, int) and not isinstance(s, bool) and s > 0 for s in snapshots):
+		fu.log(classname + ': Incorrect snapshots provided, they must be a list of frame numbers starting from 1, exiting', out_log)
+		raise SystemExit(classname + ': Incorrect snapshots provided')
+	return list(dict.fromkeys(snapshots))
+
+def is_random_access_trajectory(traj):
+	""" Checks if Cpptraj can read a frame of the trajectory format without reading the previous ones """
+	formats = 'mdcrd', 'crd', 'cdf', 'netcdf', 'nc', 'dcd', 'binpos', 'trr'
+	return traj in formats
+
+def get_snapshots_instructions(input_traj_path, snapshots):
+	""" Returns the trajin instructions reading the given snapshots, the trajout parameters needed
+	and the frames in the order they are written """
+	if is_random_access_trajectory(PurePath(input_traj_path).suffix[1:]):
+		# one trajin per snapshot, cpptraj seeks directly to each frame
+		return ['trajin %s %d %d 1' % (input_traj_path, s, s) for s in snapshots], '', snapshots
+	# a single pass between the first and the last snapshot writing only the requested frames
+	first = min(snapshots)
+	frames = sorted(snapshots)
+	only_frames = ','.join(str(s - first + 1) for s in frames)
+	return ['trajin %s %d %d 1' % (input_traj_path, first, frames[-1])], 'onlyframes ' + only_frames, frames
+
+def get_fanout_outputs(properties, out_log, classname):
+	""" Checks the outputs of the fan-out writer, every one with its name, mask, format and frame range """
+	outputs = properties.get('outputs')
+	if not outputs or not isinstance(outputs, list) or not all(isinstance(o, dict) for o in outputs):
+		fu.log(classname + ': No outputs provided, they must be a list of dictionaries, exiting', out_log)
+		raise SystemExit(classname + ': No outputs provided')
+	checked = []
+	for index, output in enumerate(outputs):
+		output = dict({ 'name': 'output_%d' % (index + 1), 'mask': get_default_value('mask'), 'format': get_default_value('format'),
+						'start': get_default_value('start'), 'end': get_default_value('end'), 'steps': get_default_value('step'), 'multi': False }, **output)
+		name = str(output['name'])
+		if not name or PurePath(name).name != name or name in [o['name'] for o in checked]:
+			fu.log(classname + ': Incorrect or repeated output name %s, exiting' % name, out_log)
+			raise SystemExit(classname + ': Incorrect or repeated output name %s' % name)
+		start, end, steps = output['start'], output['end'], output['steps']
+		if not all(isinstance(v, int) and not isinstance(v, bool) for v in (start, end, steps)) or start < 1 or steps < 1 or (end != -1 and end < start):
+			fu.log(classname + ': Incorrect frame range of output %s, start and steps must be positive and end -1 or greater or equal than start, exiting' % name, out_log)
+			raise SystemExit(classname + ': Incorrect frame range of output %s' % name)
+		output['format'] = get_out_parameters(output, out_log)
+		checked.append(output)
+	return checked
+
+def get_fanout_frames(outputs, n_frames, out_log, classname):
+	""" Returns the trajin parameters reading the frames of all the outputs once and the onlyframes
+	parameter of every output (empty if the output writes all the frames read) """
+	for output in outputs:
+		# the range of an output starting after the last frame would be empty
+		if n_frames and output['start'] > n_frames:
+			fu.log(classname + ': Output %s starts at frame %d but the trajectory has %d frames, exiting' % (output['name'], output['start'], n_frames), out_log)
+			raise SystemExit(classname + ': Output %s starts after the last frame of the trajectory' % output['name'])
+	ranges = [(o['start'], o['end'], o['steps']) for o in outputs]
+	if len(set(ranges)) == 1:
+		return '%d %d %d' % ranges[0], [''] * len(outputs)
+	if any(end == -1 for _, end, _ in ranges):
+		if not n_frames:
+			fu.log(classname + ': The outputs have different frame ranges and the length of the trajectory is unknown, the end of every output must be provided, exiting', out_log)
+			raise SystemExit(classname + ': The end of every output must be provided')
+		ranges = [(start, n_frames if end == -1 else min(end, n_frames), steps) for start, end, steps in ranges]
+	first = min(start for start, _, _ in ranges)
+	last = max(end for _, end, _ in ranges)
+	# the frames are numbered from the first frame read
+	only_frames = []
+	for start, end, steps in ranges:
+		if steps == 1:
+			only_frames.append('onlyframes %d-%d' % (start - first + 1, end - first + 1))
+		else:
+			only_frames.append('onlyframes ' + ','.join(str(f - first + 1) for f in range(start, end + 1, steps)))
+	return '%d %d 1' % (first, last), only_frames
+
+def get_incremental_frames(output_path, input_traj_path, in_parameters, out_log):
+	""" Returns the state of the previous incremental execution and the (first, last) frames appended since then,
+	or (None, None) if the whole trajectory has to be processed """
+	from biobb_analysis.runtime.incremental import load_state
+	from biobb_analysis.native.metadata import probe
+	state = load_state(output_path, in_parameters, input_traj_path)
+	if not state:
+		return None, None
+	n_frames = (probe(input_traj_path) or {}).get('n_frames')
+	if n_frames is None:
+		fu.log('The number of frames of %s can not be read from its headers, processing the whole trajectory' % input_traj_path, out_log)
+		return None, None
+	start, end, step = [int(p) for p in get_in_parameters(in_parameters, out_log).split()]
+	last = n_frames if end == -1 else min(end, n_frames)
+	return state, (state['last_frame'] + step, last)
+
+def update_incremental_output(output_path, new_output_path, input_traj_path, in_parameters, state, skip_rows, out_log):
+	""" Appends the new rows to the output (if state is provided) and saves the state of the incremental execution """
+	from biobb_analysis.runtime.incremental import read_rows, renumber, append_rows, update_accumulators, averages, save_state
+	start, end, step = [int(p) for p in get_in_parameters(in_parameters, out_log).split()]
+	header, rows = read_rows(new_output_path)
+	if state:
+		rows = [renumber(row, state['rows'] + i + 1) for i, row in enumerate(rows[skip_rows:])]
+		append_rows(output_path, rows)
+		fu.log('Appended %d frames to %s' % (len(rows), output_path), out_log)
+		n_rows, accumulators = state['rows'] + len(rows), update_accumulators(state['accumulators'], rows)
+	else:
+		n_rows, accumulators = len(rows), update_accumulators(None, rows)
+	save_state(output_path, in_parameters, input_traj_path, n_rows, accumulators, last_frame=start + (n_rows - 1) * step)
+	for i, (average, std) in enumerate(averages(accumulators)):
+		fu.log('Column %d average: %.4f, standard deviation: %.4f (%d frames)' % (i + 2, average, std, n_rows), out_log)
+
+def get_chunk_size(properties, out_log, classname):
+	""" Gets the number of frames of every checkpointed chunk, 0 means no checkpointing """
+	chunk_size = properties.get('chunk_size', 0)
+	if not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or chunk_size < 0:
+		fu.log(classname + ': Incorrect chunk_size provided, exiting', out_log)
+		raise SystemExit(classname + ': Incorrect chunk_size provided')
+	return chunk_size
+
+def get_chunks(input_traj_path, in_parameters, chunk_size, out_log):
+	""" Returns the (first, last) frames of every chunk, or None if the number of frames of the trajectory is unknown """
+	from biobb_analysis.runtime.checkpoint import chunk_ranges
+	from biobb_analysis.native.metadata import probe
+	n_frames = (probe(input_traj_path) or {}).get('n_frames')
+	if n_frames is None:
+		fu.log('The number of frames of %s can not be read from its headers, processing the whole trajectory without checkpoints' % input_traj_path, out_log)
+		return None
+	start, end, step = [int(p) for p in get_in_parameters(in_parameters, out_log).split()]
+	last = n_frames if end == -1 else min(end, n_frames)
+	return chunk_ranges(start, last, step, chunk_size)
+
+def is_raw_dcd_slice(input_traj_path, in_parameters, out_parameters):
+	""" Checks if the trajectory can be sliced copying its raw frames: DCD input and output without mask """
+	mask = in_parameters.get('mask')
+	return PurePath(input_traj_path).suffix[1:].lower() == 'dcd' and out_parameters.get('format') == 'dcd' and mask in (None, '', 'all-atoms')
+
+def slice_raw_dcd(input_traj_path, output_path, in_parameters, out_log):
+	""" Slices a DCD trajectory copying its raw frames without decoding them, returns False if it is not possible """
+	import struct
+	from biobb_analysis.native.slicing import slice_dcd
+	start, end, step = [int(p) for p in get_in_parameters(in_parameters, out_log).split()]
+	try:
+		n_frames = slice_dcd(input_traj_path, output_path, start, end, step)
+	except (OSError, ValueError, struct.error) as err:
+		fu.log('The raw frames of %s can not be copied (%s), using cpptraj' % (input_traj_path, err), out_log)
+		n_frames = 0
+	if not n_frames:
+		if Path(output_path).exists():
+			Path(output_path).unlink()
+		return False
+	fu.log('Copied %d raw DCD frames from %s to %s' % (n_frames, input_traj_path, output_path), out_log)
+	return True
+
 def setup_structure(out_log):
 	""" Sets up the structure """
 	instructions_list = []
@@ -316,6 +495,64 @@ def setup_structure(out_log):
 
 	return instructions_list
 
+def use_prelude_artifact(obj, instructions_list, out_log):
+	""" Replaces the parm, trajin and set up (setup_structure) instructions by a solute-only trajectory and topology
+	cached in prelude_cache_dir, keyed by the input files, the trajin parameters and the set up instructions.
+	The artifact is created by a first cpptraj run if it is not cached yet """
+	from biobb_analysis.native.cache import cache_entry, cache_key, file_signature, read_json, write_json, store_file
+	if not getattr(obj, 'prelude_cache_dir', None) or getattr(obj, 'new_frames', None):
+		return instructions_list
+	prelude = setup_structure(out_log)
+	trajin = [line for line in instructions_list if line.startswith('trajin ')]
+	if len(trajin) != 1 or prelude[0] not in instructions_list:
+		return instructions_list
+	start = instructions_list.index(prelude[0])
+	if instructions_list[start:start + len(prelude)] != prelude:
+		return instructions_list
+	io_in = obj.io_dict["in"]
+	trajin_args = trajin[0].split()[2:]
+	entry = cache_entry(obj.prelude_cache_dir, cache_key(file_signature(io_in["input_top_path"]), file_signature(io_in["input_traj_path"]), trajin_args, prelude))
+	names = {'parm': 'prelude.parm7', 'traj': 'prelude.nc'}
+	if read_json(entry.joinpath('prelude.json')):
+		fu.log('Using cached prelude artifact %s' % entry, out_log)
+		if obj.container_path:
+			for name in names.values():
+				shutil.copy2(str(entry.joinpath(name)), str(PurePath(obj.stage_io_dict["unique_dir"]).joinpath(name)))
+	else:
+		fu.log('Creating the prelude artifact %s' % entry, out_log)
+		# the container writes the artifact in the staging folder, copied to the cache folder once complete
+		host_dir = PurePath(obj.stage_io_dict["unique_dir"]) if obj.container_path else entry
+		stage_dir = PurePath(obj.container_volume_path) if obj.container_path else entry
+		tmp = '%d.tmp.' % os.getpid()
+		parm = [line for line in instructions_list if line.startswith('parm ')][0]
+		strips = [line.split(None, 1)[1] for line in prelude if line.startswith('strip ')]
+		prelude_list = [parm, trajin[0]] + prelude + ['trajout ' + str(stage_dir.joinpath(tmp + names['traj'])) + ' netcdf', 'run']
+		prelude_list += ['parmstrip ' + mask for mask in strips] + ['parmwrite out ' + str(stage_dir.joinpath(tmp + names['parm']))]
+		instructions_file, stdin_text = obj.instructions_file, obj.stdin_text
+		obj.instructions_file = str(host_dir.joinpath('prelude.in'))
+		write_instructions_file(obj, prelude_list)
+		obj.cmd = [obj.binary_path] if obj.stdin_pipe else [obj.binary_path, '-i', str(stage_dir.joinpath('prelude.in'))]
+		obj.run_biobb()
+		obj.instructions_file, obj.stdin_text = instructions_file, stdin_text
+		if obj.return_code or not all(Path(host_dir.joinpath(tmp + name)).exists() for name in names.values()):
+			fu.log('The prelude artifact could not be created, running the set up in the analysis', out_log)
+			for name in names.values():
+				if Path(host_dir.joinpath(tmp + name)).exists():
+					Path(host_dir.joinpath(tmp + name)).unlink()
+			return instructions_list
+		for name in names.values():
+			if obj.container_path:
+				store_file(str(host_dir.joinpath(tmp + name)), str(entry.joinpath(name)))
+				os.replace(str(host_dir.joinpath(tmp + name)), str(host_dir.joinpath(name)))
+			else:
+				os.replace(str(entry.joinpath(tmp + name)), str(entry.joinpath(name)))
+		write_json({'topology': file_signature(io_in["input_top_path"]), 'trajectory': file_signature(io_in["input_traj_path"]),
+					'trajin': trajin_args, 'prelude': prelude}, entry.joinpath('prelude.json'))
+	stage_dir = PurePath(obj.container_volume_path) if obj.container_path else entry
+	# the frames of the artifact are already sliced
+	return ['parm ' + str(stage_dir.joinpath(names['parm'])), 'trajin ' + str(stage_dir.joinpath(names['traj']))] + \
+		[line for line in instructions_list[:start] if not line.startswith(('parm ', 'trajin '))] + instructions_list[start + len(prelude):]
+
 def get_negative_mask(key, out_log):
 	""" Gives the negative mask according to the given key """
 	atoms, msg = get_mask_atoms(key)
@@ -417,10 +654,113 @@ def get_reference_rms(ref, output_cpptraj_path, input_exp_path, mask, output, cl
 
 	return instructions_list
 
+def get_rms_combinations(properties, out_log, classname):
+	""" Gets the (reference, mask) pairs of the references and masks properties, None if none of them is provided """
+	masks = properties.get('masks')
+	references = properties.get('references')
+	if not masks and not references:
+		return None
+	masks = masks or [properties.get('mask', get_default_value('mask'))]
+	references = references or [properties.get('reference', get_default_value('reference'))]
+	if not isinstance(masks, list) or not isinstance(references, list) or not all(isinstance(m, str) and m for m in masks):
+		fu.log(classname + ': Incorrect masks or references provided, they must be lists, exiting', out_log)
+		raise SystemExit(classname + ': Incorrect masks or references provided')
+	for ref in references:
+		if not is_valid_reference(ref):
+			fu.log(classname + ': Reference %s is not compatible, exiting' % ref, out_log)
+			raise SystemExit(classname + ': Reference %s is not compatible' % ref)
+	return [(ref, mask) for ref in dict.fromkeys(references) for mask in dict.fromkeys(masks)]
+
+def get_reference_rms_multi(combinations, output_cpptraj_path, input_exp_path, classname, out_log, nofit=False, norotate=False, nomod=False):
+	""" Gives the instructions computing the RMSd of every (reference, mask) pair in the same pass, one column of
+	output_cpptraj_path per pair. The frames are stripped once to the atoms of all the masks and every reference is
+	read or computed once. All the rms actions but the last one keep the coordinates (nomod), so every action starts
+	from the same frame and only the last one modifies the coordinates written to the output trajectory """
+	instructions_list = []
+	references = list(dict.fromkeys(ref for ref, _ in combinations))
+	masks = list(dict.fromkeys(get_mask(mask, out_log) for _, mask in combinations))
+	if get_mask('all-atoms', out_log) not in masks:
+		instructions_list.append('strip !(' + '|'.join('(' + mask + ')' for mask in masks) + ')')
+
+	if 'average' in references:
+		instructions_list.append('average crdset ' + get_default_value('average'))
+		instructions_list.append('run')
+
+	if 'experimental' in references:
+		if not input_exp_path:
+			fu.log('No experimental structure provided, exiting', out_log)
+			raise SystemExit(classname + ': input_exp_path is mandatory')
+		instructions_list.append('parm ' + input_exp_path + ' noconect [exp]')
+		solute, msg = get_mask_atoms('solute')
+		instructions_list.append('reference ' + input_exp_path + ' ' + solute + ' parm [exp]')
+
+	targets = { 'first': 'first', 'average': 'ref ' + get_default_value('average'), 'experimental': 'reference' }
+	for i, (ref, mask) in enumerate(combinations):
+		# the column is named after the reference and the mask
+		name = re.sub(r'[^A-Za-z0-9_-]', '_', 'RMSD_%s_%s' % (ref, mask))
+		flags = [flag for flag, value in (('nofit', nofit), ('norotate', norotate), ('nomod', nomod or i < len(combinations) - 1)) if value]
+		instructions_list.append(' '.join(['rms', name, targets[ref], get_mask(mask, out_log), 'out', output_cpptraj_path] + flags))
+
+	return instructions_list
+
+def get_average_cache(properties, out_log, classname):
+	""" Checks the average_cache property """
+	average_cache = properties.get('average_cache', get_default_value('average_cache'))
+	if average_cache not in ('auto', 'memory', 'disk', 'none'):
+		fu.log('Average cache %s is not compatible, assigned default value: %s' % (average_cache, get_default_value('average_cache')), out_log)
+		average_cache = get_default_value('average_cache')
+	return average_cache
+
+def get_frame_cache(obj, out_log):
+	""" Gives where the frames read to compute the average reference are cached (memory or disk), so the following
+	actions read them instead of the input trajectory. None if they are not cached """
+	if 'average' not in (obj.in_parameters.get('references') or [obj.in_parameters.get('reference')]) or obj.average_cache == 'none':
+		return None
+	if obj.io_dict["out"].get("output_traj_path"):
+		fu.log('Frames not cached for the average reference when output_traj_path is provided, reading the trajectory twice', out_log)
+		return None
+	cache = obj.average_cache
+	if cache == 'auto':
+		from biobb_analysis.native.cache import available_memory
+		from biobb_analysis.native.metadata import topology_atoms
+		n_frames, n_atoms, memory = obj.expected_frames(), topology_atoms(obj.io_dict["in"]["input_top_path"]), available_memory()
+		# frames stored as float32 with all the atoms of the topology
+		fits = n_frames and n_atoms and memory and n_frames * n_atoms * 12 < memory * get_default_value('average_cache_memory')
+		cache = 'memory' if fits else 'disk'
+	if cache == 'memory' and (obj.container_path or not Path('/dev/shm').is_dir()):
+		cache = 'disk'
+	fu.log('Caching the frames for the average reference in %s, the trajectory is read once' % cache, out_log)
+	return cache
+
+def get_frame_cache_dir(obj, cache):
+	""" Gives the folder of the cached frames: shared memory or the folder of the instructions file """
+	if not cache:
+		return None
+	if cache == 'memory':
+		cache_dir = str(Path('/dev/shm').joinpath(str(uuid.uuid4())))
+		Path(cache_dir).mkdir()
+		obj.tmp_files.append(cache_dir)
+		return cache_dir
+	return str(PurePath(obj.instructions_file).parent)
+
+def cache_average_frames(instructions_list, cache_dir):
+	""" Rewrites the average reference instructions so the first pass writes the frames read, before any action of
+	the pass (set up, fitting or strip) changes them, to cache_dir and the second pass reads them instead of the input
+	trajectory. The second pass sees the same frames than reading the input trajectory again """
+	if not cache_dir:
+		return instructions_list
+	frames_path = str(PurePath(cache_dir).joinpath(get_default_value('frames') + '.nc'))
+	average = instructions_list.index('average crdset ' + get_default_value('average'))
+	run = instructions_list.index('run', average)
+	# the first action of the pass follows the last trajin
+	first_action = max(i for i, line in enumerate(instructions_list[:average]) if line.startswith('trajin ')) + 1
+	second_pass = ['clear trajin', 'trajin ' + frames_path + ' parmindex 0']
+	return instructions_list[:first_action] + ['outtraj ' + frames_path + ' netcdf'] + instructions_list[first_action:run + 1] + \
+		second_pass + instructions_list[run + 1:]
+
 def get_out_parameters(list, out_log):
 	""" Return string with output parameters """
 	format = list['format']
-	msg = None
 	 # check if format provided
 	if not format:
 		format = get_default_value('format')
@@ -435,6 +775,58 @@ def get_out_parameters(list, out_log):
 def copy_instructions_file_to_container(instructions_file, unique_dir):
 	shutil.copy2(instructions_file, unique_dir)
 
+def get_instructions_path(obj, tmp_outputs=False):
+	""" Returns the path of the instructions file: in the container volume if container execution, in a new unique folder if not.
+	If the instructions are sent through a pipe the folder is only created when cpptraj writes temporary outputs in it """
+	if obj.container_path:
+		return str(PurePath(obj.container_volume_path).joinpath(obj.instructions_file))
+	if obj.stdin_pipe and not tmp_outputs:
+		return str(PurePath(Path.cwd()).joinpath(str(uuid.uuid4()), obj.instructions_file))
+	return str(PurePath(fu.create_unique_dir()).joinpath(obj.instructions_file))
+
+def write_instructions_file(obj, instructions_list):
+	""" Writes the instructions file, or keeps the instructions to send them through the standard input of cpptraj if stdin_pipe """
+	instructions = ''.join(line.strip() + '\n' for line in instructions_list)
+	obj.instructions_text = instructions
+	if obj.stdin_pipe:
+		obj.stdin_text = instructions
+	else:
+		with open(obj.instructions_file, 'w') as mdp:
+			mdp.write(instructions)
+	return obj.instructions_file
+
+def get_cpptraj_cmd(obj):
+	""" Returns the cpptraj command line, copying the instructions file to the container if needed """
+	if obj.stdin_pipe:
+		# cpptraj reads the instructions from the standard input
+		return get_launcher_cmd(obj, [obj.binary_path], obj.instructions_text)
+	if obj.container_path:
+		copy_instructions_file_to_container(obj.instructions_file, obj.stage_io_dict['unique_dir'])
+	return get_launcher_cmd(obj, [obj.binary_path, '-i', obj.instructions_file], obj.instructions_text)
+
+def get_launcher_cmd(obj, cmd, instructions):
+	""" Returns the cpptraj command line launched with mpi_ranks MPI processes if all the instructions are MPI-safe,
+	the serial one otherwise. Sets OMP_NUM_THREADS if omp_threads """
+	if obj.omp_threads:
+		obj.environment = dict(obj.environment or os.environ, OMP_NUM_THREADS=str(obj.omp_threads))
+	if not obj.mpi_ranks or obj.mpi_ranks <= 1:
+		return cmd
+	from biobb_analysis.runtime.mpi import launcher_cmd, mpi_fallback_reason
+	reason = mpi_fallback_reason(instructions, obj.mpi_launcher, obj.stdin_pipe, obj.container_path)
+	if reason:
+		fu.log('Running cpptraj serially, %s' % reason, obj.out_log)
+		return cmd
+	fu.log('Running %s with %d MPI ranks' % (obj.mpi_binary_path, obj.mpi_ranks), obj.out_log)
+	return launcher_cmd(cmd, obj.mpi_ranks, obj.mpi_launcher, obj.mpi_binary_path)
+
+def get_mpi_ranks(properties, out_log, classname):
+	""" Checks the number of MPI ranks """
+	mpi_ranks = properties.get('mpi_ranks', 1)
+	if not isinstance(mpi_ranks, int) or mpi_ranks < 1:
+		fu.log(classname + ': Incorrect mpi_ranks provided, exiting', out_log)
+		raise SystemExit(classname + ': Incorrect mpi_ranks provided')
+	return mpi_ranks
+
 def remove_tmp_files(list, remove_tmp, out_log, input_top_path_orig = None, input_top_path = None):
 	""" Removes temporal files generated by the wrapper """
 	tmp_files = list
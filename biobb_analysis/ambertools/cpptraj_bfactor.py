@@ -2,14 +2,13 @@
 
 """Module containing the Cpptraj Bfactor class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import  settings
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.ambertools.common import *
 
 
-class CpptrajBfactor(BiobbObject):
+class CpptrajBfactor(StagingBiobbObject):
     """
     | biobb_analysis CpptrajBfactor
     | Wrapper of the Ambertools Cpptraj module for calculating the Bfactor fluctuations of a given cpptraj compatible trajectory.
@@ -26,15 +25,25 @@ class CpptrajBfactor(BiobbObject):
             * **steps** (*int*) - (1) [1~100000|1] Step for slicing
             * **mask** (*str*) - ("all-atoms") Mask definition. Values: c-alpha (All c-alpha atoms; protein only), backbone (Backbone atoms), all-atoms (All system atoms), heavy-atoms (System heavy atoms; not hydrogen), side-chain (All not backbone atoms), solute (All system atoms except solvent atoms), ions (All ion molecules), solvent (All solvent atoms), AnyAmberFromatMask (Amber atom selection syntax like `@*`).
             * **reference** (*str*) - ("first") Reference definition. Values: first (Use the first trajectory frame as reference), average (Use the average of all trajectory frames as reference), experimental (Use the experimental structure as reference).
+            * **average_cache** (*str*) - ("auto") Cache of the frames read to compute the average reference, so the trajectory is read only once. Values: auto (memory if the frames fit in half of the available memory; disk otherwise), memory (scratch trajectory in shared memory), disk (scratch trajectory in the temporary folder), none (read the trajectory twice).
+            * **prelude_cache_dir** (*str*) - (None) Folder where the set up of the trajectory (centering, imaging, fitting to the first frame and stripping the solvent and the ions) is cached as a solute-only trajectory, keyed by the input files, the slicing parameters and the set up instructions. The following analyses of the same trajectory start from it instead of repeating the set up.
             * **binary_path** (*str*) - ("cpptraj") Path to the cpptraj executable binary.
+            * **mpi_ranks** (*int*) - (1) [1~1024|1] Number of MPI ranks. With more than one, **mpi_binary_path** is launched with **mpi_launcher** and the frames are divided across the ranks if all the cpptraj actions are MPI-safe, cpptraj runs serially otherwise.
+            * **mpi_launcher** (*str*) - ("mpirun") MPI launcher command. The number of ranks is given with -n to srun and aprun and with -np to any other launcher.
+            * **mpi_binary_path** (*str*) - ("cpptraj.MPI") Path to the MPI build of cpptraj.
+            * **omp_threads** (*int*) - (None) [1~256|1] Number of OpenMP threads of cpptraj (OMP_NUM_THREADS).
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the cpptraj instructions to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('afandiadib/ambertools:serial') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
 
     Examples:
         This is a use example of how to use the building block from Python::
@@ -85,8 +94,14 @@ class CpptrajBfactor(BiobbObject):
         self.steps =  properties.get('steps', 1)
         self.mask = properties.get('mask', 'all-atoms')
         self.reference = properties.get('reference', 'first')
+        self.average_cache = properties.get('average_cache', 'auto')
         self.properties = properties
+        self.prelude_cache_dir = properties.get('prelude_cache_dir', None)
         self.binary_path = get_binary_path(properties, 'binary_path')
+        self.mpi_ranks = properties.get('mpi_ranks', 1)
+        self.mpi_launcher = properties.get('mpi_launcher', 'mpirun')
+        self.mpi_binary_path = properties.get('mpi_binary_path', 'cpptraj.MPI')
+        self.omp_threads = properties.get('omp_threads', None)
 
         # Check the properties
         self.check_properties(properties)
@@ -98,15 +113,16 @@ class CpptrajBfactor(BiobbObject):
         self.io_dict["in"]["input_traj_path"] = check_traj_path(self.io_dict["in"]["input_traj_path"], out_log, self.__class__.__name__)
         self.io_dict["out"]["output_cpptraj_path"] = check_out_path(self.io_dict["out"]["output_cpptraj_path"], out_log, self.__class__.__name__)
         self.in_parameters = { 'start': self.start, 'end': self.end, 'step': self.steps, 'mask': self.mask, 'reference': self.reference }
+        check_traj_metadata(self.io_dict["in"]["input_top_path"], self.io_dict["in"]["input_traj_path"], self.in_parameters, out_log, self.__class__.__name__)
+        self.mpi_ranks = get_mpi_ranks(self.properties, out_log, self.__class__.__name__)
+        self.average_cache = get_average_cache(self.properties, out_log, self.__class__.__name__)
 
     def create_instructions_file(self, container_io_dict, out_log, err_log):
         """Creates an input file using the properties file settings"""
         instructions_list = []
         # different path if container execution or not
-        if self.container_path:
-            self.instructions_file = str(PurePath(self.container_volume_path).joinpath(self.instructions_file))
-        else:
-            self.instructions_file = str(PurePath(fu.create_unique_dir()).joinpath(self.instructions_file))
+        frame_cache = get_frame_cache(self, out_log)
+        self.instructions_file = get_instructions_path(self, tmp_outputs=bool(frame_cache))
         fu.create_name(prefix=self.prefix, step=self.step, name=self.instructions_file)
 
         # parm
@@ -135,10 +151,14 @@ class CpptrajBfactor(BiobbObject):
         instructions_list += get_reference(reference, container_io_dict["out"]["output_cpptraj_path"], inp_exp_pth, ref_mask, False, self.__class__.__name__, out_log)
         instructions_list.append('atomicfluct out ' + container_io_dict["out"]["output_cpptraj_path"] + ' byres bfactor')
 
+        # start from the cached set up of the trajectory
+        instructions_list = use_prelude_artifact(self, instructions_list, out_log)
+
+        # the second pass reads the cached frames
+        instructions_list = cache_average_frames(instructions_list, get_frame_cache_dir(self, frame_cache))
+
         # create .in file
-        with open(self.instructions_file, 'w') as mdp:
-            for line in instructions_list:
-                mdp.write(line.strip() + '\n')
+        write_instructions_file(self, instructions_list)
 
         return self.instructions_file
 
@@ -156,12 +176,8 @@ class CpptrajBfactor(BiobbObject):
         # create instructions file
         self.create_instructions_file(self.stage_io_dict, self.out_log, self.err_log) 
 
-        # if container execution, copy intructions file to container
-        if self.container_path:
-            copy_instructions_file_to_container(self.instructions_file, self.stage_io_dict['unique_dir'])
-
         # create cmd and launch execution
-        self.cmd = [self.binary_path, '-i', self.instructions_file]
+        self.cmd = get_cpptraj_cmd(self)
 
         # Run Biobb block
         self.run_biobb()
@@ -204,6 +220,7 @@ def main():
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     # Specific call of each building block
@@ -2,14 +2,13 @@
 
 """Module containing the Cpptraj Dry class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import settings
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.ambertools.common import *
 
 
-class CpptrajDry(BiobbObject):
+class CpptrajDry(StagingBiobbObject):
     """
     | biobb_analysis CpptrajDry
     | Wrapper of the Ambertools Cpptraj module for dehydrating a given cpptraj compatible trajectory stripping out solvent molecules and ions.
@@ -26,14 +25,22 @@ class CpptrajDry(BiobbObject):
             * **mask** (*str*) - ("all-atoms") Mask definition. Values: c-alpha (All c-alpha atoms; protein only), backbone (Backbone atoms), all-atoms (All system atoms), heavy-atoms (System heavy atoms; not hydrogen), side-chain (All not backbone atoms), solute (All system atoms except solvent atoms), ions (All ion molecules), solvent (All solvent atoms), AnyAmberFromatMask (Amber atom selection syntax like `@*`).
             * **format** (*str*) - ("netcdf") Output trajectory format. Values: crd (AMBER trajectory format), cdf (Format used by netCDF software library for writing and reading chromatography-MS data files), netcdf (Format used by netCDF software library for writing and reading chromatography-MS data files), nc (Format used by netCDF software library for writing and reading chromatography-MS data files), restart (AMBER coordinate/restart file with 6 coordinates per line), ncrestart (AMBER coordinate/restart file with 6 coordinates per line), restartnc (AMBER coordinate/restart file with 6 coordinates per line), dcd (AMBER trajectory format), charmm (Format of CHARMM Residue Topology Files (RTF)), cor (Charmm COR), pdb (Protein Data Bank format), mol2 (Complete and portable representation of a SYBYL molecule), trr (Trajectory of a simulation experiment used by GROMACS), gro (GROMACS structure), binpos (Translation of the ASCII atom coordinate format to binary code), xtc (Portable binary format for trajectories produced by GROMACS package), cif (Entry format of PDB database in mmCIF format), arc (Tinker ARC), sqm (SQM Input), sdf (One of a family of chemical-data file formats developed by MDL Information Systems), conflib (LMOD Conflib).
             * **binary_path** (*str*) - ("cpptraj") Path to the cpptraj executable binary.
+            * **mpi_ranks** (*int*) - (1) [1~1024|1] Number of MPI ranks. With more than one, **mpi_binary_path** is launched with **mpi_launcher** and the frames are divided across the ranks if all the cpptraj actions are MPI-safe, cpptraj runs serially otherwise.
+            * **mpi_launcher** (*str*) - ("mpirun") MPI launcher command. The number of ranks is given with -n to srun and aprun and with -np to any other launcher.
+            * **mpi_binary_path** (*str*) - ("cpptraj.MPI") Path to the MPI build of cpptraj.
+            * **omp_threads** (*int*) - (None) [1~256|1] Number of OpenMP threads of cpptraj (OMP_NUM_THREADS).
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the cpptraj instructions to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('afandiadib/ambertools:serial') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
 
     Examples:
         This is a use example of how to use the building block from Python::
@@ -85,6 +92,10 @@ class CpptrajDry(BiobbObject):
         self.format = properties.get('format', 'netcdf')
         self.properties = properties
         self.binary_path = get_binary_path(properties, 'binary_path')
+        self.mpi_ranks = properties.get('mpi_ranks', 1)
+        self.mpi_launcher = properties.get('mpi_launcher', 'mpirun')
+        self.mpi_binary_path = properties.get('mpi_binary_path', 'cpptraj.MPI')
+        self.omp_threads = properties.get('omp_threads', None)
 
         # Check the properties
         self.check_properties(properties)
@@ -96,16 +107,15 @@ class CpptrajDry(BiobbObject):
         self.io_dict["in"]["input_traj_path"] = check_traj_path(self.io_dict["in"]["input_traj_path"], out_log, self.__class__.__name__)
         self.io_dict["out"]["output_cpptraj_path"] = check_out_path(self.io_dict["out"]["output_cpptraj_path"], out_log, self.__class__.__name__)
         self.in_parameters = { 'start': self.start, 'end': self.end, 'step': self.steps, 'mask': self.mask }
+        check_traj_metadata(self.io_dict["in"]["input_top_path"], self.io_dict["in"]["input_traj_path"], self.in_parameters, out_log, self.__class__.__name__)
+        self.mpi_ranks = get_mpi_ranks(self.properties, out_log, self.__class__.__name__)
         self.out_parameters = { 'format': self.format }
 
     def create_instructions_file(self, container_io_dict, out_log, err_log):
         """Creates an input file using the properties file settings"""
         instructions_list = []
         # different path if container execution or not
-        if self.container_path:
-            self.instructions_file = str(PurePath(self.container_volume_path).joinpath(self.instructions_file))
-        else:
-            self.instructions_file = str(PurePath(fu.create_unique_dir()).joinpath(self.instructions_file))
+        self.instructions_file = get_instructions_path(self)
         fu.create_name(prefix=self.prefix, step=self.step, name=self.instructions_file)
 
         # parm
@@ -132,9 +142,7 @@ class CpptrajDry(BiobbObject):
         instructions_list.append('trajout ' + container_io_dict["out"]["output_cpptraj_path"] + ' ' + out_params)
 
         # create .in file
-        with open(self.instructions_file, 'w') as mdp:
-            for line in instructions_list:
-                mdp.write(line.strip() + '\n')
+        write_instructions_file(self, instructions_list)
 
         return self.instructions_file
 
@@ -152,12 +160,8 @@ class CpptrajDry(BiobbObject):
         # create instructions file
         self.create_instructions_file(self.stage_io_dict, self.out_log, self.err_log) 
 
-        # if container execution, copy intructions file to container
-        if self.container_path:
-            copy_instructions_file_to_container(self.instructions_file, self.stage_io_dict['unique_dir'])
-
         # create cmd and launch execution
-        self.cmd = [self.binary_path, '-i', self.instructions_file]
+        self.cmd = get_cpptraj_cmd(self)
 
         # Run Biobb block
         self.run_biobb()
@@ -198,6 +202,7 @@ def main():
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     # Specific call of each building block
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+"""Module containing the Cpptraj Fanout class and the command line interface."""
+import argparse
+from pathlib import Path, PurePath
+from biobb_analysis.runtime.staging import StagingBiobbObject
+from biobb_common.tools import file_utils as fu
+from biobb_common.tools.file_utils import launchlogger
+from biobb_analysis.ambertools.common import *
+
+
+class CpptrajFanout(StagingBiobbObject):
+    """
+    | biobb_analysis CpptrajFanout
+    | Wrapper of the Ambertools Cpptraj module for writing several filtered trajectories from a single read of a given cpptraj compatible trajectory.
+    | Cpptraj (the successor to ptraj) is the main program in Ambertools for processing coordinate trajectories and data files. The parameter names and defaults are the same as the ones in the official `Cpptraj manual <https://amber-md.github.io/cpptraj/CPPTRAJ.xhtml>`_.
+    | Every output has its own mask, format and frame range (ie: a solute-only netcdf, a c-alpha dcd and a series of pdb snapshots). The trajectory is read once from the first to the last frame of all the outputs and every output is written by its own outtraj action, so the outputs cost one pass over the trajectory instead of one execution each.
+
+    Args:
+        input_top_path (str): Path to the input structure or topology file. File type: input. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/data/ambertools/cpptraj.parm.top>`_. Accepted formats: top (edam:format_3881), pdb (edam:format_1476), prmtop (edam:format_3881), parmtop (edam:format_3881), zip (edam:format_3987).
+        input_traj_path (str): Path to the input trajectory to be processed.  File type: input. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/data/ambertools/cpptraj.traj.dcd>`_. Accepted formats: mdcrd (edam:format_3878), crd (edam:format_3878), cdf (edam:format_3650), netcdf (edam:format_3650), nc (edam:format_3650), restart (edam:format_3886), ncrestart (edam:format_3886), restartnc (edam:format_3886), dcd (edam:format_3878), charmm (edam:format_3887), cor (edam:format_2033), pdb (edam:format_1476), mol2 (edam:format_3816), trr (edam:format_3910), gro (edam:format_2033), binpos (edam:format_3885), xtc (edam:format_3875), cif (edam:format_1477), arc (edam:format_2333), sqm (edam:format_2033), sdf (edam:format_3814), conflib (edam:format_2033).
+        output_cpptraj_path (str): Path to the zip file with the output trajectories, named after the name and format of every output. File type: output. Accepted formats: zip (edam:format_3987).
+        properties (dic - Python dictionary object containing the tool parameters, not input/output files):
+            * **outputs** (*list*) - (None) List of outputs, dictionaries with the keys: name (file name without extension, output_1, output_2... by default), mask (mask definition, same values than the mask property of CpptrajMask, all-atoms by default), format (output trajectory format, same values than the format property of CpptrajMask, netcdf by default), start, end and steps (frame range, 1, -1 and 1 by default) and multi (write every frame to its own file named after the output and the frame number, False by default). When the outputs have different frame ranges and the end of any of them is -1, the length of the trajectory is read from its header.
+            * **binary_path** (*str*) - ("cpptraj") Path to the cpptraj executable binary.
+            * **mpi_ranks** (*int*) - (1) [1~1024|1] Number of MPI ranks. With more than one, **mpi_binary_path** is launched with **mpi_launcher** and the frames are divided across the ranks if all the cpptraj actions are MPI-safe, cpptraj runs serially otherwise.
+            * **mpi_launcher** (*str*) - ("mpirun") MPI launcher command. The number of ranks is given with -n to srun and aprun and with -np to any other launcher.
+            * **mpi_binary_path** (*str*) - ("cpptraj.MPI") Path to the MPI build of cpptraj.
+            * **omp_threads** (*int*) - (None) [1~256|1] Number of OpenMP threads of cpptraj (OMP_NUM_THREADS).
+            * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
+            * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the cpptraj instructions to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
+            * **container_path** (*str*) - (None) Container path definition.
+            * **container_image** (*str*) - ('afandiadib/ambertools:serial') Container image definition.
+            * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
+            * **container_working_dir** (*str*) - (None) Container working directory definition.
+            * **container_user_id** (*str*) - (None) Container user_id definition.
+            * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
+
+    Examples:
+        This is a use example of how to use the building block from Python::
+
+            from biobb_analysis.ambertools.cpptraj_fanout import cpptraj_fanout
+            prop = { 
+                'outputs': [
+                    { 'name': 'solute', 'mask': 'solute', 'format': 'netcdf' },
+                    { 'name': 'calpha', 'mask': 'c-alpha', 'format': 'dcd', 'steps': 10 },
+                    { 'name': 'snapshot', 'format': 'pdb', 'start': 1, 'end': 100, 'steps': 50, 'multi': True }
+                ]
+            }
+            cpptraj_fanout(input_top_path='/path/to/myTopology.top', 
+                        input_traj_path='/path/to/myTrajectory.dcd', 
+                        output_cpptraj_path='/path/to/newTrajectories.zip', 
+                        properties=prop)
+
+    Info:
+        * wrapped_software:
+            * name: Ambertools Cpptraj
+            * version: >=20.0
+            * license: GNU
+        * ontology:
+            * name: EDAM
+            * schema: http://edamontology.org/EDAM.owl
+
+    """
+
+    def __init__(self, input_top_path, input_traj_path, output_cpptraj_path, 
+                properties=None, **kwargs) -> None:
+        properties = properties or {}
+
+        # Call parent class constructor
+        super().__init__(properties)
+        self.locals_var_dict = locals().copy()
+
+        # Input/Output files
+        self.io_dict = { 
+            "in": { "input_top_path": input_top_path, "input_traj_path": input_traj_path }, 
+            "out": { "output_cpptraj_path": output_cpptraj_path } 
+        }
+
+        # Properties specific for BB
+        self.instructions_file = get_default_value('instructions_file')
+        self.outputs = properties.get('outputs', None)
+        self.properties = properties
+        self.binary_path = get_binary_path(properties, 'binary_path')
+        self.mpi_ranks = properties.get('mpi_ranks', 1)
+        self.mpi_launcher = properties.get('mpi_launcher', 'mpirun')
+        self.mpi_binary_path = properties.get('mpi_binary_path', 'cpptraj.MPI')
+        self.omp_threads = properties.get('omp_threads', None)
+
+        # Check the properties
+        self.check_properties(properties)
+        self.check_arguments()
+
+    def check_data_params(self, out_log, err_log):
+        """ Checks all the input/output paths and parameters """
+        self.io_dict["in"]["input_top_path"], self.input_top_path_orig = check_top_path(self.io_dict["in"]["input_top_path"], out_log, self.__class__.__name__)
+        self.io_dict["in"]["input_traj_path"] = check_traj_path(self.io_dict["in"]["input_traj_path"], out_log, self.__class__.__name__)
+        self.io_dict["out"]["output_cpptraj_path"] = check_out_path(self.io_dict["out"]["output_cpptraj_path"], out_log, self.__class__.__name__)
+        if PurePath(self.io_dict["out"]["output_cpptraj_path"]).suffix != '.zip':
+            fu.log(self.__class__.__name__ + ': The output must be a zip file, exiting', out_log)
+            raise SystemExit(self.__class__.__name__ + ': The output must be a zip file')
+        self.outputs = get_fanout_outputs(self.properties, out_log, self.__class__.__name__)
+        self.in_parameters = { 'start': min(output['start'] for output in self.outputs) }
+        metadata = check_traj_metadata(self.io_dict["in"]["input_top_path"], self.io_dict["in"]["input_traj_path"], self.in_parameters, out_log, self.__class__.__name__)
+        self.trajin_params, self.only_frames = get_fanout_frames(self.outputs, metadata['n_frames'] if metadata else None, out_log, self.__class__.__name__)
+        self.mpi_ranks = get_mpi_ranks(self.properties, out_log, self.__class__.__name__)
+
+    def get_output_files(self, output):
+        """ Returns the files written for the output in the temporary folder """
+        tmp_dir = Path(self.stage_io_dict.get("unique_dir") or PurePath(self.instructions_file).parent)
+        file_name = output['name'] + '.' + output['format']
+        if output['multi']:
+            # cpptraj adds the frame number to the name of every file
+            return sorted(tmp_dir.glob(file_name + '.*'), key=lambda f: int(f.suffix[1:]))
+        return [tmp_dir.joinpath(file_name)] if tmp_dir.joinpath(file_name).exists() else []
+
+    def zip_outputs(self, out_log):
+        """ Zips the files of all the outputs into the output file """
+        files = []
+        for output in self.outputs:
+            output_files = self.get_output_files(output)
+            if not output_files:
+                fu.log('No frames written for output %s' % output['name'], out_log)
+            files.extend(str(f) for f in output_files)
+        fu.zip_list(self.io_dict["out"]["output_cpptraj_path"], files, out_log)
+
+    def create_instructions_file(self, container_io_dict, out_log, err_log):
+        """Creates an input file using the properties file settings"""
+        instructions_list = []
+        # different path if container execution or not, the outputs are written next to the instructions and zipped after the execution
+        self.instructions_file = get_instructions_path(self, tmp_outputs=True)
+        fu.create_name(prefix=self.prefix, step=self.step, name=self.instructions_file)
+        out_dir = PurePath(self.instructions_file).parent
+
+        # parm
+        instructions_list.append('parm ' + container_io_dict["in"]["input_top_path"])
+
+        # trajin
+        instructions_list.append('trajin ' + container_io_dict["in"]["input_traj_path"] + ' ' + self.trajin_params)
+
+        # one outtraj per output, with the atoms of its mask
+        for output, only_frames in zip(self.outputs, self.only_frames):
+            stripped = output['mask'] not in (None, '', 'None') and get_mask(output['mask'], out_log) != get_mask('all-atoms', out_log)
+            if stripped:
+                instructions_list.append('strip ' + get_negative_mask(output['mask'], out_log))
+            out_params = output['format']
+            if output['multi']:
+                out_params += ' multi'
+            elif output['format'] == 'pdb':
+                out_params += ' model'
+            instructions_list.append(' '.join(filter(None, ['outtraj', str(out_dir.joinpath(output['name'] + '.' + output['format'])), out_params, only_frames])))
+            if stripped:
+                # the next output starts from all the atoms
+                instructions_list.append('unstrip')
+
+        # create .in file
+        write_instructions_file(self, instructions_list)
+
+        return self.instructions_file
+
+    @launchlogger
+    def launch(self) -> int:
+        """Execute the :class:`CpptrajFanout <ambertools.cpptraj_fanout.CpptrajFanout>` ambertools.cpptraj_fanout.CpptrajFanout object."""
+        
+        # check input/output paths and parameters
+        self.check_data_params(self.out_log, self.err_log)
+
+        # Setup Biobb
+        if self.check_restart(): return 0
+        self.stage_files()
+
+        # create instructions file
+        self.create_instructions_file(self.stage_io_dict, self.out_log, self.err_log) 
+
+        # create cmd and launch execution
+        self.cmd = get_cpptraj_cmd(self)
+
+        # Run Biobb block
+        self.run_biobb()
+
+        # Copy files to host
+        self.copy_to_host()
+
+        if not self.return_code:
+            self.zip_outputs(self.out_log)
+
+        # remove temporary folder(s)
+        self.tmp_files.extend([
+            self.stage_io_dict.get("unique_dir"),
+            PurePath(self.instructions_file).parent
+        ])
+        self.remove_tmp_files()
+
+        self.check_arguments(output_files_created=True, raise_exception=False)
+
+        return self.return_code
+
+def cpptraj_fanout(input_top_path: str, input_traj_path: str, output_cpptraj_path: str, properties: dict = None, **kwargs) -> int:
+    """Execute the :class:`CpptrajFanout <ambertools.cpptraj_fanout.CpptrajFanout>` class and
+    execute the :meth:`launch() <ambertools.cpptraj_fanout.CpptrajFanout.launch>` method."""
+
+    return CpptrajFanout(input_top_path=input_top_path, 
+                    input_traj_path=input_traj_path, 
+                    output_cpptraj_path=output_cpptraj_path,
+                    properties=properties, **kwargs).launch()
+
+def main():
+    """Command line execution of this building block. Please check the command line documentation."""
+    parser = argparse.ArgumentParser(description="Writes several filtered trajectories from a single read of a given cpptraj compatible trajectory.", formatter_class=lambda prog: argparse.RawTextHelpFormatter(prog, width=99999))
+    parser.add_argument('--config', required=True, help='Configuration file')
+
+    # Specific args of each building block
+    required_args = parser.add_argument_group('required arguments')
+    required_args.add_argument('--input_top_path', required=True, help='Path to the input structure or topology file. Accepted formats: top, pdb, prmtop, parmtop, zip.')
+    required_args.add_argument('--input_traj_path', required=True, help='Path to the input trajectory to be processed. Accepted formats: crd, cdf, netcdf, restart, ncrestart, restartnc, dcd, charmm, cor, pdb, mol2, trr, gro, binpos, xtc, cif, arc, sqm, sdf, conflib.')
+    required_args.add_argument('--output_cpptraj_path', required=True, help='Path to the zip file with the output trajectories. Accepted formats: zip.')
+
+    args = parser.parse_args()
+    args.config = args.config or "{}"
+    from biobb_common.configuration import settings
+    properties = settings.ConfReader(config=args.config).get_prop_dic()
+
+    # Specific call of each building block
+    cpptraj_fanout(input_top_path=args.input_top_path, 
+                input_traj_path=args.input_traj_path, 
+                output_cpptraj_path=args.output_cpptraj_path, 
+                properties=properties)
+
+if __name__ == '__main__':
+    main()
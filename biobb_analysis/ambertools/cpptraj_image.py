@@ -2,14 +2,13 @@
 
 """Module containing the Cpptraj Image class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import  settings
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.ambertools.common import *
 
 
-class CpptrajImage(BiobbObject):
+class CpptrajImage(StagingBiobbObject):
     """
     | biobb_analysis CpptrajImage
     | Wrapper of the Ambertools Cpptraj module for correcting periodicity (image) from a given cpptraj trajectory file.
@@ -24,16 +23,25 @@ class CpptrajImage(BiobbObject):
             * **end** (*int*) - (-1) [-1~100000|1] Ending frame for slicing.
             * **steps** (*int*) - (1) [1~100000|1] Step for slicing.
             * **mask** (*str*) - ("all-atoms") Mask definition. Values: c-alpha (All c-alpha atoms; protein only), backbone (Backbone atoms), all-atoms (All system atoms), heavy-atoms (System heavy atoms; not hydrogen), side-chain (All not backbone atoms), solute (All system atoms except solvent atoms), ions (All ion molecules), solvent (All solvent atoms), AnyAmberFromatMask (Amber atom selection syntax like `@*`).
+            * **chunk_size** (*int*) - (0) [0~100000|1] Number of frames of every checkpointed chunk, 0 disables the checkpoints. The frames are processed in chunks committed to a folder next to **output_cpptraj_path** (with .ckpt extension) and merged into **output_cpptraj_path** at the end, so a killed execution resumes from the last committed chunk. Trajectory formats whose number of frames can not be read from their headers are processed without checkpoints.
             * **format** (*str*) - ("netcdf") Output trajectory format. Values: crd (AMBER trajectory format), cdf (Format used by netCDF software library for writing and reading chromatography-MS data files), nc (Format used by netCDF software library for writing and reading chromatography-MS data files), netcdf (Format used by netCDF software library for writing and reading chromatography-MS data files), restart (AMBER coordinate/restart file with 6 coordinates per line), ncrestart (AMBER coordinate/restart file with 6 coordinates per line), restartnc (AMBER coordinate/restart file with 6 coordinates per line), dcd (AMBER trajectory format), charmm (Format of CHARMM Residue Topology Files (RTF)), cor (Charmm COR), pdb (Protein Data Bank format), mol2 (Complete and portable representation of a SYBYL molecule), trr (Trajectory of a simulation experiment used by GROMACS), gro (GROMACS structure), binpos (Translation of the ASCII atom coordinate format to binary code), xtc (Portable binary format for trajectories produced by GROMACS package), cif (Entry format of PDB database in mmCIF format), arc (Tinker ARC), sqm (SQM Input), sdf (One of a family of chemical-data file formats developed by MDL Information Systems), conflib (LMOD Conflib).
             * **binary_path** (*str*) - ("cpptraj") Path to the cpptraj executable binary.
+            * **mpi_ranks** (*int*) - (1) [1~1024|1] Number of MPI ranks. With more than one, **mpi_binary_path** is launched with **mpi_launcher** and the frames are divided across the ranks if all the cpptraj actions are MPI-safe, cpptraj runs serially otherwise.
+            * **mpi_launcher** (*str*) - ("mpirun") MPI launcher command. The number of ranks is given with -n to srun and aprun and with -np to any other launcher.
+            * **mpi_binary_path** (*str*) - ("cpptraj.MPI") Path to the MPI build of cpptraj.
+            * **omp_threads** (*int*) - (None) [1~256|1] Number of OpenMP threads of cpptraj (OMP_NUM_THREADS).
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the cpptraj instructions to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('afandiadib/ambertools:serial') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
 
     Examples:
         This is a use example of how to use the building block from Python::
@@ -83,8 +91,13 @@ class CpptrajImage(BiobbObject):
         self.steps =  properties.get('steps', 1)
         self.mask = properties.get('mask', 'all-atoms')
         self.format = properties.get('format', 'netcdf')
+        self.chunk_size = properties.get('chunk_size', 0)
         self.properties = properties
         self.binary_path = get_binary_path(properties, 'binary_path')
+        self.mpi_ranks = properties.get('mpi_ranks', 1)
+        self.mpi_launcher = properties.get('mpi_launcher', 'mpirun')
+        self.mpi_binary_path = properties.get('mpi_binary_path', 'cpptraj.MPI')
+        self.omp_threads = properties.get('omp_threads', None)
 
         # Check the properties
         self.check_properties(properties)
@@ -96,16 +109,33 @@ class CpptrajImage(BiobbObject):
         self.io_dict["in"]["input_traj_path"] = check_traj_path(self.io_dict["in"]["input_traj_path"], out_log, self.__class__.__name__)
         self.io_dict["out"]["output_cpptraj_path"] = check_out_path(self.io_dict["out"]["output_cpptraj_path"], out_log, self.__class__.__name__)
         self.in_parameters = { 'start': self.start, 'end': self.end, 'step': self.steps, 'mask': self.mask }
+        check_traj_metadata(self.io_dict["in"]["input_top_path"], self.io_dict["in"]["input_traj_path"], self.in_parameters, out_log, self.__class__.__name__)
+        self.mpi_ranks = get_mpi_ranks(self.properties, out_log, self.__class__.__name__)
         self.out_parameters = { 'format': self.format }
+        self.chunk_size = get_chunk_size(self.properties, out_log, self.__class__.__name__)
+
+    def get_image_instructions(self, out_log):
+        """Returns the image and mask instructions applied to every frame"""
+        instructions_list = []
+        # image
+        mask_atoms = get_mask('heavy-atoms', out_log)
+        instructions_list.append('center ' + mask_atoms + ' origin')
+        instructions_list.append('autoimage')
+        instructions_list.append('rms first ' + mask_atoms)
+
+        # mask
+        mask = self.in_parameters.get('mask', '')
+        if mask:
+            strip_mask = get_negative_mask(mask, out_log)
+            instructions_list.append('strip ' + strip_mask)
+
+        return instructions_list
 
     def create_instructions_file(self, container_io_dict, out_log, err_log):
         """Creates an input file using the properties file settings"""
         instructions_list = []
         # different path if container execution or not
-        if self.container_path:
-            self.instructions_file = str(PurePath(self.container_volume_path).joinpath(self.instructions_file))
-        else:
-            self.instructions_file = str(PurePath(fu.create_unique_dir()).joinpath(self.instructions_file))
+        self.instructions_file = get_instructions_path(self)
         fu.create_name(prefix=self.prefix, step=self.step, name=self.instructions_file)
 
         # parm
@@ -115,29 +145,84 @@ class CpptrajImage(BiobbObject):
         in_params = get_in_parameters(self.in_parameters, out_log)
         instructions_list.append('trajin ' + container_io_dict["in"]["input_traj_path"] + ' ' + in_params)
 
-        # image
-        mask_atoms = get_mask('heavy-atoms', out_log)
-        instructions_list.append('center ' + mask_atoms + ' origin')
-        instructions_list.append('autoimage')
-        instructions_list.append('rms first ' + mask_atoms)
-
-        # mask
-        mask = self.in_parameters.get('mask', '')
-        if mask:
-            strip_mask = get_negative_mask(mask, out_log)
-            instructions_list.append('strip ' + strip_mask)
+        # image and mask
+        instructions_list += self.get_image_instructions(out_log)
 
         # trajout
         out_params = get_out_parameters(self.out_parameters, out_log)
         instructions_list.append('trajout ' + container_io_dict["out"]["output_cpptraj_path"] + ' ' + out_params)
 
         # create .in file
-        with open(self.instructions_file, 'w') as mdp:
-            for line in instructions_list:
-                mdp.write(line.strip() + '\n')
+        write_instructions_file(self, instructions_list)
 
         return self.instructions_file
 
+    def chunk_path(self, name):
+        """Returns the (host, staged) paths of a temporary file of the checkpointed execution"""
+        if self.container_path:
+            return str(PurePath(self.chunk_dir).joinpath(name)), str(PurePath(self.container_volume_path).joinpath(name))
+        return str(PurePath(self.chunk_dir).joinpath(name)), str(PurePath(self.chunk_dir).joinpath(name))
+
+    def run_instructions(self, name, instructions_list):
+        """Writes an instructions file (or sends the instructions through a pipe) and runs cpptraj with it"""
+        host_path, stage_path = self.chunk_path(name)
+        self.instructions_file = host_path
+        write_instructions_file(self, instructions_list)
+        self.cmd = get_launcher_cmd(self, [self.binary_path] if self.stdin_pipe else [self.binary_path, '-i', stage_path], self.instructions_text)
+        self.run_biobb()
+        return self.return_code
+
+    def launch_chunks(self, chunks):
+        """Processes the frames chunk by chunk, skipping the chunks committed by a previous execution,
+        and merges all of them into the output at the end"""
+        from biobb_analysis.runtime.checkpoint import load_manifest, committed_chunk, commit_chunk, checkpoint_dir, link_file
+        output_path = self.io_dict["out"]["output_cpptraj_path"]
+        manifest = load_manifest(output_path, dict(self.in_parameters, chunk_size=self.chunk_size), self.io_dict["in"]["input_traj_path"])
+        start, end, step = [int(p) for p in get_in_parameters(self.in_parameters, self.out_log).split()]
+        top = 'parm ' + self.stage_io_dict["in"]["input_top_path"]
+        traj = self.stage_io_dict["in"]["input_traj_path"]
+        chunk_paths = []
+        for index, (first, last) in enumerate(chunks):
+            chunk_path = committed_chunk(output_path, manifest, index)
+            if chunk_path:
+                fu.log('Chunk %d (frames %d to %d) already committed' % (index + 1, first, last), self.out_log)
+            else:
+                instructions_list = [top]
+                host_path, stage_path = self.chunk_path('chunk.nc')
+                only_frames = ''
+                if first != start:
+                    # the first frame is read again because it is the reference of the rms fitting, and it is not written
+                    instructions_list.append('trajin %s %d %d 1' % (traj, start, start))
+                    only_frames = ' onlyframes 2-%d' % ((last - first) // step + 2)
+                instructions_list.append('trajin %s %d %d %d' % (traj, first, last, step))
+                instructions_list += self.get_image_instructions(self.out_log)
+                instructions_list.append('trajout %s netcdf%s' % (stage_path, only_frames))
+                if self.run_instructions('chunk.in', instructions_list) or not Path(host_path).exists():
+                    fu.log('Chunk %d (frames %d to %d) failed, the committed chunks are kept in %s' % (index + 1, first, last, checkpoint_dir(output_path)), self.out_log)
+                    return self.return_code or 1
+                chunk_path = commit_chunk(output_path, manifest, index, host_path, first, last)
+                fu.log('Chunk %d (frames %d to %d) committed to %s' % (index + 1, first, last, chunk_path), self.out_log)
+            chunk_paths.append(chunk_path)
+
+        # merge, the chunks are already imaged and stripped
+        instructions_list = [top]
+        mask = self.in_parameters.get('mask', '')
+        if mask:
+            instructions_list.append('parmstrip ' + get_negative_mask(mask, self.out_log))
+        for chunk_path in chunk_paths:
+            if self.container_path:
+                host_path, stage_path = self.chunk_path(PurePath(chunk_path).name)
+                link_file(chunk_path, host_path)
+                chunk_path = stage_path
+            instructions_list.append('trajin ' + chunk_path)
+        out_params = get_out_parameters(self.out_parameters, self.out_log)
+        instructions_list.append('trajout ' + self.stage_io_dict["out"]["output_cpptraj_path"] + ' ' + out_params)
+        self.run_instructions('merge.in', instructions_list)
+        self.copy_to_host()
+        if not self.return_code:
+            self.tmp_files.append(str(checkpoint_dir(output_path)))
+        return self.return_code
+
     @launchlogger
     def launch(self) -> int:
         """Execute the :class:`CpptrajImage <ambertools.cpptraj_image.CpptrajImage>` ambertools.cpptraj_image.CpptrajImage object."""
@@ -149,27 +234,32 @@ class CpptrajImage(BiobbObject):
         if self.check_restart(): return 0
         self.stage_files()
 
-        # create instructions file
-        self.create_instructions_file(self.stage_io_dict, self.out_log, self.err_log) 
+        # checkpointed execution, the frames are processed in chunks that are kept if the execution is killed
+        chunks = None
+        if self.chunk_size:
+            chunks = get_chunks(self.io_dict["in"]["input_traj_path"], self.in_parameters, self.chunk_size, self.out_log)
 
-        # if container execution, copy intructions file to container
-        if self.container_path:
-            copy_instructions_file_to_container(self.instructions_file, self.stage_io_dict['unique_dir'])
+        if chunks:
+            self.chunk_dir = self.stage_io_dict.get("unique_dir") or fu.create_unique_dir()
+            self.launch_chunks(chunks)
+            self.tmp_files.append(self.chunk_dir)
+        else:
+            # create instructions file
+            self.create_instructions_file(self.stage_io_dict, self.out_log, self.err_log) 
 
-        # create cmd and launch execution
-        self.cmd = [self.binary_path, '-i', self.instructions_file]
+            # create cmd and launch execution
+            self.cmd = get_cpptraj_cmd(self)
 
-        # Run Biobb block
-        self.run_biobb()
+            # Run Biobb block
+            self.run_biobb()
 
-        # Copy files to host
-        self.copy_to_host()
+            # Copy files to host
+            self.copy_to_host()
+
+            self.tmp_files.append(PurePath(self.instructions_file).parent)
 
         # remove temporary folder(s)
-        self.tmp_files.extend([
-            self.stage_io_dict.get("unique_dir"),
-            PurePath(self.instructions_file).parent
-        ])
+        self.tmp_files.append(self.stage_io_dict.get("unique_dir"))
         self.remove_tmp_files()
 
         self.check_arguments(output_files_created=True, raise_exception=False)
@@ -198,6 +288,7 @@ def main():
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     # Specific call of each building block
@@ -2,14 +2,14 @@
 
 """Module containing the Cpptraj Rms class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import  settings
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.ambertools.common import *
+from biobb_analysis.runtime.incremental import get_incremental
 
 
-class CpptrajRms(BiobbObject):
+class CpptrajRms(StagingBiobbObject):
     """
     | biobb_analysis CpptrajRms
     | Wrapper of the Ambertools Cpptraj module for calculating the Root Mean Square deviation (RMSd) of a given cpptraj compatible trajectory.
@@ -27,18 +27,31 @@ class CpptrajRms(BiobbObject):
             * **steps** (*int*) - (1) [1~100000|1] Step for slicing
             * **mask** (*str*) - ("all-atoms") Mask definition. Values: c-alpha (All c-alpha atoms; protein only), backbone (Backbone atoms), all-atoms (All system atoms), heavy-atoms (System heavy atoms; not hydrogen), side-chain (All not backbone atoms), solute (All system atoms except solvent atoms), ions (All ion molecules), solvent (All solvent atoms), AnyAmberFromatMask (Amber atom selection syntax like `@*`).
             * **reference** (*str*) - ("first") Reference definition. Values: first (Use the first trajectory frame as reference), average (Use the average of all trajectory frames as reference), experimental (Use the experimental structure as reference).
+            * **masks** (*list*) - (None) List of mask definitions (same values than **mask**). With **masks** and/or **references** the RMSd of every combination of mask and reference is computed in a single pass over the trajectory and written as one column of **output_cpptraj_path** (named RMSD_<reference>_<mask>), replacing **mask** and **reference**. The frames are stripped once to the atoms of all the masks and every reference is read or computed once. With **output_traj_path** the written frames are fitted with the last combination.
+            * **references** (*list*) - (None) List of reference definitions (same values than **reference**), see **masks**.
+            * **average_cache** (*str*) - ("auto") Cache of the frames read to compute the average reference, so the trajectory is read only once. Values: auto (memory if the frames fit in half of the available memory; disk otherwise), memory (scratch trajectory in shared memory), disk (scratch trajectory in the temporary folder), none (read the trajectory twice).
             * **nofit** (*bool*) - (False) Do not perform best-fit RMSD
             * **norotate** (*bool*) - (False) Translate but do not rotate coordinates
             * **nomod** (*bool*) - (False) Do not modify coordinates
+            * **incremental** (*bool*) - (False) Incremental mode for growing trajectories. The state of the execution is saved next to **output_cpptraj_path** (with .state.json extension), the following executions only read the frames appended to the trajectory since then and append their rows to **output_cpptraj_path**. Not available with the average reference nor with **output_traj_path**, nor for trajectory formats whose number of frames can not be read from their headers (these are processed from scratch).
+            * **prelude_cache_dir** (*str*) - (None) Folder where the set up of the trajectory (centering, imaging, fitting to the first frame and stripping the solvent and the ions) is cached as a solute-only trajectory, keyed by the input files, the slicing parameters and the set up instructions. The following analyses of the same trajectory start from it instead of repeating the set up.
             * **binary_path** (*str*) - ("cpptraj") Path to the cpptraj executable binary.
+            * **mpi_ranks** (*int*) - (1) [1~1024|1] Number of MPI ranks. With more than one, **mpi_binary_path** is launched with **mpi_launcher** and the frames are divided across the ranks if all the cpptraj actions are MPI-safe, cpptraj runs serially otherwise.
+            * **mpi_launcher** (*str*) - ("mpirun") MPI launcher command. The number of ranks is given with -n to srun and aprun and with -np to any other launcher.
+            * **mpi_binary_path** (*str*) - ("cpptraj.MPI") Path to the MPI build of cpptraj.
+            * **omp_threads** (*int*) - (None) [1~256|1] Number of OpenMP threads of cpptraj (OMP_NUM_THREADS).
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the cpptraj instructions to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('afandiadib/ambertools:serial') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
 
     Examples:
         This is a use example of how to use the building block from Python::
@@ -89,11 +102,20 @@ class CpptrajRms(BiobbObject):
         self.steps =  properties.get('steps', 1)
         self.mask = properties.get('mask', 'all-atoms')
         self.reference = properties.get('reference', 'first')
+        self.masks = properties.get('masks', None)
+        self.references = properties.get('references', None)
+        self.average_cache = properties.get('average_cache', 'auto')
         self.nofit = properties.get('nofit', False)
         self.norotate = properties.get('norotate', False)
         self.nomod = properties.get('nomod', False)
+        self.incremental = properties.get('incremental', False)
         self.properties = properties
+        self.prelude_cache_dir = properties.get('prelude_cache_dir', None)
         self.binary_path = get_binary_path(properties, 'binary_path')
+        self.mpi_ranks = properties.get('mpi_ranks', 1)
+        self.mpi_launcher = properties.get('mpi_launcher', 'mpirun')
+        self.mpi_binary_path = properties.get('mpi_binary_path', 'cpptraj.MPI')
+        self.omp_threads = properties.get('omp_threads', None)
 
         # Check the properties
         self.check_properties(properties)
@@ -107,15 +129,26 @@ class CpptrajRms(BiobbObject):
         if self.io_dict["out"]["output_traj_path"]:
             self.io_dict["out"]["output_traj_path"] = check_out_path(self.io_dict["out"]["output_traj_path"], out_log, self.__class__.__name__)
         self.in_parameters = { 'start': self.start, 'end': self.end, 'step': self.steps, 'mask': self.mask, 'reference': self.reference }
+        self.combinations = get_rms_combinations(self.properties, out_log, self.__class__.__name__)
+        if self.combinations:
+            self.in_parameters['masks'] = list(dict.fromkeys(mask for _, mask in self.combinations))
+            self.in_parameters['references'] = list(dict.fromkeys(ref for ref, _ in self.combinations))
+        check_traj_metadata(self.io_dict["in"]["input_top_path"], self.io_dict["in"]["input_traj_path"], self.in_parameters, out_log, self.__class__.__name__)
+        self.mpi_ranks = get_mpi_ranks(self.properties, out_log, self.__class__.__name__)
+        self.average_cache = get_average_cache(self.properties, out_log, self.__class__.__name__)
+        self.incremental = get_incremental(self.properties, out_log, self.__class__.__name__)
+        if self.incremental and ('average' in (self.in_parameters.get('references') or [self.reference]) or self.io_dict["out"]["output_traj_path"]):
+            fu.log('Incremental mode is not available with average reference nor output trajectory, processing the whole trajectory', out_log)
+            self.incremental = False
+        self.incremental_parameters = dict(self.in_parameters, nofit=self.nofit, norotate=self.norotate, nomod=self.nomod, input_exp_path=self.io_dict["in"]["input_exp_path"])
+        self.state, self.new_frames = None, None
 
     def create_instructions_file(self, container_io_dict, out_log, err_log):
         """Creates an input file using the properties file settings"""
         instructions_list = []
         # different path if container execution or not
-        if self.container_path:
-            self.instructions_file = str(PurePath(self.container_volume_path).joinpath(self.instructions_file))
-        else:
-            self.instructions_file = str(PurePath(fu.create_unique_dir()).joinpath(self.instructions_file))
+        frame_cache = get_frame_cache(self, out_log)
+        self.instructions_file = get_instructions_path(self, tmp_outputs=bool(self.new_frames or frame_cache))
         fu.create_name(prefix=self.prefix, step=self.step, name=self.instructions_file)
 
         # parm
@@ -123,35 +156,54 @@ class CpptrajRms(BiobbObject):
 
         # trajin
         in_params = get_in_parameters(self.in_parameters, out_log)
-        instructions_list.append('trajin ' + container_io_dict["in"]["input_traj_path"] + ' ' + in_params)
+        output_cpptraj_path = container_io_dict["out"]["output_cpptraj_path"]
+        if self.new_frames:
+            # the first frame is read again because it is the reference of the set up, and its row is discarded
+            start, end, step = in_params.split()
+            instructions_list.append('trajin ' + container_io_dict["in"]["input_traj_path"] + ' ' + start + ' ' + start + ' 1')
+            instructions_list.append('trajin ' + container_io_dict["in"]["input_traj_path"] + ' %d %d ' % self.new_frames + step)
+            from biobb_analysis.runtime.incremental import partial_output_name
+            output_cpptraj_path = str(PurePath(self.instructions_file).parent.joinpath(partial_output_name(output_cpptraj_path)))
+        else:
+            instructions_list.append('trajin ' + container_io_dict["in"]["input_traj_path"] + ' ' + in_params)
 
         # Set up
         instructions_list += setup_structure(self)
 
-        # mask
-        mask = self.in_parameters.get('mask', '')
-        ref_mask = ''
-        if mask:
-            strip_mask = get_negative_mask(mask, out_log)
-            ref_mask = get_mask(mask, out_log)
-            instructions_list.append('strip ' + strip_mask)
-
-        # reference
-        reference = self.in_parameters.get('reference', '')
         inp_exp_pth = None
         if "input_exp_path" in container_io_dict["in"]:
             inp_exp_pth = container_io_dict["in"]["input_exp_path"]
-        instructions_list += get_reference_rms(reference, container_io_dict["out"]["output_cpptraj_path"], inp_exp_pth, ref_mask, True,
-                                               self.__class__.__name__, out_log,  self.nofit, self.norotate, self.nomod)            
+
+        if self.combinations:
+            # masks and references, all the combinations in the same pass
+            instructions_list += get_reference_rms_multi(self.combinations, output_cpptraj_path, inp_exp_pth, self.__class__.__name__,
+                                                         out_log, self.nofit, self.norotate, self.nomod)
+        else:
+            # mask
+            mask = self.in_parameters.get('mask', '')
+            ref_mask = ''
+            if mask:
+                strip_mask = get_negative_mask(mask, out_log)
+                ref_mask = get_mask(mask, out_log)
+                instructions_list.append('strip ' + strip_mask)
+
+            # reference
+            reference = self.in_parameters.get('reference', '')
+            instructions_list += get_reference_rms(reference, output_cpptraj_path, inp_exp_pth, ref_mask, True,
+                                                   self.__class__.__name__, out_log,  self.nofit, self.norotate, self.nomod)            
 
         # trajout
         if ("output_traj_path" in container_io_dict["out"]):
             instructions_list.append('trajout ' + container_io_dict["out"]["output_traj_path"])
 
+        # start from the cached set up of the trajectory
+        instructions_list = use_prelude_artifact(self, instructions_list, out_log)
+
+        # the second pass reads the cached frames
+        instructions_list = cache_average_frames(instructions_list, get_frame_cache_dir(self, frame_cache))
+
         # create .in file
-        with open(self.instructions_file, 'w') as mdp:
-            for line in instructions_list:
-                mdp.write(line.strip() + '\n')
+        write_instructions_file(self, instructions_list)
 
         return self.instructions_file
 
@@ -166,15 +218,20 @@ class CpptrajRms(BiobbObject):
         if self.check_restart(): return 0
         self.stage_files()
 
+        # incremental mode, only the frames appended since the previous execution are processed
+        if self.incremental:
+            self.state, self.new_frames = get_incremental_frames(self.io_dict["out"]["output_cpptraj_path"], self.io_dict["in"]["input_traj_path"], self.incremental_parameters, self.out_log)
+            if self.new_frames and self.new_frames[0] > self.new_frames[1]:
+                fu.log('No new frames in %s' % self.io_dict["in"]["input_traj_path"], self.out_log)
+                self.tmp_files.append(self.stage_io_dict.get("unique_dir"))
+                self.remove_tmp_files()
+                return 0
+
         # create instructions file
         self.create_instructions_file(self.stage_io_dict, self.out_log, self.err_log) 
 
-        # if container execution, copy intructions file to container
-        if self.container_path:
-            copy_instructions_file_to_container(self.instructions_file, self.stage_io_dict['unique_dir'])
-
         # create cmd and launch execution
-        self.cmd = [self.binary_path, '-i', self.instructions_file]
+        self.cmd = get_cpptraj_cmd(self)
 
         # Run Biobb block
         self.run_biobb()
@@ -182,6 +239,14 @@ class CpptrajRms(BiobbObject):
         # Copy files to host
         self.copy_to_host()
 
+        if self.incremental and not self.return_code:
+            new_output_path = self.io_dict["out"]["output_cpptraj_path"]
+            if self.new_frames:
+                from biobb_analysis.runtime.incremental import partial_output_name
+                new_output_path = str(PurePath(self.stage_io_dict.get("unique_dir") or PurePath(self.instructions_file).parent).joinpath(partial_output_name(new_output_path)))
+            update_incremental_output(self.io_dict["out"]["output_cpptraj_path"], new_output_path, self.io_dict["in"]["input_traj_path"],
+                                      self.incremental_parameters, self.state, 1, self.out_log)
+
         # remove temporary folder(s)
         self.tmp_files.extend([
             self.stage_io_dict.get("unique_dir"),
@@ -219,6 +284,7 @@ def main():
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     # Specific call of each building block
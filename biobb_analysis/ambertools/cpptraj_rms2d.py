@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+"""Module containing the Cpptraj Rms2d class and the command line interface."""
+import argparse
+import os
+import shutil
+from pathlib import Path, PurePath
+from biobb_analysis.runtime.staging import StagingBiobbObject
+from biobb_common.tools import file_utils as fu
+from biobb_common.tools.file_utils import launchlogger
+from biobb_analysis.ambertools.common import *
+
+
+class CpptrajRms2d(StagingBiobbObject):
+    """
+    | biobb_analysis CpptrajRms2d
+    | Wrapper of the Ambertools Cpptraj module for calculating the 2D Root Mean Square deviation (RMSd) matrix between the frames of two given cpptraj compatible trajectories, or of a trajectory against itself.
+    | Cpptraj (the successor to ptraj) is the main program in Ambertools for processing coordinate trajectories and data files. The parameter names and defaults are the same as the ones in the official `Cpptraj manual <https://amber-md.github.io/cpptraj/CPPTRAJ.xhtml>`_.
+    | The best-fit RMSd of every pair of frames is computed natively, tile by tile across a process pool, and written to a memory-mapped float32 npy file, so the matrix (ie: 100000 x 100000 frames) is never fully in memory. The tiles are reduced until the processes computing them fit in **memory_budget**. The selected atoms of the trajectories are read natively when their format (dcd, trr, netcdf) and the mask allow it, cpptraj only decodes the rest of formats and masks.
+
+    Args:
+        input_top_path (str): Path to the input structure or topology file. File type: input. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/data/ambertools/cpptraj.parm.top>`_. Accepted formats: top (edam:format_3881), pdb (edam:format_1476), prmtop (edam:format_3881), parmtop (edam:format_3881), zip (edam:format_3987).
+        input_traj_path (str): Path to the input trajectory to be processed.  File type: input. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/data/ambertools/cpptraj.traj.dcd>`_. Accepted formats: mdcrd (edam:format_3878), crd (edam:format_3878), cdf (edam:format_3650), netcdf (edam:format_3650), nc (edam:format_3650), restart (edam:format_3886), ncrestart (edam:format_3886), restartnc (edam:format_3886), dcd (edam:format_3878), charmm (edam:format_3887), cor (edam:format_2033), pdb (edam:format_1476), mol2 (edam:format_3816), trr (edam:format_3910), gro (edam:format_2033), binpos (edam:format_3885), xtc (edam:format_3875), cif (edam:format_1477), arc (edam:format_2333), sqm (edam:format_2033), sdf (edam:format_3814), conflib (edam:format_2033).
+        input_traj_b_path (str) (Optional): Path to the second input trajectory, with the same topology. If not provided the frames of **input_traj_path** are compared with themselves. File type: input. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/data/ambertools/cpptraj.traj.dcd>`_. Accepted formats: mdcrd (edam:format_3878), crd (edam:format_3878), cdf (edam:format_3650), netcdf (edam:format_3650), nc (edam:format_3650), restart (edam:format_3886), ncrestart (edam:format_3886), restartnc (edam:format_3886), dcd (edam:format_3878), charmm (edam:format_3887), cor (edam:format_2033), pdb (edam:format_1476), mol2 (edam:format_3816), trr (edam:format_3910), gro (edam:format_2033), binpos (edam:format_3885), xtc (edam:format_3875), cif (edam:format_1477), arc (edam:format_2333), sqm (edam:format_2033), sdf (edam:format_3814), conflib (edam:format_2033).
+        output_matrix_path (str): Path to the output RMSd matrix (Angstroms), a float32 NumPy array with a row per frame of **input_traj_path** and a column per frame of the second trajectory. File type: output. Accepted formats: npy (edam:format_4003).
+        output_text_path (str) (Optional): Path to the output RMSd matrix as text, with every **text_stride** frames of both trajectories. The first row and column are the frame numbers. File type: output. Accepted formats: dat (edam:format_1637), txt (edam:format_2330).
+        properties (dic - Python dictionary object containing the tool parameters, not input/output files):
+            * **start** (*int*) - (1) [1~100000|1] Starting frame for slicing, of both trajectories.
+            * **end** (*int*) - (-1) [-1~100000|1] Ending frame for slicing, of both trajectories.
+            * **steps** (*int*) - (1) [1~100000|1] Step for slicing, of both trajectories.
+            * **mask** (*str*) - ("all-atoms") Mask definition. Values: c-alpha (All c-alpha atoms; protein only), backbone (Backbone atoms), all-atoms (All system atoms), heavy-atoms (System heavy atoms; not hydrogen), side-chain (All not backbone atoms), solute (All system atoms except solvent atoms), ions (All ion molecules), solvent (All solvent atoms), AnyAmberFromatMask (Amber atom selection syntax like `@*`).
+            * **tile_size** (*int*) - (1000) [1~100000|100] Maximum number of frames per side of the tiles of the matrix computed by each process.
+            * **num_processes** (*int*) - (0) [0~1000|1] Number of processes computing the tiles. 0 means as many processes as CPUs.
+            * **memory_budget** (*float*) - (None) [0~100000|1] Memory (GB) the processes computing the tiles can use at the same time, the tiles are reduced to fit in it. None means half of the available memory.
+            * **text_stride** (*int*) - (1) [1~100000|1] Write every text_stride frames of both trajectories to **output_text_path**.
+            * **binary_path** (*str*) - ("cpptraj") Path to the cpptraj executable binary.
+            * **mpi_ranks** (*int*) - (1) [1~1024|1] Number of MPI ranks. With more than one, **mpi_binary_path** is launched with **mpi_launcher** and the frames are divided across the ranks if all the cpptraj actions are MPI-safe, cpptraj runs serially otherwise.
+            * **mpi_launcher** (*str*) - ("mpirun") MPI launcher command. The number of ranks is given with -n to srun and aprun and with -np to any other launcher.
+            * **mpi_binary_path** (*str*) - ("cpptraj.MPI") Path to the MPI build of cpptraj.
+            * **omp_threads** (*int*) - (None) [1~256|1] Number of OpenMP threads of cpptraj (OMP_NUM_THREADS).
+            * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
+            * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the cpptraj instructions to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
+            * **container_path** (*str*) - (None) Container path definition.
+            * **container_image** (*str*) - ('afandiadib/ambertools:serial') Container image definition.
+            * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
+            * **container_working_dir** (*str*) - (None) Container working directory definition.
+            * **container_user_id** (*str*) - (None) Container user_id definition.
+            * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
+
+
+    Examples:
+        This is a use example of how to use the building block from Python::
+
+            from biobb_analysis.ambertools.cpptraj_rms2d import cpptraj_rms2d
+            prop = { 
+                'start': 1, 
+                'end': -1, 
+                'steps': 1, 
+                'mask': 'c-alpha', 
+                'memory_budget': 8, 
+                'text_stride': 100 
+            }
+            cpptraj_rms2d(input_top_path='/path/to/myTopology.top', 
+                        input_traj_path='/path/to/myTrajectory.dcd', 
+                        input_traj_b_path='/path/to/myReplica.dcd', 
+                        output_matrix_path='/path/to/newMatrix.npy', 
+                        output_text_path='/path/to/newMatrix.dat', 
+                        properties=prop)
+
+    Info:
+        * wrapped_software:
+            * name: Ambertools Cpptraj
+            * version: >=20.0
+            * license: GNU
+        * ontology:
+            * name: EDAM
+            * schema: http://edamontology.org/EDAM.owl
+
+    """
+
+    def __init__(self, input_top_path, input_traj_path, output_matrix_path, 
+                input_traj_b_path=None, output_text_path=None, properties=None, **kwargs) -> None:
+        properties = properties or {}
+
+        # Call parent class constructor
+        super().__init__(properties)
+        self.locals_var_dict = locals().copy()
+
+        # Input/Output files
+        self.io_dict = { 
+            "in": { "input_top_path": input_top_path, "input_traj_path": input_traj_path, "input_traj_b_path": input_traj_b_path }, 
+            "out": { "output_matrix_path": output_matrix_path, "output_text_path": output_text_path } 
+        }
+
+        # Properties specific for BB
+        self.instructions_file = get_default_value('instructions_file')
+        self.start = properties.get('start', 1)
+        self.end = properties.get('end', -1)
+        self.steps =  properties.get('steps', 1)
+        self.mask = properties.get('mask', 'all-atoms')
+        self.tile_size = properties.get('tile_size', 1000)
+        self.num_processes = properties.get('num_processes', 0)
+        self.memory_budget = properties.get('memory_budget', None)
+        self.text_stride = properties.get('text_stride', 1)
+        self.properties = properties
+        self.binary_path = get_binary_path(properties, 'binary_path')
+        self.mpi_ranks = properties.get('mpi_ranks', 1)
+        self.mpi_launcher = properties.get('mpi_launcher', 'mpirun')
+        self.mpi_binary_path = properties.get('mpi_binary_path', 'cpptraj.MPI')
+        self.omp_threads = properties.get('omp_threads', None)
+
+        # Check the properties
+        self.check_properties(properties)
+        self.check_arguments()
+
+    def check_data_params(self, out_log, err_log):
+        """ Checks all the input/output paths and parameters """
+        self.io_dict["in"]["input_top_path"], self.input_top_path_orig = check_top_path(self.io_dict["in"]["input_top_path"], out_log, self.__class__.__name__)
+        self.io_dict["in"]["input_traj_path"] = check_traj_path(self.io_dict["in"]["input_traj_path"], out_log, self.__class__.__name__)
+        if self.io_dict["in"]["input_traj_b_path"]:
+            self.io_dict["in"]["input_traj_b_path"] = check_traj_path(self.io_dict["in"]["input_traj_b_path"], out_log, self.__class__.__name__)
+        self.io_dict["out"]["output_matrix_path"] = check_out_path(self.io_dict["out"]["output_matrix_path"], out_log, self.__class__.__name__)
+        if self.io_dict["out"]["output_text_path"]:
+            self.io_dict["out"]["output_text_path"] = check_out_path(self.io_dict["out"]["output_text_path"], out_log, self.__class__.__name__)
+        self.in_parameters = { 'start': self.start, 'end': self.end, 'step': self.steps, 'mask': self.mask }
+        self.in_params = get_in_parameters(self.in_parameters, out_log)
+        for key in ("input_traj_path", "input_traj_b_path"):
+            if self.io_dict["in"][key]:
+                check_traj_metadata(self.io_dict["in"]["input_top_path"], self.io_dict["in"][key], self.in_parameters, out_log, self.__class__.__name__)
+        for key in ('tile_size', 'text_stride'):
+            if not isinstance(getattr(self, key), int) or getattr(self, key) < 1:
+                fu.log(self.__class__.__name__ + ': Incorrect %s provided, exiting' % key, out_log)
+                raise SystemExit(self.__class__.__name__ + ': Incorrect %s provided' % key)
+        self.mpi_ranks = get_mpi_ranks(self.properties, out_log, self.__class__.__name__)
+
+    def native_atoms(self, out_log):
+        """ Returns the indexes of the atoms selected by the mask, or None if the native engine can not compile it """
+        from biobb_analysis.native.selection import mask_atoms
+        try:
+            return mask_atoms(self.io_dict["in"]["input_top_path"], get_mask(self.mask, out_log))
+        except (ValueError, OSError) as error:
+            fu.log('%s, the trajectories are decoded with cpptraj' % error, out_log)
+            return None
+
+    def decode(self, key, name, out_log):
+        """ Writes the selected atoms and frames of a trajectory with cpptraj to a netcdf file, returns its host path or None if cpptraj fails """
+        self.instructions_file = get_instructions_path(self, tmp_outputs=True)
+        fu.create_name(prefix=self.prefix, step=self.step, name=self.instructions_file)
+        self.tmp_files.append(PurePath(self.instructions_file).parent)
+        output_path = str(PurePath(self.instructions_file).parent.joinpath(name))
+        instructions_list = ['parm ' + self.stage_io_dict["in"]["input_top_path"],
+                             'trajin ' + self.stage_io_dict["in"][key] + ' ' + self.in_params]
+        if get_mask(self.mask, out_log) != get_mask('all-atoms', out_log):
+            instructions_list.append('strip ' + get_negative_mask(self.mask, out_log))
+        instructions_list.append('trajout ' + output_path + ' netcdf')
+        write_instructions_file(self, instructions_list)
+        self.cmd = get_cpptraj_cmd(self)
+        self.run_biobb()
+        if self.return_code:
+            return None
+        return str(Path(self.stage_io_dict.get("unique_dir") or PurePath(self.instructions_file).parent).joinpath(name))
+
+    def write_coords(self, key, atoms, coords_path, out_log):
+        """ Writes the centered coordinates of the selected atoms and frames of a trajectory, returns the trajectory frame numbers or None if it can not be read """
+        from biobb_analysis.native import rmsd
+        from biobb_analysis.native.trajectory import open_trajectory, is_native_trajectory
+        traj_path = self.io_dict["in"][key]
+        start, end, step = [int(p) for p in self.in_params.split()]
+        if atoms is not None and is_native_trajectory(PurePath(traj_path).suffix[1:].lower()):
+            reader = open_trajectory(traj_path)
+            frames = range(start - 1, reader.n_frames if end == -1 else min(end, reader.n_frames), step)
+            rmsd.write_centered(reader, coords_path, atoms, frames)
+            return [frame + 1 for frame in frames]
+        decoded_path = self.decode(key, PurePath(coords_path).stem + '.nc', out_log)
+        if not decoded_path:
+            return None
+        reader = open_trajectory(decoded_path)
+        rmsd.write_centered(reader, coords_path)
+        return list(range(start, start + reader.n_frames * step, step))
+
+    @launchlogger
+    def launch(self) -> int:
+        """Execute the :class:`CpptrajRms2d <ambertools.cpptraj_rms2d.CpptrajRms2d>` ambertools.cpptraj_rms2d.CpptrajRms2d object."""
+        import numpy as np
+        from biobb_analysis.native import rmsd
+        from biobb_analysis.native.cache import available_memory
+        from biobb_analysis.native.framestore import CACHE_MEMORY
+        
+        # check input/output paths and parameters
+        self.check_data_params(self.out_log, self.err_log)
+
+        # Setup Biobb
+        if self.check_restart(): return 0
+        self.stage_files()
+        self.return_code = 0
+        native_dir = self.stage_io_dict.get("unique_dir") or fu.create_unique_dir()
+        self.tmp_files.append(native_dir)
+
+        # centered coordinates of the selected atoms, read once
+        atoms = self.native_atoms(self.out_log)
+        coords_paths, frames = [], []
+        for key, name in (("input_traj_path", 'coords_a.npy'), ("input_traj_b_path", 'coords_b.npy')):
+            if self.io_dict["in"][key]:
+                coords_paths.append(str(PurePath(native_dir).joinpath(name)))
+                frames.append(self.write_coords(key, atoms, coords_paths[-1], self.out_log))
+                if frames[-1] is None:
+                    self.remove_tmp_files()
+                    return self.return_code
+        shapes = [np.load(path, mmap_mode='r').shape for path in coords_paths]
+        if shapes[-1][1] != shapes[0][1]:
+            fu.log(self.__class__.__name__ + ': The masks select %d and %d atoms of the trajectories, exiting' % (shapes[0][1], shapes[-1][1]), self.out_log)
+            raise SystemExit(self.__class__.__name__ + ': The masks select a different number of atoms of the trajectories')
+
+        # tiles fitting in the memory budget
+        num_processes = self.num_processes or os.cpu_count()
+        memory_budget = float(self.memory_budget) * 1e9 if self.memory_budget else (available_memory() or 0) * CACHE_MEMORY
+        tile_size = rmsd.tile_size_for_budget(shapes[0][1], memory_budget, num_processes, self.tile_size) if memory_budget else self.tile_size
+        if tile_size < self.tile_size:
+            fu.log('Tiles of %d frames to fit in %.2f GB of memory' % (tile_size, memory_budget / 1e9), self.out_log)
+        fu.log('Computing the %d x %d RMSd matrix of %d atoms in tiles of %d frames with %d processes' % (shapes[0][0], shapes[-1][0], shapes[0][1], tile_size, num_processes), self.out_log)
+        matrix_path = str(PurePath(native_dir).joinpath('matrix.npy'))
+        stats = rmsd.cross_rmsd_matrix(coords_paths[0], matrix_path, coords_paths[1] if len(coords_paths) > 1 else None, tile_size, num_processes)
+        fu.log('RMSd min %.3f, max %.3f, mean %.3f Angstroms' % stats, self.out_log)
+        shutil.move(matrix_path, self.io_dict["out"]["output_matrix_path"])
+
+        # downsampled text version
+        if self.io_dict["out"]["output_text_path"]:
+            matrix = np.load(self.io_dict["out"]["output_matrix_path"], mmap_mode='r')
+            rmsd.write_matrix_text(matrix, self.io_dict["out"]["output_text_path"], self.text_stride, frames[0], frames[-1])
+            del matrix
+
+        # remove temporary folder(s)
+        self.remove_tmp_files()
+
+        self.check_arguments(output_files_created=True, raise_exception=False)
+
+        return self.return_code
+
+def cpptraj_rms2d(input_top_path: str, input_traj_path: str, output_matrix_path: str, input_traj_b_path: str = None, output_text_path: str = None, properties: dict = None, **kwargs) -> int:
+    """Execute the :class:`CpptrajRms2d <ambertools.cpptraj_rms2d.CpptrajRms2d>` class and
+    execute the :meth:`launch() <ambertools.cpptraj_rms2d.CpptrajRms2d.launch>` method."""
+
+    return CpptrajRms2d(input_top_path=input_top_path, 
+                    input_traj_path=input_traj_path, 
+                    output_matrix_path=output_matrix_path,
+                    input_traj_b_path=input_traj_b_path,
+                    output_text_path=output_text_path,
+                    properties=properties, **kwargs).launch()
+
+def main():
+    """Command line execution of this building block. Please check the command line documentation."""
+    parser = argparse.ArgumentParser(description="Calculates the 2D Root Mean Square deviation (RMSd) matrix between the frames of two given cpptraj compatible trajectories.", formatter_class=lambda prog: argparse.RawTextHelpFormatter(prog, width=99999))
+    parser.add_argument('--config', required=False, help='Configuration file')
+
+    # Specific args of each building block
+    required_args = parser.add_argument_group('required arguments')
+    required_args.add_argument('--input_top_path', required=True, help='Path to the input structure or topology file. Accepted formats: top, pdb, prmtop, parmtop, zip.')
+    required_args.add_argument('--input_traj_path', required=True, help='Path to the input trajectory to be processed. Accepted formats: crd, cdf, netcdf, restart, ncrestart, restartnc, dcd, charmm, cor, pdb, mol2, trr, gro, binpos, xtc, cif, arc, sqm, sdf, conflib.')
+    parser.add_argument('--input_traj_b_path', required=False, help='Path to the second input trajectory. Accepted formats: crd, cdf, netcdf, restart, ncrestart, restartnc, dcd, charmm, cor, pdb, mol2, trr, gro, binpos, xtc, cif, arc, sqm, sdf, conflib.')
+    required_args.add_argument('--output_matrix_path', required=True, help='Path to the output RMSd matrix. Accepted formats: npy.')
+    parser.add_argument('--output_text_path', required=False, help='Path to the output RMSd matrix as text. Accepted formats: dat, txt.')
+
+    args = parser.parse_args()
+    args.config = args.config or "{}"
+    from biobb_common.configuration import settings
+    properties = settings.ConfReader(config=args.config).get_prop_dic()
+
+    # Specific call of each building block
+    cpptraj_rms2d(input_top_path=args.input_top_path, 
+                input_traj_path=args.input_traj_path, 
+                output_matrix_path=args.output_matrix_path, 
+                input_traj_b_path=args.input_traj_b_path, 
+                output_text_path=args.output_text_path, 
+                properties=properties)
+
+if __name__ == '__main__':
+    main()
@@ -2,14 +2,13 @@
 
 """Module containing the Cpptraj Snapshot class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import  settings
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.ambertools.common import *
 
 
-class CpptrajSnapshot(BiobbObject):
+class CpptrajSnapshot(StagingBiobbObject):
     """
     | biobb_analysis CpptrajSnapshot
     | Wrapper of the Ambertools Cpptraj module for extracting a particular snapshot from a given cpptraj compatible trajectory.
@@ -18,20 +17,29 @@ class CpptrajSnapshot(BiobbObject):
     Args:
         input_top_path (str): Path to the input structure or topology file. File type: input. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/data/ambertools/cpptraj.parm.top>`_. Accepted formats: top (edam:format_3881), pdb (edam:format_1476), prmtop (edam:format_3881), parmtop (edam:format_3881), zip (edam:format_3987).
         input_traj_path (str): Path to the input trajectory to be processed.  File type: input. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/data/ambertools/cpptraj.traj.dcd>`_. Accepted formats: mdcrd (edam:format_3878), crd (edam:format_3878), cdf (edam:format_3650), netcdf (edam:format_3650), nc (edam:format_3650), restart (edam:format_3886), ncrestart (edam:format_3886), restartnc (edam:format_3886), dcd (edam:format_3878), charmm (edam:format_3887), cor (edam:format_2033), pdb (edam:format_1476), mol2 (edam:format_3816), trr (edam:format_3910), gro (edam:format_2033), binpos (edam:format_3885), xtc (edam:format_3875), cif (edam:format_1477), arc (edam:format_2333), sqm (edam:format_2033), sdf (edam:format_3814), conflib (edam:format_2033).
-        output_cpptraj_path (str): Path to the output processed structure. File type: output. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/reference/ambertools/ref_cpptraj.snapshot.pdb>`_. Accepted formats: mdcrd (edam:format_3878), crd (edam:format_3878), netcdf (edam:format_3650), nc (edam:format_3650), rst7 (edam:format_3886), ncrst (edam:format_2033), dcd (edam:format_3878), pdb (edam:format_1476), mol2 (edam:format_3816), binpos (edam:format_3885), trr (edam:format_3910), xtc (edam:format_3875), sqm (edam:format_2033).
+        output_cpptraj_path (str): Path to the output processed structure. File type: output. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/reference/ambertools/ref_cpptraj.snapshot.pdb>`_. Accepted formats: mdcrd (edam:format_3878), crd (edam:format_3878), netcdf (edam:format_3650), nc (edam:format_3650), rst7 (edam:format_3886), ncrst (edam:format_2033), dcd (edam:format_3878), pdb (edam:format_1476), mol2 (edam:format_3816), binpos (edam:format_3885), trr (edam:format_3910), xtc (edam:format_3875), sqm (edam:format_2033), zip (edam:format_3987).
         properties (dic - Python dictionary object containing the tool parameters, not input/output files):
             * **snapshot** (*int*) - (1) [1~100000|1] Frame to be captured for snapshot
+            * **snapshots** (*list*) - (None) List of frames to be captured in a single execution, replaces **snapshot**. Trajectory formats with random access (mdcrd, crd, cdf, netcdf, nc, dcd, binpos, trr) only read the requested frames, the rest of formats are read once from the first to the last requested frame and the frames are written in trajectory order. If **output_cpptraj_path** is a zip file, every frame is written to its own pdb file (named after the output file and the frame number), otherwise all the frames are written to the output file (as models if the format is pdb).
             * **mask** (*str*) - ("all-atoms") Mask definition. Values: c-alpha (All c-alpha atoms; protein only), backbone (Backbone atoms), all-atoms (All system atoms), heavy-atoms (System heavy atoms; not hydrogen), side-chain (All not backbone atoms), solute (All system atoms except solvent atoms), ions (All ion molecules), solvent (All solvent atoms), AnyAmberFromatMask (Amber atom selection syntax like `@*`).
             * **format** (*str*) - ("netcdf") Output trajectory format. Values: crd (AMBER trajectory format), cdf (Format used by netCDF software library for writing and reading chromatography-MS data files), netcdf (Format used by netCDF software library for writing and reading chromatography-MS data files), nc (Format used by netCDF software library for writing and reading chromatography-MS data files), restart (AMBER coordinate/restart file with 6 coordinates per line), ncrestart (AMBER coordinate/restart file with 6 coordinates per line), restartnc (AMBER coordinate/restart file with 6 coordinates per line), dcd (AMBER trajectory format), charmm (Format of CHARMM Residue Topology Files (RTF)), cor (Charmm COR), pdb (Protein Data Bank format), mol2 (Complete and portable representation of a SYBYL molecule), trr (Trajectory of a simulation experiment used by GROMACS), gro (GROMACS structure), binpos (Translation of the ASCII atom coordinate format to binary code), xtc (Portable binary format for trajectories produced by GROMACS package), cif (Entry format of PDB database in mmCIF format), arc (Tinker ARC), sqm (SQM Input), sdf (One of a family of chemical-data file formats developed by MDL Information Systems), conflib (LMOD Conflib).
             * **binary_path** (*str*) - ("cpptraj") Path to the cpptraj executable binary.
+            * **mpi_ranks** (*int*) - (1) [1~1024|1] Number of MPI ranks. With more than one, **mpi_binary_path** is launched with **mpi_launcher** and the frames are divided across the ranks if all the cpptraj actions are MPI-safe, cpptraj runs serially otherwise.
+            * **mpi_launcher** (*str*) - ("mpirun") MPI launcher command. The number of ranks is given with -n to srun and aprun and with -np to any other launcher.
+            * **mpi_binary_path** (*str*) - ("cpptraj.MPI") Path to the MPI build of cpptraj.
+            * **omp_threads** (*int*) - (None) [1~256|1] Number of OpenMP threads of cpptraj (OMP_NUM_THREADS).
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the cpptraj instructions to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('afandiadib/ambertools:serial') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
 
     Examples:
         This is a use example of how to use the building block from Python::
@@ -75,10 +83,15 @@ class CpptrajSnapshot(BiobbObject):
         # Properties specific for BB
         self.instructions_file = get_default_value('instructions_file')
         self.snapshot =  properties.get('snapshot', 1)
+        self.snapshots = properties.get('snapshots', None)
         self.mask = properties.get('mask', 'all-atoms')
         self.format = properties.get('format', 'netcdf')
         self.properties = properties
         self.binary_path = get_binary_path(properties, 'binary_path')
+        self.mpi_ranks = properties.get('mpi_ranks', 1)
+        self.mpi_launcher = properties.get('mpi_launcher', 'mpirun')
+        self.mpi_binary_path = properties.get('mpi_binary_path', 'cpptraj.MPI')
+        self.omp_threads = properties.get('omp_threads', None)
 
         # Check the properties
         self.check_properties(properties)
@@ -90,24 +103,50 @@ class CpptrajSnapshot(BiobbObject):
         self.io_dict["in"]["input_traj_path"] = check_traj_path(self.io_dict["in"]["input_traj_path"], out_log, self.__class__.__name__)
         self.io_dict["out"]["output_cpptraj_path"] = check_out_path(self.io_dict["out"]["output_cpptraj_path"], out_log, self.__class__.__name__)
         self.in_parameters = { 'snapshot': self.snapshot, 'mask': self.mask }
+        check_traj_metadata(self.io_dict["in"]["input_top_path"], self.io_dict["in"]["input_traj_path"], self.in_parameters, out_log, self.__class__.__name__)
+        self.mpi_ranks = get_mpi_ranks(self.properties, out_log, self.__class__.__name__)
         self.out_parameters = { 'format': self.format }
+        self.snapshots = get_snapshots(self.properties, out_log, self.__class__.__name__)
+        self.zip_output = bool(self.snapshots) and PurePath(self.io_dict["out"]["output_cpptraj_path"]).suffix == '.zip'
+
+    def get_snapshots_trajout(self, output_path, out_params):
+        """ Returns the trajout instruction writing all the snapshots """
+        if self.zip_output:
+            # one pdb file per snapshot in the temporary folder, zipped after the execution
+            output_path = str(PurePath(self.instructions_file).parent.joinpath('snapshot.pdb'))
+            return 'trajout %s pdb multi %s' % (output_path, self.snapshots_params)
+        if out_params == 'pdb':
+            out_params += ' model'
+        return 'trajout %s %s %s' % (output_path, out_params, self.snapshots_params)
+
+    def zip_snapshots(self, out_log):
+        """ Renames the pdb files of the snapshots after their frame and zips them into the output file """
+        tmp_dir = Path(self.stage_io_dict.get("unique_dir") or PurePath(self.instructions_file).parent)
+        stem = PurePath(self.io_dict["out"]["output_cpptraj_path"]).stem
+        # cpptraj numbers the files in the same order the frames are written
+        files = sorted(tmp_dir.glob('snapshot.pdb.*'), key=lambda f: int(f.suffix[1:]))
+        snapshots_files = []
+        for frame, snapshot_file in zip(self.snapshots_order, files):
+            snapshots_files.append(str(snapshot_file.rename(tmp_dir.joinpath('%s_%d.pdb' % (stem, frame)))))
+        fu.zip_list(self.io_dict["out"]["output_cpptraj_path"], snapshots_files, out_log)
 
     def create_instructions_file(self, container_io_dict, out_log, err_log):
         """Creates an input file using the properties file settings"""
         instructions_list = []
         # different path if container execution or not
-        if self.container_path:
-            self.instructions_file = str(PurePath(self.container_volume_path).joinpath(self.instructions_file))
-        else:
-            self.instructions_file = str(PurePath(fu.create_unique_dir()).joinpath(self.instructions_file))
+        self.instructions_file = get_instructions_path(self, tmp_outputs=self.zip_output)
         fu.create_name(prefix=self.prefix, step=self.step, name=self.instructions_file)
 
         # parm
         instructions_list.append('parm ' + container_io_dict["in"]["input_top_path"])
 
         # trajin
-        in_params = get_in_parameters(self.in_parameters, out_log, 'snapshot')
-        instructions_list.append('trajin ' + container_io_dict["in"]["input_traj_path"] + ' ' + in_params)
+        if self.snapshots:
+            trajin_list, self.snapshots_params, self.snapshots_order = get_snapshots_instructions(container_io_dict["in"]["input_traj_path"], self.snapshots)
+            instructions_list.extend(trajin_list)
+        else:
+            in_params = get_in_parameters(self.in_parameters, out_log, 'snapshot')
+            instructions_list.append('trajin ' + container_io_dict["in"]["input_traj_path"] + ' ' + in_params)
 
         # mask
         mask = self.in_parameters.get('mask', '')
@@ -117,12 +156,13 @@ class CpptrajSnapshot(BiobbObject):
 
         # trajout
         out_params = get_out_parameters(self.out_parameters, out_log)
-        instructions_list.append('trajout ' + container_io_dict["out"]["output_cpptraj_path"] + ' ' + out_params)
+        if self.snapshots:
+            instructions_list.append(self.get_snapshots_trajout(container_io_dict["out"]["output_cpptraj_path"], out_params))
+        else:
+            instructions_list.append('trajout ' + container_io_dict["out"]["output_cpptraj_path"] + ' ' + out_params)
 
         # create .in file
-        with open(self.instructions_file, 'w') as mdp:
-            for line in instructions_list:
-                mdp.write(line.strip() + '\n')
+        write_instructions_file(self, instructions_list)
 
         return self.instructions_file
 
@@ -140,12 +180,8 @@ class CpptrajSnapshot(BiobbObject):
         # create instructions file
         self.create_instructions_file(self.stage_io_dict, self.out_log, self.err_log) 
 
-        # if container execution, copy intructions file to container
-        if self.container_path:
-            copy_instructions_file_to_container(self.instructions_file, self.stage_io_dict['unique_dir'])
-
         # create cmd and launch execution
-        self.cmd = [self.binary_path, '-i', self.instructions_file]
+        self.cmd = get_cpptraj_cmd(self)
 
         # Run Biobb block
         self.run_biobb()
@@ -153,6 +189,9 @@ class CpptrajSnapshot(BiobbObject):
         # Copy files to host
         self.copy_to_host()
 
+        if self.zip_output:
+            self.zip_snapshots(self.out_log)
+
         # remove temporary folder(s)
         self.tmp_files.extend([
             self.stage_io_dict.get("unique_dir"),
@@ -182,10 +221,11 @@ def main():
     required_args = parser.add_argument_group('required arguments')
     required_args.add_argument('--input_top_path', required=True, help='Path to the input structure or topology file. Accepted formats: top, pdb, prmtop, parmtop, zip.')
     required_args.add_argument('--input_traj_path', required=True, help='Path to the input trajectory to be processed. Accepted formats: crd, cdf, netcdf, restart, ncrestart, restartnc, dcd, charmm, cor, pdb, mol2, trr, gro, binpos, xtc, cif, arc, sqm, sdf, conflib.')
-    required_args.add_argument('--output_cpptraj_path', required=True, help='Path to the output processed structure.')
+    required_args.add_argument('--output_cpptraj_path', required=True, help='Path to the output processed structure. Accepted formats: crd, netcdf, rst7, ncrst, dcd, pdb, mol2, binpos, trr, xtc, sqm, zip.')
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     # Specific call of each building block
@@ -0,0 +1,40 @@
+""" Single command line entry point of the biobb_analysis building blocks: biobb_analysis <block> [arguments]
+
+Only the module of the requested block is imported, the command line of every block is the same one of its own console script.
+biobb_analysis worker <queue_dir> launches a worker of a shared file system work queue (see biobb_analysis.runtime.workqueue). """
+import importlib
+import sys
+from biobb_analysis import ambertools, gromacs
+
+
+def get_blocks():
+    """ Returns the module of every block by its command line name, without importing them """
+    return {name: '%s.%s' % (package.__name__, name) for package in (ambertools, gromacs) for name in package.__all__}
+
+
+def usage(blocks):
+    """ Returns the help of the multiplexer """
+    return ('usage: biobb_analysis <block> [arguments]\n       biobb_analysis worker <queue_dir> [options]\n\nblocks:\n' +
+            '\n'.join('  ' + name for name in sorted(blocks)))
+
+
+def main(argv=None):
+    """ Launches the main() of the block in the first argument with the rest of arguments """
+    argv = sys.argv[1:] if argv is None else argv
+    blocks = get_blocks()
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage(blocks))
+        return 0
+    if argv[0] == 'worker':
+        from biobb_analysis.runtime.workqueue import main as worker_main
+        return worker_main(argv[1:])
+    if argv[0] not in blocks:
+        print('biobb_analysis: unknown block %s\n\n%s' % (argv[0], usage(blocks)), file=sys.stderr)
+        return 2
+    # the block parses sys.argv and shows its own name in the help
+    sys.argv = argv
+    return importlib.import_module(blocks[argv[0]]).main()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -128,7 +128,11 @@ def get_default_value(key):
 		"start": 0,
 		"end": 0,
 		"dt": 0,
-		"ot_str_ens": "pdb"
+		"ot_str_ens": "pdb",
+		"engine": "gmx",
+		"num_processes": 0,
+		"tile_size": 1000,
+		"chunk_size": 0
 	}
 
 	return default_values[key]
@@ -288,6 +292,79 @@ def get_cutoff(properties, out_log, classname):
 		raise SystemExit(classname + ': Incorrect cutoff provided')
 	return str(cutoff)
 
+def get_engine(properties, method, out_log, classname):
+	""" Gets engine """
+	engine = properties.get('engine', get_default_value('engine'))
+	if not is_valid_engine(engine):
+		fu.log(classname + ': Incorrect engine provided, exiting', out_log)
+		raise SystemExit(classname + ': Incorrect engine provided')
+	if engine == 'native' and not is_valid_native_method(method):
+		fu.log(classname + ': Method %s is not available in the native engine, exiting' % method, out_log)
+		raise SystemExit(classname + ': Method %s is not available in the native engine' % method)
+	return engine
+
+def get_sweep(properties, engine, out_log, classname):
+	""" Gets the list of (method, cutoff) clustering settings """
+	sweep = properties.get('sweep', [])
+	if not isinstance(sweep, list):
+		fu.log(classname + ': Incorrect sweep provided, exiting', out_log)
+		raise SystemExit(classname + ': Incorrect sweep provided')
+	settings = []
+	for setting in sweep:
+		if not isinstance(setting, dict):
+			fu.log(classname + ': Incorrect sweep setting %s provided, exiting' % str(setting), out_log)
+			raise SystemExit(classname + ': Incorrect sweep setting %s provided' % str(setting))
+		method = get_method(setting, out_log, classname)
+		get_engine({'engine': engine}, method, out_log, classname)
+		settings.append((method, get_cutoff(setting, out_log, classname)))
+	return settings
+
+def get_positive_int(properties, key, out_log, classname):
+	""" Gets a positive integer parameter """
+	value = properties.get(key, get_default_value(key))
+	if not isinstance(value, int) or value < 0:
+		fu.log(classname + ': Incorrect %s provided, exiting' % key, out_log)
+		raise SystemExit(classname + ': Incorrect %s provided' % key)
+	return value
+
+def get_time_chunks(input_traj_path, chunk_size, out_log):
+	""" Returns the (first, last) frames and the (begin, end) times of every chunk of chunk_size frames,
+	or None if the frame times of the trajectory can not be read from its headers """
+	from biobb_analysis.runtime.checkpoint import chunk_ranges
+	from biobb_analysis.native.trajectory import frame_times
+	times = frame_times(input_traj_path)
+	if not times:
+		fu.log('The frame times of %s can not be read from its headers, processing the whole trajectory without checkpoints' % input_traj_path, out_log)
+		return None
+	chunks = []
+	for first, last in chunk_ranges(0, len(times) - 1, 1, chunk_size):
+		# the limits are set between frames so that they do not depend on the time precision
+		begin = (times[first - 1] + times[first]) / 2 if first > 0 else None
+		end = (times[last] + times[last + 1]) / 2 if last < len(times) - 1 else None
+		chunks.append((first, last, begin, end))
+	return chunks
+
+def is_raw_xtc_slice(input_traj_path, output_traj_path, input_index_path, selection):
+	""" Checks if the trajectory can be sliced copying its compressed frames: XTC input and output without atom selection """
+	return (PurePath(input_traj_path).suffix[1:].lower() == 'xtc' and PurePath(output_traj_path).suffix[1:].lower() == 'xtc'
+			and not input_index_path and selection in ('', 'System'))
+
+def slice_raw_xtc(input_traj_path, output_traj_path, start, end, dt, out_log):
+	""" Slices an XTC trajectory by time copying its compressed frames, returns False if it is not possible """
+	import struct
+	from biobb_analysis.native.slicing import slice_xtc
+	try:
+		n_frames = slice_xtc(input_traj_path, output_traj_path, float(start), float(end), float(dt))
+	except (OSError, ValueError, struct.error) as err:
+		fu.log('The compressed frames of %s can not be copied (%s), using trjconv' % (input_traj_path, err), out_log)
+		n_frames = 0
+	if not n_frames:
+		if Path(output_traj_path).exists():
+			Path(output_traj_path).unlink()
+		return False
+	fu.log('Copied %d compressed XTC frames from %s to %s' % (n_frames, input_traj_path, output_traj_path), out_log)
+	return True
+
 def is_valid_boolean(val):
 	""" Checks if given value is boolean """
 	values = [True, False]
@@ -310,6 +387,16 @@ def is_valid_method_param(met):
 	methods = ['linkage', 'jarvis-patrick', 'monte-carlo', 'diagonalization', 'gromos']
 	return met in methods
 
+def is_valid_native_method(met):
+	""" Checks if method is available in the native engine """
+	methods = ['linkage', 'jarvis-patrick', 'gromos']
+	return met in methods
+
+def is_valid_engine(engine):
+	""" Checks engine parameter """
+	values = ['gmx', 'native']
+	return engine in values
+
 def is_valid_structure(ext):
 	""" Checks if structure format is compatible with GROMACS """
 	formats = ['tpr', 'gro', 'g96', 'pdb', 'brk', 'ent']
@@ -330,6 +417,11 @@ def is_valid_trajectory_output(ext):
 	formats = ['xtc', 'trr', 'gro', 'g96', 'pdb', 'tng']
 	return ext in formats
 
+def is_valid_trjcat_output(ext):
+	""" Checks if the trajectory format can be concatenated by trjcat """
+	formats = ['xtc', 'trr', 'gro', 'g96', 'pdb', 'tng']
+	return ext in formats
+
 def is_valid_energy(ext):
 	""" Checks if energy format is compatible with GROMACS """
 	formats = ['edr']
@@ -380,9 +472,32 @@ def is_valid_selection(ext):
 	formats = ['System', 'Protein', 'Protein-H', 'C-alpha', 'Backbone', 'MainChain', 'MainChain+Cb', 'MainChain+H', 'SideChain', 'SideChain-H', 'Prot-Masses', 'non-Protein', 'Water', 'SOL', 'non-Water', 'Ion', 'NA', 'CL', 'Water_and_ions', 'DNA', 'RNA', 'Protein_DNA', 'Protein_RNA', 'Protein_DNA_RNA', 'DNA_RNA']
 	return ext in formats
 
+def write_frames_index(frames, path):
+	""" Writes an index file with the given (0-based) frame numbers """
+	with open(path, 'w') as ndx:
+		ndx.write('[ frames ]\n')
+		for i in range(0, len(frames), 15):
+			ndx.write(' '.join('%d' % (f + 1) for f in frames[i:i + 15]) + '\n')
+	return path
+
 def copy_instructions_file_to_container(instructions_file, unique_dir):
 	shutil.copy2(instructions_file, unique_dir)
 
+def set_stdin(obj, text):
+	""" Sets the answers to the GROMACS prompts: kept in stdin_text to send them through a pipe if stdin_pipe,
+	written to a stdin file staged with the inputs if not """
+	if obj.stdin_pipe:
+		obj.stdin_text = text + '\n'
+	else:
+		obj.io_dict['in']['stdin_file_path'] = fu.create_stdin_file(text)
+
+def add_stdin(obj, cmd):
+	""" Appends the redirection of the stdin file to a GROMACS command line """
+	if obj.stage_io_dict["in"].get("stdin_file_path"):
+		cmd.append('<')
+		cmd.append(obj.stage_io_dict["in"]["stdin_file_path"])
+	return cmd
+
 def remove_tmp_files(list, remove_tmp, out_log):
 	""" Removes temporal files generated by the wrapper """
 	if remove_tmp:
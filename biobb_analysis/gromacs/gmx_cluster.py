@@ -2,14 +2,17 @@
 
 """Module containing the GMX Cluster class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import  settings
+import os
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.gromacs.common import *
 
+# levels of the RMSD matrix written by GROMACS cluster when it is read back by the following settings of a sweep
+MATRIX_LEVELS = 5000
 
-class GMXCluster(BiobbObject):
+
+class GMXCluster(StagingBiobbObject):
     """
     | biobb_analysis GMXCluster
     | Wrapper of the GROMACS cluster module for clustering structures from a given GROMACS compatible trajectory.
@@ -26,15 +29,26 @@ class GMXCluster(BiobbObject):
             * **dista** (*bool*) - (False) Use RMSD of distances instead of RMS deviation.
             * **method** (*str*) - ("linkage") Method for cluster determination. Values: linkage (Add a structure to a cluster when its distance to any element of the cluster is less than cutoff), jarvis-patrick (Add a structure to a cluster when this structure and a structure in the cluster have each other as neighbors and they have a least P neighbors in common), monte-carlo (Reorder the RMSD matrix using Monte Carlo such that the order of the frames is using the smallest possible increments), diagonalization (Diagonalize the RMSD matrix), gromos (Count number of neighbors using cut-off and take structure with largest number of neighbors with all its neighbors as cluster and eliminate it from the pool of clusters).
             * **cutoff** (*float*) - (0.1) [0~10|0.1] RMSD cut-off (nm) for two structures to be neighbor.
+            * **engine** (*str*) - ("gmx") Engine used to compute the RMSD matrix and the clusters. Values: gmx (GROMACS cluster), native (tiled pairwise RMSD computed across a process pool and stored as a condensed float32 matrix on disk, GROMACS is only used to decode the trajectory and to extract the cluster structures. Only available for the linkage, jarvis-patrick and gromos methods).
+            * **num_processes** (*int*) - (0) [0~1000|1] Number of processes used by the native engine to compute the RMSD matrix. 0 means as many processes as CPUs.
+            * **tile_size** (*int*) - (1000) [1~100000|100] Number of frames per side of the RMSD matrix tiles computed by each process of the native engine.
+            * **sweep** (*list*) - (None) List of clustering settings, each one a dictionary with the **method** and **cutoff** keys, for example [{"method": "gromos", "cutoff": 0.1}, {"method": "gromos", "cutoff": 0.2}]. The RMSD matrix is computed only once, and for every setting the cluster file and the cluster log are written next to **output_pdb_path** adding the method and the cutoff to its name (ie: clusters_gromos_0.1.pdb, clusters_gromos_0.1.log). **output_pdb_path** is a copy of the cluster file of the first setting. With the gmx engine, if every method is available in the native engine the settings cluster the full precision float32 matrix of the native engine. Otherwise GROMACS cluster writes the matrix discretized in 5000 levels and the following settings read it back, so pairs at less than 1/5000 of the largest RMSD from the cutoff can be assigned differently than by a single GROMACS cluster execution.
+            * **matrix_cache_dir** (*str*) - (None) Folder where the RMSD matrix is cached, keyed by the input files and the **fit_selection** and **dista** properties, so it is reused by the following executions with the same inputs. The matrix is cached in full precision by the native engine, except with the gmx engine and methods not available in the native engine, where the matrix of GROMACS cluster is cached discretized like in **sweep**.
+            * **frame_store_dir** (*str*) - (None) Folder where the native engine stores the decoded coordinates of the **fit_selection** group of the trajectory, keyed by the input files, so the following executions read them instead of running GROMACS trjconv again.
+            * **frame_store_budget** (*float*) - (None) [0~100000|1] Maximum size (GB) of the **frame_store_dir** folder, the least recently used trajectories are removed when it is exceeded. None means no limit.
             * **binary_path** (*str*) - ("gmx") Path to the GROMACS executable binary.
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the group selections to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('gromacs/gromacs:2022.2') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
 
     Examples:
         This is a use example of how to use the building block from Python::
@@ -82,6 +96,13 @@ class GMXCluster(BiobbObject):
         self.method = properties.get('method', "linkage")
         self.dista = properties.get('dista', False)
         self.cutoff = properties.get('cutoff', 0.1)
+        self.engine = properties.get('engine', "gmx")
+        self.num_processes = properties.get('num_processes', 0)
+        self.tile_size = properties.get('tile_size', 1000)
+        self.sweep = properties.get('sweep', [])
+        self.matrix_cache_dir = properties.get('matrix_cache_dir', None)
+        self.frame_store_dir = properties.get('frame_store_dir', None)
+        self.frame_store_budget = properties.get('frame_store_budget', None)
         self.properties = properties
 
         # Properties common in all GROMACS BB
@@ -111,13 +132,195 @@ class GMXCluster(BiobbObject):
         self.dista = get_dista(self.properties, out_log, self.__class__.__name__)
         self.method = get_method(self.properties, out_log, self.__class__.__name__)
         self.cutoff = get_cutoff(self.properties, out_log, self.__class__.__name__)
+        self.engine = get_engine(self.properties, self.method, out_log, self.__class__.__name__)
+        self.num_processes = get_positive_int(self.properties, 'num_processes', out_log, self.__class__.__name__)
+        self.tile_size = get_positive_int(self.properties, 'tile_size', out_log, self.__class__.__name__) or get_default_value('tile_size')
+        self.sweep = get_sweep(self.properties, self.engine, out_log, self.__class__.__name__)
+        output_ext = PurePath(self.io_dict["out"]["output_pdb_path"]).suffix
+        for method, cutoff in self.sweep:
+            self.io_dict["out"]['output_pdb_path_%s_%s' % (method, cutoff)] = self.setting_path(method, cutoff, output_ext)
+
+    def setting_path(self, method, cutoff, ext):
+        """ Returns the path of an output file of a sweep setting """
+        output = PurePath(self.io_dict["out"]["output_pdb_path"])
+        return str(output.with_name('%s_%s_%s%s' % (output.stem, method, cutoff, ext)))
+
+    def get_clusterings(self):
+        """ Returns the (method, cutoff, output_pdb_path, log_path) of every clustering to be done """
+        if not self.sweep:
+            return [(self.method, self.cutoff, self.io_dict["out"]["output_pdb_path"], self.log_path)]
+        return [(method, cutoff, self.io_dict["out"]['output_pdb_path_%s_%s' % (method, cutoff)], self.setting_path(method, cutoff, '.log'))
+                for method, cutoff in self.sweep]
+
+    def cache_entry(self):
+        """ Returns the folder where the RMSD matrix of the inputs is cached, or None if there is no cache """
+        if not self.matrix_cache_dir:
+            return None
+        from biobb_analysis.native.cache import cache_entry, cache_key, file_signature
+        inputs = [file_signature(self.io_dict["in"][key]) for key in ("input_structure_path", "input_traj_path", "input_index_path") if self.io_dict["in"].get(key)]
+        return cache_entry(self.matrix_cache_dir, cache_key(inputs, self.fit_selection, self.dista))
+
+    def frame_store(self):
+        """ Returns the store of decoded frames and the selection key of the fitting group, or (None, None) if there is no store """
+        if not self.frame_store_dir:
+            return None, None
+        from biobb_analysis.native.cache import file_signature
+        from biobb_analysis.native.framestore import FrameStore
+        budget = None if self.frame_store_budget is None else float(self.frame_store_budget) * 1e9
+        selection = {'inputs': [file_signature(self.io_dict["in"][key]) for key in ("input_structure_path", "input_index_path") if self.io_dict["in"].get(key)],
+                     'fit_selection': self.fit_selection}
+        return FrameStore(self.frame_store_dir, budget), selection
+
+    def native_path(self, name):
+        """ Returns the (host, staged) paths of a temporary file """
+        if self.container_path:
+            return str(PurePath(self.stage_io_dict["unique_dir"]).joinpath(name)), str(PurePath(self.container_volume_path).joinpath(name))
+        return str(PurePath(self.native_dir).joinpath(name)), str(PurePath(self.native_dir).joinpath(name))
+
+    def gmx_inputs(self):
+        """ Returns the input arguments shared by all the GROMACS commands """
+        inputs = ['-s', self.stage_io_dict["in"]["input_structure_path"], '-f', self.stage_io_dict["in"]["input_traj_path"]]
+        if self.stage_io_dict["in"].get("input_index_path"):
+            inputs.extend(['-n', self.stage_io_dict["in"]["input_index_path"]])
+        return inputs
+
+    def run_gmx(self, cmd, selections):
+        """ Runs a GROMACS command answering the group prompts with the given selections """
+        if self.stdin_pipe:
+            self.stdin_text = '\n'.join(selections) + '\n'
+            self.cmd = [self.binary_path] + cmd
+        else:
+            stdin_path, stdin_stage = self.native_path('%s.stdin' % cmd[0])
+            with open(stdin_path, 'w') as stdin_file:
+                stdin_file.write('\n'.join(selections) + '\n')
+            self.cmd = [self.binary_path] + cmd + ['<', stdin_stage]
+        self.run_biobb()
+        return self.return_code
+
+    def native_sweep(self, clusterings):
+        """ Returns True if the clusterings can use the full precision RMSD matrix of the native engine """
+        return all(is_valid_native_method(method) for method, _, _, _ in clusterings)
+
+    def launch_sweep(self, clusterings):
+        """ Runs GROMACS cluster for every setting. The raw RMSD matrix is written by the first run discretized
+        in MATRIX_LEVELS levels and read by the following ones, and it is kept in the cache folder if provided """
+        from biobb_analysis.native.cache import store_file
+        cache = self.cache_entry()
+        matrix_name = 'rmsd-raw-%d.xpm' % MATRIX_LEVELS
+        matrix_path, matrix_stage = self.native_path(matrix_name)
+        if cache and Path(cache.joinpath(matrix_name)).exists():
+            fu.log('Using cached RMSD matrix %s' % cache.joinpath(matrix_name), self.out_log)
+            shutil.copy2(cache.joinpath(matrix_name), matrix_path)
+        output_ext = PurePath(self.io_dict["out"]["output_pdb_path"]).suffix
+        for i, (method, cutoff, output_path, log_path) in enumerate(clusterings):
+            output_host, output_stage = self.native_path('clusters_%d%s' % (i, output_ext))
+            log_host, log_stage = self.native_path('cluster_%d.log' % i)
+            matrix = ['-dm', matrix_stage] if Path(matrix_path).exists() else ['-om', matrix_stage]
+            cmd = ['cluster', '-g', log_stage, '-dist', self.native_path('rmsd-dist.xvg')[1], '-o', self.native_path('rmsd-clust.xpm')[1]]
+            cmd += self.gmx_inputs() + ['-cl', output_stage, '-cutoff', str(cutoff), '-method', method, '-nlevels', str(MATRIX_LEVELS)] + matrix
+            if self.dista:
+                cmd.append('-dista')
+            if self.run_gmx(cmd, [self.fit_selection, self.output_selection]):
+                return self.return_code
+            if cache and matrix[0] == '-om':
+                store_file(matrix_path, cache.joinpath(matrix_name))
+            shutil.copy2(output_host, output_path)
+            shutil.copy2(log_host, log_path)
+        return self.return_code
+
+    def native_matrix(self):
+        """ Returns the path and the metadata of the RMSD matrix (Angstroms) computed by the native engine.
+        GROMACS decodes the fitting group of the trajectory unless it is in the frame store, the matrix is only computed if it is not cached """
+        import numpy as np
+        from biobb_analysis.native import rmsd
+        from biobb_analysis.native.cache import read_json, write_json
+        from biobb_analysis.native.framestore import FrameStoreEntry
+        from biobb_analysis.native.trajectory import open_trajectory
+
+        cache = self.cache_entry()
+        matrix_dir = cache or PurePath(self.native_dir)
+        matrix_path, meta_path = str(matrix_dir.joinpath('rmsd.npy')), str(matrix_dir.joinpath('rmsd.json'))
+        meta = read_json(meta_path) if cache else None
+        if meta:
+            fu.log('Using cached RMSD matrix %s' % matrix_path, self.out_log)
+            return matrix_path, meta
+
+        store, selection = self.frame_store()
+        traj_path = self.io_dict["in"]["input_traj_path"]
+        reader = store.lookup(traj_path, selection=selection) if store else None
+        if reader:
+            fu.log('Reading the decoded frames of the %s group from the frame store %s' % (self.fit_selection, reader.path), self.out_log)
+        else:
+            selection_path, selection_stage = self.native_path('selection.trr')
+            if self.run_gmx(['trjconv'] + self.gmx_inputs() + ['-o', selection_stage], [self.fit_selection]):
+                return None, None
+            reader = open_trajectory(selection_path)
+        fu.log('Computing the RMSD matrix of %d frames and %d atoms' % (reader.n_frames, reader.n_atoms), self.out_log)
+        coords_path, _ = self.native_path('coords.npy')
+        coords = np.lib.format.open_memmap(coords_path, mode='w+', dtype=np.float32, shape=(reader.n_frames, reader.n_atoms, 3))
+        if store and not isinstance(reader, FrameStoreEntry):
+            with store.writer(traj_path, reader.n_atoms, selection=selection, times=reader.times, chunk_frames=self.tile_size) as writer:
+                for start, chunk in reader.iter_chunks(self.tile_size):
+                    coords[start:start + len(chunk)] = chunk
+                    writer.add(chunk)
+        else:
+            for start, chunk in reader.iter_chunks(self.tile_size):
+                coords[start:start + len(chunk)] = chunk
+        coords.flush()
+        del coords
+
+        # the matrix is moved to its final path once complete, and the metadata marks the cache entry as valid
+        tmp_matrix_path = '%s.%d.tmp.npy' % (matrix_path, os.getpid())
+        stats = rmsd.rmsd_matrix(coords_path, tmp_matrix_path, self.dista, self.tile_size, self.num_processes)
+        os.replace(tmp_matrix_path, matrix_path)
+        meta = {'n_frames': reader.n_frames, 'n_atoms': reader.n_atoms, 'times': reader.times, 'stats': stats}
+        write_json(meta, meta_path)
+        return matrix_path, meta
+
+    def launch_native(self, clusterings):
+        """ Clusters the trajectory with the native engine for every setting. The RMSD matrix and the clusters
+        are computed natively, GROMACS extracts the middle structures of the clusters """
+        import numpy as np
+        from biobb_analysis.native import cluster
+        from biobb_analysis.native.trajectory import read_pdb_models, write_pdb_models
+
+        matrix_path, meta = self.native_matrix()
+        if not matrix_path:
+            return self.return_code
+        matrix = np.load(matrix_path, mmap_mode='r')
+        n_frames, stats, times = meta['n_frames'], meta['stats'], meta['times']
+        cluster.write_distribution_xvg(matrix, n_frames, stats[1], self.xvg_path, scale=0.1)
+        cluster.write_matrix_xpm(matrix, n_frames, stats[1], self.xpm_path, times, scale=0.1)
+
+        methods = {'linkage': cluster.linkage, 'jarvis-patrick': cluster.jarvis_patrick, 'gromos': cluster.gromos}
+        output_ext = PurePath(self.io_dict["out"]["output_pdb_path"]).suffix
+        for method, cutoff, output_path, log_path in clusterings:
+            labels = cluster.sort_clusters(methods[method](matrix, n_frames, float(cutoff) * 10))
+            middle, average, middle_average = cluster.cluster_statistics(matrix, n_frames, labels)
+            fu.log('Found %d clusters using %s method and %s nm cutoff' % (len(middle), method, cutoff), self.out_log)
+            cluster.write_cluster_log(log_path, method, float(cutoff), stats, labels, middle, average, middle_average, times, scale=0.1)
+
+            # middle structures of the clusters, fitted to the input structure
+            frames_path, frames_stage = self.native_path('frames.ndx')
+            write_frames_index(sorted(middle.tolist()), frames_path)
+            clusters_path, clusters_stage = self.native_path('clusters' + output_ext)
+            if self.run_gmx(['trjconv'] + self.gmx_inputs() + ['-fr', frames_stage, '-fit', 'rot+trans', '-o', clusters_stage], [self.fit_selection, self.output_selection]):
+                return self.return_code
+            if output_ext == '.pdb':
+                # trjconv writes the frames in trajectory order, GROMACS cluster writes them in cluster order
+                models = read_pdb_models(clusters_path)
+                order = np.argsort(np.argsort(middle))
+                write_pdb_models([models[i] for i in order], output_path, title='Clusters')
+            else:
+                shutil.copy2(clusters_path, output_path)
+        return self.return_code
 
     @launchlogger
     def launch(self) -> int:
         """Execute the :class:`GMXCluster <gromacs.gmx_cluster.GMXCluster>` gromacs.gmx_cluster.GMXCluster object."""
 
         # standard input
-        self.io_dict['in']['stdin_file_path'] = fu.create_stdin_file(f'{self.fit_selection} {self.output_selection}')
+        set_stdin(self, f'{self.fit_selection} {self.output_selection}')
 
         # check input/output paths and parameters
         self.check_data_params(self.out_log, self.err_log)
@@ -126,6 +329,21 @@ class GMXCluster(BiobbObject):
         if self.check_restart(): return 0
         self.stage_files()
 
+        if self.engine == 'native' or self.sweep or self.matrix_cache_dir:
+            self.native_dir = self.stage_io_dict.get("unique_dir") or fu.create_unique_dir()
+            clusterings = self.get_clusterings()
+            if self.engine == 'native' or self.native_sweep(clusterings):
+                self.launch_native(clusterings)
+            else:
+                self.launch_sweep(clusterings)
+            # the output of the first setting is the main output of the sweep
+            if self.sweep and not self.return_code:
+                shutil.copy2(clusterings[0][2], self.io_dict["out"]["output_pdb_path"])
+            self.tmp_files.extend([self.native_dir, self.io_dict['in'].get("stdin_file_path"), 'rmsd-clust.xpm', 'rmsd-dist.xvg', 'cluster.log'])
+            self.remove_tmp_files()
+            self.check_arguments(output_files_created=True, raise_exception=False)
+            return self.return_code
+
         # if container execution, add container_volume_path to log, xvg & xpm (because docker doesn't allow to write teses files out of the /tmp folder)
         if self.container_path:
             self.log_path = str(PurePath(self.container_volume_path).joinpath(self.log_path))
@@ -149,8 +367,7 @@ class GMXCluster(BiobbObject):
             self.cmd.append('-dista')
 
         # Add stdin input file
-        self.cmd.append('<')
-        self.cmd.append(self.stage_io_dict["in"]["stdin_file_path"])
+        add_stdin(self, self.cmd)
 
         # Run Biobb block
         self.run_biobb()
@@ -195,6 +412,7 @@ def main():
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     #Specific call of each building block
@@ -2,14 +2,15 @@
 
 """Module containing the GMX Energy class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import  settings
+import uuid
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.gromacs.common import *
+from biobb_analysis.runtime.incremental import get_incremental
 
 
-class GMXEnergy(BiobbObject):
+class GMXEnergy(StagingBiobbObject):
     """
     | biobb_analysis GMXEnergy
     | Wrapper of the GROMACS energy module for extracting energy components from a given GROMACS energy file.
@@ -21,15 +22,20 @@ class GMXEnergy(BiobbObject):
         properties (dic - Python dictionary object containing the tool parameters, not input/output files):
             * **xvg** (*str*) - ("none") XVG plot formatting. Values: xmgrace, xmgr, none.
             * **terms** (*list*) - (["Potential"]) Energy terms. Values: Angle, Proper-Dih., Improper-Dih., LJ-14, Coulomb-14, LJ-\(SR\), Coulomb-\(SR\), Coul.-recip., Position-Rest., Potential, Kinetic-En., Total-Energy, Temperature, Pressure,  Constr.-rmsd, Box-X, Box-Y,  Box-Z, Volume, Density, pV, Enthalpy, Vir-XX, Vir-XY, Vir-XZ, Vir-YX, Vir-YY, Vir-YZ, Vir-ZX, Vir-ZY, Vir-ZZ, Pres-XX, Pres-XY, Pres-XZ, Pres-YX, Pres-YY,  Pres-YZ, Pres-ZX, Pres-ZY, Pres-ZZ, #Surf*SurfTen, Box-Vel-XX, Box-Vel-YY, Box-Vel-ZZ, Mu-X, Mu-Y, Mu-Z, T-Protein, T-non-Protein, Lamb-Protein, Lamb-non-Protein.
+            * **incremental** (*bool*) - (False) Incremental mode for growing energy files. The state of the execution is saved next to **output_xvg_path** (with .state.json extension), the following executions only read the energy frames written since then and append their rows to **output_xvg_path**. The running averages of the terms are kept in the state and logged.
             * **binary_path** (*str*) - ("gmx") Path to the GROMACS executable binary.
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the energy terms to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('gromacs/gromacs:2022.2') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
     
     Examples:
         This is a use example of how to use the building block from Python::
@@ -71,6 +77,7 @@ class GMXEnergy(BiobbObject):
         # Properties specific for BB
         self.xvg = properties.get('xvg', "none")
         self.terms = properties.get('terms', ["Potential"])
+        self.incremental = properties.get('incremental', False)
         self.instructions_file = get_default_value('instructions_file')
         self.properties = properties
 
@@ -87,6 +94,27 @@ class GMXEnergy(BiobbObject):
         self.io_dict["out"]["output_xvg_path"] = check_out_xvg_path(self.io_dict["out"]["output_xvg_path"], out_log, self.__class__.__name__)
         self.xvg = get_xvg(self.properties, out_log, self.__class__.__name__)
         self.terms = get_terms(self.properties, out_log, self.__class__.__name__)
+        self.incremental = get_incremental(self.properties, out_log, self.__class__.__name__)
+        self.incremental_parameters = {'terms': self.terms, 'xvg': self.xvg}
+        self.state = None
+
+    def update_incremental_output(self, new_output_path, out_log):
+        """ Appends the rows of the new energy frames to the output (if there is a previous state) and saves the state """
+        from biobb_analysis.runtime.incremental import read_rows, append_rows, update_accumulators, averages, save_state
+        header, rows = read_rows(new_output_path)
+        output_path = self.io_dict["out"]["output_xvg_path"]
+        if self.state:
+            # -b includes the frame at the given time, which is already in the output
+            rows = [row for row in rows if float(row.split()[0]) > self.state['last_time']]
+            append_rows(output_path, rows)
+            fu.log('Appended %d energy frames to %s' % (len(rows), output_path), out_log)
+            n_rows, accumulators = self.state['rows'] + len(rows), update_accumulators(self.state['accumulators'], rows)
+        else:
+            n_rows, accumulators = len(rows), update_accumulators(None, rows)
+        last_time = float(rows[-1].split()[0]) if rows else (self.state['last_time'] if self.state else None)
+        save_state(output_path, self.incremental_parameters, self.io_dict["in"]["input_energy_path"], n_rows, accumulators, last_time=last_time)
+        for term, (average, std) in zip(self.terms, averages(accumulators)):
+            fu.log('%s average: %.4f, standard deviation: %.4f (%d frames)' % (term, average, std, n_rows), out_log)
 
     def create_instructions_file(self):
         """Creates an input file using the properties file settings"""
@@ -94,6 +122,9 @@ class GMXEnergy(BiobbObject):
         # different path if container execution or not
         if self.container_path:
             self.instructions_file = str(PurePath(self.container_volume_path).joinpath(self.instructions_file))
+        elif self.stdin_pipe and not self.incremental:
+            # the folder is only needed by the new energy frames of the incremental mode
+            self.instructions_file = str(PurePath(Path.cwd()).joinpath(str(uuid.uuid4()), self.instructions_file))
         else:
             self.instructions_file = str(PurePath(fu.create_unique_dir()).joinpath(self.instructions_file))
         #self.instructions_file = str(PurePath(fu.create_unique_dir()).joinpath(self.instructions_file))
@@ -102,7 +133,10 @@ class GMXEnergy(BiobbObject):
         for t in self.terms:
             instructions_list.append(t)
 
-        # create instructions file
+        # create instructions file, or keep the terms to send them through a pipe
+        if self.stdin_pipe:
+            self.stdin_text = ''.join(line.strip() + '\n' for line in instructions_list)
+            return self.instructions_file
         with open(self.instructions_file, 'w') as mdp:
             for line in instructions_list:
                 mdp.write(line.strip() + '\n')
@@ -124,14 +158,29 @@ class GMXEnergy(BiobbObject):
         self.create_instructions_file()
 
         # if container execution, copy intructions file to container
-        if self.container_path:
+        if self.container_path and not self.stdin_pipe:
             copy_instructions_file_to_container(self.instructions_file, self.stage_io_dict.get("unique_dir"))
 
+        # incremental mode, only the energy frames written since the previous execution are read
+        output_xvg_path = self.stage_io_dict["out"]["output_xvg_path"]
+        if self.incremental:
+            from biobb_analysis.runtime.incremental import load_state, partial_output_name
+            self.state = load_state(self.io_dict["out"]["output_xvg_path"], self.incremental_parameters, self.io_dict["in"]["input_energy_path"])
+            if self.state and self.state.get('last_time') is not None:
+                output_xvg_path = str(PurePath(self.instructions_file).parent.joinpath(partial_output_name(output_xvg_path)))
+            else:
+                self.state = None
+
         self.cmd = [self.binary_path, 'energy',
                '-f', self.stage_io_dict["in"]["input_energy_path"],
-               '-o', self.stage_io_dict["out"]["output_xvg_path"],
-               '-xvg', self.xvg,
-               '<', self.instructions_file]
+               '-o', output_xvg_path,
+               '-xvg', self.xvg]
+
+        if self.state:
+            self.cmd.extend(['-b', str(self.state['last_time'])])
+
+        if not self.stdin_pipe:
+            self.cmd.extend(['<', self.instructions_file])
 
         # Run Biobb block
         self.run_biobb()
@@ -139,6 +188,13 @@ class GMXEnergy(BiobbObject):
         # Copy files to host
         self.copy_to_host()
 
+        if self.incremental and not self.return_code:
+            new_output_path = self.io_dict["out"]["output_xvg_path"]
+            if self.state:
+                from biobb_analysis.runtime.incremental import partial_output_name
+                new_output_path = str(PurePath(self.stage_io_dict.get("unique_dir") or PurePath(self.instructions_file).parent).joinpath(partial_output_name(new_output_path)))
+            self.update_incremental_output(new_output_path, self.out_log)
+
         self.tmp_files.extend([
             self.stage_io_dict.get("unique_dir"),
             str(PurePath(self.instructions_file).parent)
@@ -169,6 +225,7 @@ def main():
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     #Specific call of each building block
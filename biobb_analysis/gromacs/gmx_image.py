@@ -2,13 +2,12 @@
 
 """Module containing the GMX TrjConvStr class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import  settings
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.gromacs.common import *
 
 
-class GMXImage(BiobbObject):
+class GMXImage(StagingBiobbObject):
     """
     | biobb_analysis GMXImage
     | Wrapper of the GROMACS trjconv module for correcting periodicity (image) from a given GROMACS compatible trajectory file.
@@ -28,15 +27,20 @@ class GMXImage(BiobbObject):
             * **center** (*bool*) - (True) Center atoms in box.
             * **ur** (*str*) - ("compact") Unit-cell representation. Values: rect (It's the ordinary brick shape), tric (It's the triclinic unit cell), compact (Puts all atoms at the closest distance from the center of the box).
             * **fit** (*str*) - ("none") Fit molecule to ref structure in the structure file. Values: none, rot+trans, rotxy+transxy, translation, transxy, progressive.
+            * **chunk_size** (*int*) - (0) [0~100000|1] Number of frames of every checkpointed chunk, 0 disables the checkpoints. The frames are processed in chunks committed to a folder next to **output_traj_path** (with .ckpt extension) and concatenated into **output_traj_path** with trjcat at the end, so a killed execution resumes from the last committed chunk. Only available for xtc and trr input trajectories, and not with the *nojump* PBC treatment nor the *progressive* fit, which depend on the previous frames.
             * **binary_path** (*str*) - ("gmx") Path to the GROMACS executable binary.
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the group selections to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('gromacs/gromacs:2022.2') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
 
     Examples:
         This is a use example of how to use the building block from Python::
@@ -88,6 +92,7 @@ class GMXImage(BiobbObject):
         self.center = properties.get('dista', True)
         self.ur = properties.get('ur', "compact")
         self.fit = properties.get('fit', "none")
+        self.chunk_size = properties.get('chunk_size', 0)
         self.properties = properties
 
         # Properties common in all GROMACS BB
@@ -117,6 +122,93 @@ class GMXImage(BiobbObject):
         self.center = get_center(self.properties, out_log, self.__class__.__name__)
         self.ur = get_ur(self.properties, out_log, self.__class__.__name__)
         self.fit = get_fit(self.properties, out_log, self.__class__.__name__)
+        self.chunk_size = get_positive_int(self.properties, 'chunk_size', out_log, self.__class__.__name__)
+
+    def trjconv_cmd(self, output_traj_path, begin=None, end=None):
+        """ Returns the trjconv command writing the given frames to output_traj_path """
+        cmd = [self.binary_path, 'trjconv',
+               '-f', self.stage_io_dict["in"]["input_traj_path"],
+               '-s', self.stage_io_dict["in"]["input_top_path"],
+               '-fit', self.fit,
+               '-o', output_traj_path]
+
+        if self.stage_io_dict["in"].get("input_index_path"):
+            cmd.extend(['-n', self.stage_io_dict["in"]["input_index_path"]])
+
+        if begin is not None:
+            cmd.extend(['-b', '%.6f' % begin])
+        if end is not None:
+            cmd.extend(['-e', '%.6f' % end])
+
+        cmd.append('-center' if self.center else '-nocenter')
+
+        # Unit-cell representation, PBC treatment is incompatible with fitting
+        if self.fit == 'none':
+            cmd.append('-pbc')
+            cmd.append(self.pbc)
+            cmd.append('-ur')
+            cmd.append(self.ur)
+
+        # Add stdin input file
+        add_stdin(self, cmd)
+
+        return cmd
+
+    def get_chunks(self):
+        """ Returns the chunks of the checkpointed execution or None if the execution can not be checkpointed """
+        if self.fit == 'progressive' or (self.fit == 'none' and self.pbc == 'nojump'):
+            fu.log('The %s treatment depends on the previous frames, processing the whole trajectory without checkpoints' % ('progressive fit' if self.fit == 'progressive' else 'nojump PBC'), self.out_log)
+            return None
+        if not is_valid_trjcat_output(PurePath(self.io_dict["out"]["output_traj_path"]).suffix[1:]):
+            fu.log('The output format can not be concatenated, processing the whole trajectory without checkpoints', self.out_log)
+            return None
+        return get_time_chunks(self.io_dict["in"]["input_traj_path"], self.chunk_size, self.out_log)
+
+    def chunk_path(self, name):
+        """ Returns the (host, staged) paths of a temporary file of the checkpointed execution """
+        if self.container_path:
+            return str(PurePath(self.chunk_dir).joinpath(name)), str(PurePath(self.container_volume_path).joinpath(name))
+        return str(PurePath(self.chunk_dir).joinpath(name)), str(PurePath(self.chunk_dir).joinpath(name))
+
+    def launch_chunks(self, chunks):
+        """ Processes the frames chunk by chunk, skipping the chunks committed by a previous execution,
+        and concatenates all of them into the output at the end """
+        from biobb_analysis.runtime.checkpoint import load_manifest, committed_chunk, commit_chunk, checkpoint_dir, link_file
+        output_path = self.io_dict["out"]["output_traj_path"]
+        params = dict(selections=self.selections.split(), pbc=self.pbc, center=self.center,
+                      ur=self.ur, fit=self.fit, chunk_size=self.chunk_size, output=PurePath(output_path).suffix)
+        manifest = load_manifest(output_path, params, self.io_dict["in"]["input_traj_path"])
+        chunk_paths = []
+        for index, (first, last, begin, end) in enumerate(chunks):
+            chunk_path = committed_chunk(output_path, manifest, index)
+            if chunk_path:
+                fu.log('Chunk %d (frames %d to %d) already committed' % (index + 1, first, last), self.out_log)
+            else:
+                host_path, stage_path = self.chunk_path('chunk' + PurePath(output_path).suffix)
+                self.cmd = self.trjconv_cmd(stage_path, begin, end)
+                self.run_biobb()
+                if self.return_code or not Path(host_path).exists():
+                    fu.log('Chunk %d (frames %d to %d) failed, the committed chunks are kept in %s' % (index + 1, first, last, checkpoint_dir(output_path)), self.out_log)
+                    return self.return_code or 1
+                chunk_path = commit_chunk(output_path, manifest, index, host_path, first, last)
+                fu.log('Chunk %d (frames %d to %d) committed to %s' % (index + 1, first, last, chunk_path), self.out_log)
+            chunk_paths.append(chunk_path)
+
+        # merge, -cat keeps all the frames even if the times of consecutive chunks overlap
+        self.stdin_text = None
+        self.cmd = [self.binary_path, 'trjcat', '-f']
+        for chunk_path in chunk_paths:
+            if self.container_path:
+                host_path, stage_path = self.chunk_path(PurePath(chunk_path).name)
+                link_file(chunk_path, host_path)
+                chunk_path = stage_path
+            self.cmd.append(chunk_path)
+        self.cmd.extend(['-o', self.stage_io_dict["out"]["output_traj_path"], '-cat'])
+        self.run_biobb()
+        self.copy_to_host()
+        if not self.return_code:
+            self.tmp_files.append(str(checkpoint_dir(output_path)))
+        return self.return_code
 
     @launchlogger
     def launch(self) -> int:
@@ -137,7 +229,8 @@ class GMXImage(BiobbObject):
                 selections = self.fit_selection + ' ' + self.output_selection 
 
         # standard input
-        self.io_dict['in']['stdin_file_path'] = fu.create_stdin_file(f'{selections}')
+        self.selections = selections
+        set_stdin(self, f'{selections}')
 
         # check input/output paths and parameters
         self.check_data_params(self.out_log, self.err_log)
@@ -146,33 +239,21 @@ class GMXImage(BiobbObject):
         if self.check_restart(): return 0
         self.stage_files()
 
-        self.cmd = [self.binary_path, 'trjconv',
-               '-f', self.stage_io_dict["in"]["input_traj_path"],
-               '-s', self.stage_io_dict["in"]["input_top_path"],
-               '-fit', self.fit,
-               '-o', self.stage_io_dict["out"]["output_traj_path"]]
-
-        if self.stage_io_dict["in"].get("input_index_path"):
-            self.cmd.extend(['-n', self.stage_io_dict["in"]["input_index_path"]])
-            
-        self.cmd.append('-center' if self.center else '-nocenter')
-
-        # Unit-cell representation, PBC treatment is incompatible with fitting
-        if self.fit == 'none':
-            self.cmd.append('-pbc')
-            self.cmd.append(self.pbc)
-            self.cmd.append('-ur')
-            self.cmd.append(self.ur)
+        # checkpointed execution, the frames are processed in chunks that are kept if the execution is killed
+        chunks = self.get_chunks() if self.chunk_size else None
 
-        # Add stdin input file
-        self.cmd.append('<')
-        self.cmd.append(self.stage_io_dict["in"]["stdin_file_path"])
+        if chunks:
+            self.chunk_dir = self.stage_io_dict.get("unique_dir") or fu.create_unique_dir()
+            self.launch_chunks(chunks)
+            self.tmp_files.append(self.chunk_dir)
+        else:
+            self.cmd = self.trjconv_cmd(self.stage_io_dict["out"]["output_traj_path"])
 
-        # Run Biobb block
-        self.run_biobb()
+            # Run Biobb block
+            self.run_biobb()
 
-        # Copy files to host
-        self.copy_to_host()
+            # Copy files to host
+            self.copy_to_host()
 
         self.tmp_files.extend([
             self.stage_io_dict.get("unique_dir"),
@@ -208,6 +289,7 @@ def main():
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     #Specific call of each building block
@@ -2,13 +2,12 @@
 
 """Module containing the GMX Rgyr class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import  settings
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.gromacs.common import *
 
 
-class GMXRgyr(BiobbObject):
+class GMXRgyr(StagingBiobbObject):
     """
     | biobb_analysis GMXRgyr
     | Wrapper of the GROMACS gyrate module for computing the radius of gyration (Rgyr) of a molecule about the x-, y- and z-axes, as a function of time, from a given GROMACS compatible trajectory.
@@ -25,12 +24,16 @@ class GMXRgyr(BiobbObject):
             * **binary_path** (*str*) - ("gmx") Path to the GROMACS executable binary.
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the group selections to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('gromacs/gromacs:2022.2') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
 
     Examples:
         This is a use example of how to use the building block from Python::
@@ -100,7 +103,7 @@ class GMXRgyr(BiobbObject):
         """Execute the :class:`GMXRgyr <gromacs.gmx_rgyr.GMXRgyr>` gromacs.gmx_rgyr.GMXRgyr object."""
 
         # standard input
-        self.io_dict['in']['stdin_file_path'] = fu.create_stdin_file(f'{self.selection}')
+        set_stdin(self, f'{self.selection}')
 
         # check input/output paths and parameters
         self.check_data_params(self.out_log, self.err_log)
@@ -119,8 +122,7 @@ class GMXRgyr(BiobbObject):
             self.cmd.extend(['-n', self.stage_io_dict["in"]["input_index_path"]])
 
         # Add stdin input file
-        self.cmd.append('<')
-        self.cmd.append(self.stage_io_dict["in"]["stdin_file_path"])
+        add_stdin(self, self.cmd)
 
         # Run Biobb block
         self.run_biobb()
@@ -162,6 +164,7 @@ def main():
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     #Specific call of each building block
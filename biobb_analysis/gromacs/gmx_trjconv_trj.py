@@ -2,17 +2,17 @@
 
 """Module containing the GMX TrjConvStr class and the command line interface."""
 import argparse
-from biobb_common.generic.biobb_object import BiobbObject
-from biobb_common.configuration import  settings
+from biobb_analysis.runtime.staging import StagingBiobbObject
 from biobb_common.tools.file_utils import launchlogger
 from biobb_analysis.gromacs.common import *
 
 
-class GMXTrjConvTrj(BiobbObject):
+class GMXTrjConvTrj(StagingBiobbObject):
     """
     | biobb_analysis GMXTrjConvTrj
     | Wrapper of the GROMACS trjconv module for converting between GROMACS compatible trajectory file formats and/or extracts a selection of atoms.
     | GROMACS trjconv module can convert trajectory files in many ways. See the `GROMACS trjconv <http://manual.gromacs.org/documentation/2018/onlinehelp/gmx-trjconv.html>`_ official documentation for further information.
+    | XTC input trajectories written in xtc format without atom selection are sliced copying their compressed frames, without decompressing them.
 
     Args:
         input_traj_path (str): Path to the GROMACS trajectory file. File type: input. `Sample file <https://github.com/bioexcel/biobb_analysis/raw/master/biobb_analysis/test/data/gromacs/trajectory.trr>`_. Accepted formats: xtc (edam:format_3875), trr (edam:format_3910), cpt (edam:format_2333), gro (edam:format_2033), g96 (edam:format_2033), pdb (edam:format_1476), tng (edam:format_3876).
@@ -27,12 +27,16 @@ class GMXTrjConvTrj(BiobbObject):
             * **binary_path** (*str*) - ("gmx") Path to the GROMACS executable binary.
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the group selections to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
             * **container_path** (*str*) - (None) Container path definition.
             * **container_image** (*str*) - ('gromacs/gromacs:2022.2') Container image definition.
             * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
             * **container_working_dir** (*str*) - (None) Container working directory definition.
             * **container_user_id** (*str*) - (None) Container user_id definition.
             * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
     
     Examples:
         This is a use example of how to use the building block from Python::
@@ -117,7 +121,7 @@ class GMXTrjConvTrj(BiobbObject):
         """Execute the :class:`GMXTrjConvTrj <gromacs.gmx_trjconv_trj.GMXTrjConvTrj>` gromacs.gmx_trjconv_trj.GMXTrjConvTrj object."""
         
         # standard input
-        self.io_dict['in']['stdin_file_path'] = fu.create_stdin_file(f'{self.selection}')
+        set_stdin(self, f'{self.selection}')
 
         # check input/output paths and parameters
         self.check_data_params(self.out_log, self.err_log)
@@ -129,6 +133,15 @@ class GMXTrjConvTrj(BiobbObject):
 
         # Setup Biobb
         if self.check_restart(): return 0
+
+        # XTC to XTC without atom selection, the compressed frames are copied without decompressing them
+        if is_raw_xtc_slice(self.io_dict["in"]["input_traj_path"], self.io_dict["out"]["output_traj_path"], self.io_dict["in"]["input_index_path"], self.selection):
+            if slice_raw_xtc(self.io_dict["in"]["input_traj_path"], self.io_dict["out"]["output_traj_path"], self.start, self.end, self.dt, self.out_log):
+                self.tmp_files.append(self.io_dict['in'].get("stdin_file_path"))
+                self.remove_tmp_files()
+                self.check_arguments(output_files_created=True, raise_exception=False)
+                return 0
+
         self.stage_files()
 
         self.cmd = [self.binary_path, 'trjconv',
@@ -145,8 +158,7 @@ class GMXTrjConvTrj(BiobbObject):
             self.cmd.extend(['-s', self.stage_io_dict["in"]["input_top_path"]])
 
         # Add stdin input file
-        self.cmd.append('<')
-        self.cmd.append(self.stage_io_dict["in"]["stdin_file_path"])
+        add_stdin(self, self.cmd)
 
         # Run Biobb block
         self.run_biobb()
@@ -188,6 +200,7 @@ def main():
 
     args = parser.parse_args()
     args.config = args.config or "{}"
+    from biobb_common.configuration import settings
     properties = settings.ConfReader(config=args.config).get_prop_dic()
 
     #Specific call of each building block
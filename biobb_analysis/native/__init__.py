@@ -0,0 +1,2 @@
+name = "native"
+__all__ = ["trajectory", "rmsd", "cluster", "cache", "slicing", "metadata", "analysis", "framebus", "framestore", "selection"]
\ No newline at end of file
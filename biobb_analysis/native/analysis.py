@@ -0,0 +1,102 @@
+""" Native per-frame analyses for package biobb_analysis.native
+
+Every analysis consumes the coordinates chunk by chunk (consume(first_frame, coords)), so the same chunks can be
+fed to several analyses reading the trajectory only once (see biobb_analysis.native.framebus). The coordinates
+given to consume() are only valid until it returns. """
+import numpy as np
+from biobb_analysis.native.rmsd import center, pairwise_rmsd, superpose
+
+
+class RgyrAnalysis:
+    """ Radius of gyration (not mass-weighted) of every frame """
+
+    def __init__(self, atoms=None):
+        self.atoms = atoms
+        self.values = []
+
+    def consume(self, first_frame, coords):
+        coords = center(coords if self.atoms is None else coords[:, self.atoms])
+        self.values.append(np.sqrt(np.einsum('fai,fai->f', coords, coords) / coords.shape[1]))
+
+    def result(self):
+        return np.concatenate(self.values) if self.values else np.empty(0)
+
+
+class RmsdAnalysis:
+    """ Best-fit RMSD of every frame to a reference structure, the first frame by default """
+
+    def __init__(self, reference=None, atoms=None):
+        self.atoms = atoms
+        self.reference = None if reference is None else center(np.asarray(reference)[None])
+        self.values = []
+
+    def consume(self, first_frame, coords):
+        coords = coords if self.atoms is None else coords[:, self.atoms]
+        if self.reference is None:
+            self.reference = center(coords[:1])
+        self.values.append(pairwise_rmsd(self.reference, center(coords))[0])
+
+    def result(self):
+        return np.concatenate(self.values) if self.values else np.empty(0)
+
+
+class RmsfAnalysis:
+    """ Fluctuation of every atom around its average position, after fitting every frame to a reference structure,
+    the first frame by default. The sums of the fitted coordinates and of their squares are accumulated, so the
+    trajectory is read once """
+
+    def __init__(self, reference=None, atoms=None):
+        self.atoms = atoms
+        self.reference = None if reference is None else center(np.asarray(reference)[None])[0]
+        self.n_frames = 0
+        self.sum = self.sum_squares = None
+
+    def consume(self, first_frame, coords):
+        coords = coords if self.atoms is None else coords[:, self.atoms]
+        if self.reference is None:
+            self.reference = center(coords[:1])[0]
+        if self.sum is None:
+            self.sum = np.zeros_like(self.reference)
+            self.sum_squares = np.zeros_like(self.reference)
+        fitted = superpose(coords, self.reference)
+        self.n_frames += len(fitted)
+        self.sum += fitted.sum(axis=0)
+        self.sum_squares += np.einsum('fai,fai->ai', fitted, fitted)
+
+    def result(self):
+        if not self.n_frames:
+            return np.empty(0)
+        mean = self.sum / self.n_frames
+        variance = self.sum_squares.sum(axis=1) / self.n_frames - np.einsum('ai,ai->a', mean, mean)
+        return np.sqrt(np.maximum(variance, 0))
+
+
+def average_structure(coords, chunk_frames=1000):
+    """ Returns the average of the frames fitted to the first one """
+    reference = center(coords[:1])[0]
+    total = np.zeros_like(reference, dtype=np.float64)
+    for first in range(0, len(coords), chunk_frames):
+        total += superpose(coords[first:first + chunk_frames], reference).sum(axis=0)
+    return (total / max(len(coords), 1)).astype(np.float32)
+
+
+def run_average_reference(reader, analyses, atoms=None, chunk_frames=1000, scratch_dir=None, memory_budget=None):
+    """ Runs the analyses (classes taking a reference, ie: RmsdAnalysis or RmsfAnalysis) against the average structure
+    decoding the trajectory only once: the frames are cached in memory or in a scratch file (see
+    biobb_analysis.native.framestore.cache_frames), then the average is computed and the analyses read the cached frames.
+    Returns the results of the analyses in the same order """
+    from biobb_analysis.native.framestore import cache_frames
+    coords = cache_frames(reader, atoms, scratch_dir, memory_budget, chunk_frames)
+    reference = average_structure(coords, chunk_frames)
+    analyses = [analysis(reference=reference) for analysis in analyses]
+    for first in range(0, len(coords), chunk_frames):
+        for analysis in analyses:
+            analysis.consume(first, coords[first:first + chunk_frames])
+    return [analysis.result() for analysis in analyses]
+
+
+ANALYSES = {
+    'rgyr': RgyrAnalysis,
+    'rmsd': RmsdAnalysis,
+    'rmsf': RmsfAnalysis
+}
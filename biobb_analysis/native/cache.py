@@ -0,0 +1,65 @@
+""" Cache of intermediate results for package biobb_analysis.native """
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+
+
+def file_signature(path):
+    """ Returns the signature (absolute path, size and modification time) of a file """
+    stat = os.stat(path)
+    return [str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns]
+
+
+def cache_key(*items):
+    """ Returns a hash of the given items (files must be given by their signature) """
+    return hashlib.sha1(json.dumps(items, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_entry(cache_dir, key):
+    """ Returns the folder of the cache entry, creating it if needed """
+    path = Path(cache_dir).joinpath(key)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def available_memory():
+    """ Returns the memory available for new processes in bytes, or None if it is unknown """
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def read_json(path):
+    """ Returns the content of a json file or None if it does not exist or it is incomplete """
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(data, path):
+    """ Atomically writes data to a json file """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as json_file:
+        json.dump(data, json_file, indent=2)
+    os.replace(tmp_path, path)
+    return str(path)
+
+
+def store_file(src, dest):
+    """ Atomically copies src to dest """
+    tmp_path = '%s.%d.tmp' % (dest, os.getpid())
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dest)
+    return str(dest)
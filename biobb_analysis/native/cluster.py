@@ -0,0 +1,171 @@
+""" Native clustering of condensed RMSD matrices for package biobb_analysis.native """
+import numpy as np
+from biobb_analysis.native.rmsd import iter_condensed_rows
+
+
+def neighbor_pairs(matrix, n_frames, cutoff):
+    """ Returns the (i, j) pairs, i < j, closer than cutoff reading the condensed matrix sequentially """
+    first, second = [], []
+    for i, row in iter_condensed_rows(matrix, n_frames):
+        js = np.flatnonzero(row < cutoff)
+        if len(js):
+            first.append(np.full(len(js), i, dtype=np.int64))
+            second.append(js + i + 1)
+    if not first:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def connected_components(n_frames, first, second):
+    """ Returns the component label of every frame given the edges (first, second) """
+    labels = np.arange(n_frames)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, first, labels[second])
+        np.minimum.at(labels, second, labels[first])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def linkage(matrix, n_frames, cutoff):
+    """ Single linkage: a structure joins a cluster when its distance to any element of the cluster is less than cutoff """
+    return connected_components(n_frames, *neighbor_pairs(matrix, n_frames, cutoff))
+
+
+def gromos(matrix, n_frames, cutoff):
+    """ GROMOS: takes the structure with the largest number of neighbors with all its neighbors as cluster
+    and eliminates it from the pool of structures, until the pool is empty """
+    first, second = neighbor_pairs(matrix, n_frames, cutoff)
+    source = np.concatenate([first, second])
+    target = np.concatenate([second, first])
+    order = np.argsort(source, kind='stable')
+    target = target[order]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=n_frames))])
+    counts = np.diff(indptr).astype(np.int64)
+    labels = np.full(n_frames, -1, dtype=np.int64)
+    cluster = 0
+    while (labels < 0).any():
+        center = int(np.argmax(np.where(labels < 0, counts, -1)))
+        neighbors = target[indptr[center]:indptr[center + 1]]
+        members = np.concatenate([[center], neighbors[labels[neighbors] < 0]])
+        labels[members] = cluster
+        # the remaining structures lose the neighbors that have just been clustered
+        removed = np.concatenate([target[indptr[m]:indptr[m + 1]] for m in members])
+        np.subtract.at(counts, removed, 1)
+        cluster += 1
+    return labels
+
+
+def jarvis_patrick(matrix, n_frames, cutoff, n_neighbors=10, n_common=3):
+    """ Jarvis-Patrick: a structure joins a cluster when it and a structure in the cluster have each other as neighbors
+    and they have at least n_common neighbors in common. Neighbors are the n_neighbors closest structures within cutoff """
+    best = np.full((n_frames, n_neighbors), np.inf, dtype=np.float32)
+    best_idx = np.full((n_frames, n_neighbors), -1, dtype=np.int64)
+    for i, row in iter_condensed_rows(matrix, n_frames):
+        row = np.asarray(row)
+        js = np.arange(i + 1, n_frames)
+        # neighbors of i among the following structures
+        keep = row < cutoff
+        if keep.any():
+            values = np.concatenate([best[i], row[keep]])
+            indices = np.concatenate([best_idx[i], js[keep]])
+            order = np.argsort(values, kind='stable')[:n_neighbors]
+            best[i], best_idx[i] = values[order], indices[order]
+        # i as neighbor of the following structures
+        worst = best[js].argmax(axis=1)
+        update = keep & (row < best[js, worst])
+        if update.any():
+            best[js[update], worst[update]] = row[update]
+            best_idx[js[update], worst[update]] = i
+    neighbors = [set(idx[idx >= 0].tolist()) for idx in best_idx]
+    first, second = [], []
+    for i in range(n_frames):
+        for j in neighbors[i]:
+            if j > i and i in neighbors[j] and len(neighbors[i] & neighbors[j]) >= n_common:
+                first.append(i)
+                second.append(j)
+    return connected_components(n_frames, np.array(first, dtype=np.int64), np.array(second, dtype=np.int64))
+
+
+def sort_clusters(labels):
+    """ Renumbers the clusters from 0 by decreasing size (ties by first member) """
+    unique, first, counts = np.unique(labels, return_index=True, return_counts=True)
+    order = np.lexsort((first, -counts))
+    renumber = np.empty(len(unique), dtype=np.int64)
+    renumber[order] = np.arange(len(unique))
+    return renumber[np.searchsorted(unique, labels)]
+
+
+def cluster_statistics(matrix, n_frames, labels):
+    """ Returns the middle structure (smallest average distance to the rest of the cluster), the average
+    distance within each cluster and the average distance of the middle structure to the rest of the cluster """
+    n_clusters = int(labels.max()) + 1 if n_frames else 0
+    sums = np.zeros(n_frames, dtype=np.float64)
+    within = np.zeros(n_clusters, dtype=np.float64)
+    for i, row in iter_condensed_rows(matrix, n_frames):
+        same = np.flatnonzero(labels[i + 1:] == labels[i])
+        if len(same):
+            values = np.asarray(row)[same]
+            sums[i] += values.sum()
+            sums[same + i + 1] += values
+            within[labels[i]] += values.sum()
+    sizes = np.bincount(labels, minlength=n_clusters)
+    middle = np.array([np.flatnonzero(labels == c)[np.argmin(sums[labels == c])] for c in range(n_clusters)], dtype=np.int64)
+    pairs = sizes * (sizes - 1) / 2
+    average = np.divide(within, pairs, out=np.zeros(n_clusters), where=pairs > 0)
+    middle_average = np.divide(sums[middle], sizes - 1, out=np.zeros(n_clusters), where=sizes > 1)
+    return middle, average, middle_average
+
+
+def write_distribution_xvg(matrix, n_frames, max_value, output_path, scale=1.0, n_bins=100, title='RMS Distribution', label='RMS (nm)'):
+    """ Writes the histogram of the condensed matrix values in xvg format """
+    edges = np.linspace(0, max(max_value, 1e-6), n_bins + 1)
+    counts = np.zeros(n_bins, dtype=np.int64)
+    for i, row in iter_condensed_rows(matrix, n_frames):
+        counts += np.histogram(np.asarray(row), bins=edges)[0]
+    with open(output_path, 'w') as xvg:
+        xvg.write('@    title "%s"\n@    xaxis  label "%s"\n@    yaxis  label "a.u."\n@TYPE xy\n' % (title, label))
+        for edge, count in zip((edges[:-1] + edges[1:]) / 2, counts):
+            xvg.write('%12.6f %10d\n' % (edge * scale, count))
+
+
+def write_matrix_xpm(matrix, n_frames, max_value, output_path, times=None, scale=1.0, n_levels=40, max_size=10000, legend='RMSD (nm)'):
+    """ Writes the symmetric matrix in xpm format, subsampled to at most max_size rows """
+    from biobb_analysis.native.rmsd import condensed_row
+    chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'[:n_levels]
+    stride = max(1, -(-n_frames // max_size))
+    frames = np.arange(0, n_frames, stride)
+    times = np.arange(n_frames) if times is None else np.asarray(times)
+    with open(output_path, 'w') as xpm:
+        xpm.write('/* XPM */\n/* title:   "RMS Deviation" */\n/* legend:  "%s" */\n' % legend)
+        xpm.write('/* x-label: "Time (ps)" */\n/* y-label: "Time (ps)" */\n/* type:    "Continuous" */\n')
+        xpm.write('static char *gromacs_xpm[] = {\n"%d %d %d 1",\n' % (len(frames), len(frames), n_levels))
+        for level, char in enumerate(chars):
+            grey = int(255 - 255 * level / (n_levels - 1))
+            xpm.write('"%s  c #%02X%02X%02X " /* "%.3g" */,\n' % (char, grey, grey, grey, max_value * scale * level / (n_levels - 1)))
+        xpm.write('/* x-axis:  %s */\n' % ' '.join('%g' % t for t in times[frames]))
+        xpm.write('/* y-axis:  %s */\n' % ' '.join('%g' % t for t in times[frames]))
+        for k, i in enumerate(frames[::-1]):
+            row = condensed_row(matrix, int(i), n_frames)[frames]
+            levels = np.minimum((row / max(max_value, 1e-6) * (n_levels - 1)).round().astype(np.int64), n_levels - 1)
+            xpm.write('"%s"%s\n' % (''.join(chars[level] for level in levels), ',' if k < len(frames) - 1 else ''))
+        xpm.write('};\n')
+
+
+def write_cluster_log(output_path, method, cutoff, stats, labels, middle, average, middle_average, times=None, scale=1.0, unit='nm'):
+    """ Writes a summary of the clustering in the same layout as the GROMACS cluster log """
+    times = np.arange(len(labels)) if times is None else np.asarray(times)
+    n_clusters = len(middle)
+    with open(output_path, 'w') as log:
+        log.write('Using %s method for clustering\n' % method)
+        log.write('Using RMSD cutoff %g %s\n' % (cutoff, unit))
+        log.write('The RMSD ranges from %g to %g %s\n' % (stats[0] * scale, stats[1] * scale, unit))
+        log.write('Average RMSD is %g\n' % (stats[2] * scale))
+        log.write('Number of structures for matrix %d\n' % len(labels))
+        log.write('Found %d clusters\n\n' % n_clusters)
+        log.write('cl. | #st  rmsd | middle rmsd | cluster members\n')
+        for c in range(n_clusters):
+            members = np.flatnonzero(labels == c)
+            log.write('%3d | %4d %6.3f | %6g %6.3f | %s\n' % (c + 1, len(members), average[c] * scale, times[middle[c]],
+                                                            middle_average[c] * scale, ' '.join('%6g' % t for t in times[members])))
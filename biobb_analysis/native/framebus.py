@@ -0,0 +1,174 @@
+""" Shared memory frame bus for package biobb_analysis.native
+
+A single reader decodes the trajectory chunk by chunk into a ring buffer of shared memory slots and several
+consumer processes read every chunk from the shared memory without copying it. A slot is only written again
+when all the consumers have released it, so the reader waits for the slowest consumer (backpressure) and the
+memory used is n_slots * chunk_frames * n_atoms * 12 bytes whatever the size of the trajectory.
+multiprocessing.shared_memory needs Python 3.8 or newer. """
+import multiprocessing
+import queue
+import traceback
+import numpy as np
+
+# seconds between checks of the consumers while the reader waits for a free slot
+WAIT_INTERVAL = 1.0
+
+
+def is_available():
+    """ Checks if multiprocessing.shared_memory is available (Python 3.8 or newer) """
+    try:
+        from multiprocessing import shared_memory  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class FrameBus:
+    """ Ring buffer of n_slots chunks of chunk_frames frames in shared memory, read by n_consumers consumers """
+
+    def __init__(self, n_atoms, n_consumers, chunk_frames=100, n_slots=4, context=None):
+        from multiprocessing import shared_memory
+        context = context or multiprocessing.get_context()
+        self.shape = (n_slots, chunk_frames, n_atoms, 3)
+        self.n_consumers = n_consumers
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, n_slots * chunk_frames * n_atoms * 3 * 4))
+        # first frame and number of frames of every slot, -1 frames marks the end of the trajectory
+        self.slots = context.Array('q', 2 * n_slots, lock=False)
+        # consumers that did not release every slot yet
+        self.readers = context.Array('i', n_slots, lock=False)
+        self.lock = context.Lock()
+        self.free = context.Semaphore(n_slots)
+        self.filled = [context.Semaphore(0) for _ in range(n_consumers)]
+        self.published = 0
+
+    def buffer(self):
+        return np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+
+    def _acquire_slot(self, alive):
+        while not self.free.acquire(timeout=WAIT_INTERVAL):
+            if alive and not alive():
+                raise RuntimeError('A consumer of the frame bus exited before reading the whole trajectory')
+        return self.published % self.shape[0]
+
+    def _fill_slot(self, slot, first_frame, n_frames):
+        self.slots[2 * slot], self.slots[2 * slot + 1] = first_frame, n_frames
+        self.readers[slot] = self.n_consumers
+        self.published += 1
+        for filled in self.filled:
+            filled.release()
+
+    def publish(self, chunks, alive=None):
+        """ Writes the (first_frame, coords) chunks to the bus and marks the end of the trajectory.
+        alive is called while waiting for a free slot, the reader stops if it returns False """
+        buffer = self.buffer()
+        chunk_frames = self.shape[1]
+        try:
+            for first_frame, coords in chunks:
+                for offset in range(0, len(coords), chunk_frames):
+                    part = coords[offset:offset + chunk_frames]
+                    slot = self._acquire_slot(alive)
+                    buffer[slot, :len(part)] = part
+                    self._fill_slot(slot, first_frame + offset, len(part))
+        finally:
+            # the consumers stop at the end mark, also when the reader fails
+            slot = self._acquire_slot(alive)
+            self._fill_slot(slot, 0, -1)
+            del buffer
+
+    def release(self, slot):
+        with self.lock:
+            self.readers[slot] -= 1
+            if not self.readers[slot]:
+                self.free.release()
+
+    def consume(self, consumer):
+        """ Yields the (first_frame, coords) chunks of the trajectory for the consumer. The coords are a view
+        of the shared memory, only valid until the next chunk is requested """
+        buffer = self.buffer()
+        received = 0
+        finished = False
+        try:
+            while True:
+                self.filled[consumer].acquire()
+                slot = received % self.shape[0]
+                received += 1
+                first_frame, n_frames = self.slots[2 * slot], self.slots[2 * slot + 1]
+                if n_frames < 0:
+                    finished = True
+                    self.release(slot)
+                    return
+                try:
+                    yield first_frame, buffer[slot, :n_frames]
+                finally:
+                    self.release(slot)
+        finally:
+            del buffer
+            # a consumer that stops early keeps releasing the slots so the reader and the other consumers go on
+            while not finished:
+                self.filled[consumer].acquire()
+                slot = received % self.shape[0]
+                received += 1
+                finished = self.slots[2 * slot + 1] < 0
+                self.release(slot)
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # a view of the buffer is still referenced (ie: by a traceback), the memory is unmapped at exit
+            pass
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+def _run_consumer(bus, consumer, analysis, results):
+    """ Process of a consumer: feeds every chunk of the bus to the analysis and puts its result in the results queue """
+    try:
+        for first_frame, coords in bus.consume(consumer):
+            analysis.consume(first_frame, coords)
+            del coords
+        results.put((consumer, analysis.result(), None))
+    except Exception:
+        results.put((consumer, None, traceback.format_exc()))
+    finally:
+        bus.close()
+
+
+def run_analyses(path, analyses, chunk_frames=100, n_slots=4, atoms=None, store=None):
+    """ Runs the analyses (see biobb_analysis.native.analysis), each one in its own process, reading and decoding
+    the trajectory only once. With a FrameStore (see biobb_analysis.native.framestore) the decoded frames are read
+    from the store, and stored on the first run. Returns the results of the analyses in the same order """
+    from biobb_analysis.native.trajectory import open_trajectory
+    reader = store.open(path, atoms) if store else open_trajectory(path)
+    n_atoms = reader.n_atoms if atoms is None else len(atoms)
+    context = multiprocessing.get_context()
+    bus = FrameBus(n_atoms, len(analyses), chunk_frames, n_slots, context)
+    results = context.Queue()
+    processes = [context.Process(target=_run_consumer, args=(bus, consumer, analysis, results), daemon=True)
+                 for consumer, analysis in enumerate(analyses)]
+    try:
+        for process in processes:
+            process.start()
+        bus.publish(reader.iter_chunks(chunk_frames, atoms), alive=lambda: all(process.is_alive() for process in processes))
+        outputs = {}
+        while len(outputs) < len(analyses):
+            try:
+                consumer, result, error = results.get(timeout=WAIT_INTERVAL)
+            except queue.Empty:
+                if [process for process in processes if process.exitcode not in (None, 0)]:
+                    raise RuntimeError('A consumer of the frame bus was killed')
+                continue
+            outputs[consumer] = (result, error)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        bus.unlink()
+    errors = [error for result, error in outputs.values() if error]
+    if errors:
+        raise RuntimeError('Frame bus consumer failed:\n' + errors[0])
+    return [outputs[consumer][0] for consumer in range(len(analyses))]
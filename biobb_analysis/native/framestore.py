@@ -0,0 +1,226 @@
+""" Store of decoded trajectory frames for package biobb_analysis.native
+
+The decoded float32 coordinates (Angstroms) of a trajectory are kept in chunked npy files with a manifest, so the
+following analyses of the same trajectory read them instead of decoding it again. The entries are keyed by the
+signature (path, size and modification time) of the trajectory and by the subset of atoms stored: all the atoms,
+a list of atom indexes, or any other JSON description of the selection (ie: a GROMACS group). The least recently
+used entries are removed when the store grows over its disk budget. Every entry of the store is read like the
+native trajectory readers (n_frames, n_atoms, times, read_frames and iter_chunks). """
+from pathlib import Path
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from biobb_analysis.native.cache import file_signature, cache_key, read_json, write_json, available_memory
+
+MANIFEST = 'manifest.json'
+# fraction of the available memory the frames cached by cache_frames can use
+CACHE_MEMORY = 0.5
+
+
+class FrameStoreEntry:
+    """ Decoded frames of a trajectory in the store """
+
+    def __init__(self, entry_dir, manifest):
+        self.path = Path(entry_dir)
+        self.manifest = manifest
+        self.n_frames = manifest['n_frames']
+        self.n_atoms = manifest['n_atoms']
+        self.times = manifest.get('times')
+        self.atoms = manifest.get('atoms')
+
+    def columns(self, atoms):
+        """ Returns the stored columns of the given atoms of the trajectory """
+        if atoms is None or self.atoms is None:
+            return atoms
+        return np.searchsorted(self.atoms, atoms)
+
+    def chunk(self, index):
+        return np.load(str(self.path.joinpath(self.manifest['chunks'][index]['file'])), mmap_mode='r')
+
+    def iter_chunks(self, chunk_size=None, atoms=None):
+        """ Yields (first_frame, coordinates) chunks of at most chunk_size frames """
+        columns = self.columns(atoms)
+        for index, chunk_info in enumerate(self.manifest['chunks']):
+            coords = self.chunk(index)
+            step = chunk_size or len(coords)
+            for offset in range(0, len(coords), step):
+                part = coords[offset:offset + step]
+                yield chunk_info['first'] + offset, np.array(part if columns is None else part[:, columns], dtype=np.float32)
+
+    def read_frames(self, frames=None, atoms=None):
+        """ Returns the coordinates of the given frames and atoms as a float32 array """
+        frames = np.arange(self.n_frames) if frames is None else np.asarray(frames)
+        columns = self.columns(atoms)
+        firsts = np.array([chunk_info['first'] for chunk_info in self.manifest['chunks']])
+        coords = np.empty((len(frames), self.n_atoms if columns is None else len(columns), 3), dtype=np.float32)
+        for i, frame in enumerate(frames):
+            index = np.searchsorted(firsts, frame, side='right') - 1
+            xyz = self.chunk(index)[frame - firsts[index]]
+            coords[i] = xyz if columns is None else xyz[columns]
+        return coords
+
+
+class FrameStoreWriter:
+    """ Writes the decoded chunks of a trajectory to a new entry of the store, the entry is only visible once complete """
+
+    def __init__(self, store, traj_path, n_atoms, atoms=None, selection=None, times=None, chunk_frames=1000):
+        self.store = store
+        self.entry_dir = store.entry_dir(traj_path, atoms, selection)
+        self.tmp_dir = Path('%s.%d.tmp' % (self.entry_dir, os.getpid()))
+        self.manifest = {'trajectory': file_signature(traj_path), 'n_frames': 0, 'n_atoms': n_atoms,
+                         'atoms': None if atoms is None else [int(atom) for atom in atoms], 'selection': selection,
+                         'times': times, 'chunks': [], 'size': 0}
+        self.chunk_frames = chunk_frames
+        self.pending = []
+
+    def __enter__(self):
+        if self.tmp_dir.exists():
+            shutil.rmtree(str(self.tmp_dir))
+        self.tmp_dir.mkdir(parents=True)
+        return self
+
+    def add(self, coords):
+        """ Adds the next frames, they are written in chunks of chunk_frames frames """
+        self.pending.append(np.asarray(coords, dtype=np.float32))
+        while sum(len(coords) for coords in self.pending) >= self.chunk_frames:
+            frames = np.concatenate(self.pending)
+            self.write_chunk(frames[:self.chunk_frames])
+            self.pending = [frames[self.chunk_frames:]]
+
+    def write_chunk(self, coords):
+        name = 'chunk_%05d.npy' % len(self.manifest['chunks'])
+        np.save(str(self.tmp_dir.joinpath(name)), coords)
+        self.manifest['chunks'].append({'file': name, 'first': self.manifest['n_frames'], 'n_frames': len(coords)})
+        self.manifest['n_frames'] += len(coords)
+        self.manifest['size'] += self.tmp_dir.joinpath(name).stat().st_size
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type:
+            shutil.rmtree(str(self.tmp_dir), ignore_errors=True)
+            return False
+        frames = np.concatenate(self.pending) if self.pending else np.empty((0, self.manifest['n_atoms'], 3), dtype=np.float32)
+        if len(frames):
+            self.write_chunk(frames)
+        self.manifest['created'] = time.time()
+        write_json(self.manifest, self.tmp_dir.joinpath(MANIFEST))
+        try:
+            os.rename(str(self.tmp_dir), str(self.entry_dir))
+        except OSError:
+            # the same entry was stored by another process
+            shutil.rmtree(str(self.tmp_dir), ignore_errors=True)
+        self.store.evict(keep=self.entry_dir.name)
+        return False
+
+    def entry(self):
+        return self.store.read_entry(self.entry_dir)
+
+
+class FrameStore:
+    """ Folder of decoded trajectories, budget is the maximum size of the store in bytes (None for no limit) """
+
+    def __init__(self, store_dir, budget=None):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.budget = budget
+
+    def entry_dir(self, traj_path, atoms=None, selection=None):
+        subset = None if atoms is None and selection is None else [None if atoms is None else [int(atom) for atom in atoms], selection]
+        return self.store_dir.joinpath('%s_%s' % (cache_key(file_signature(traj_path)), cache_key(subset)))
+
+    def read_entry(self, entry_dir):
+        """ Returns the entry and marks it as used, or None if it is not complete """
+        manifest = read_json(Path(entry_dir).joinpath(MANIFEST))
+        if not manifest:
+            return None
+        os.utime(str(Path(entry_dir).joinpath(MANIFEST)))
+        return FrameStoreEntry(entry_dir, manifest)
+
+    def lookup(self, traj_path, atoms=None, selection=None):
+        """ Returns the entry of the trajectory with the given atoms (or selection), or None. The atoms are also
+        read from the entries storing all the atoms or a larger subset of them """
+        try:
+            trajectory_key = cache_key(file_signature(traj_path))
+        except OSError:
+            return None
+        if selection is not None:
+            return self.read_entry(self.entry_dir(traj_path, atoms, selection))
+        candidates = []
+        for manifest_path in self.store_dir.glob(trajectory_key + '_*/' + MANIFEST):
+            manifest = read_json(manifest_path)
+            if not manifest or manifest.get('selection') is not None:
+                continue
+            stored = manifest.get('atoms')
+            if stored is None or (atoms is not None and set(int(atom) for atom in atoms) <= set(stored)):
+                candidates.append((manifest['size'], manifest_path.parent))
+        return self.read_entry(min(candidates)[1]) if candidates else None
+
+    def writer(self, traj_path, n_atoms, atoms=None, selection=None, times=None, chunk_frames=1000):
+        """ Returns a context manager adding the decoded frames of a trajectory to the store """
+        return FrameStoreWriter(self, traj_path, n_atoms, atoms, selection, times, chunk_frames)
+
+    def materialize(self, reader, traj_path, atoms=None, chunk_frames=1000):
+        """ Stores the frames (all the atoms or the given subset) read by a native reader and returns the entry """
+        with self.writer(traj_path, reader.n_atoms if atoms is None else len(atoms), atoms, times=getattr(reader, 'times', None),
+                         chunk_frames=chunk_frames) as writer:
+            for _, coords in reader.iter_chunks(chunk_frames, None if atoms is None else sorted(atoms)):
+                writer.add(coords)
+        return writer.entry()
+
+    def open(self, traj_path, atoms=None, materialize=True):
+        """ Returns the entry of the trajectory if it is stored, otherwise its native reader (storing its frames first if materialize) """
+        from biobb_analysis.native.trajectory import open_trajectory
+        entry = self.lookup(traj_path, atoms)
+        if entry:
+            return entry
+        reader = open_trajectory(traj_path)
+        return self.materialize(reader, traj_path, atoms) if materialize else reader
+
+    def entries(self):
+        """ Returns the (last used, size, folder) of every complete entry """
+        entries = []
+        for manifest_path in self.store_dir.glob('*/' + MANIFEST):
+            manifest = read_json(manifest_path)
+            if manifest:
+                entries.append((manifest_path.stat().st_mtime, manifest['size'], manifest_path.parent))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """ Removes the least recently used entries until the store fits in its budget, returns the removed folders """
+        if self.budget is None:
+            return []
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, entry_dir in entries:
+            if total <= self.budget:
+                break
+            if entry_dir.name == keep:
+                continue
+            shutil.rmtree(str(entry_dir), ignore_errors=True)
+            removed.append(str(entry_dir))
+            total -= size
+        return removed
+
+
+def cache_frames(reader, atoms=None, scratch_dir=None, memory_budget=None, chunk_frames=1000):
+    """ Reads the frames (all the atoms or the given subset) once and returns them as a float32 array: in memory if
+    they fit in memory_budget bytes (by default half of the available memory), in a memory-mapped scratch file in
+    scratch_dir otherwise. The scratch file is removed as soon as it is mapped """
+    n_atoms = reader.n_atoms if atoms is None else len(atoms)
+    shape = (reader.n_frames, n_atoms, 3)
+    if memory_budget is None:
+        memory_budget = (available_memory() or 0) * CACHE_MEMORY
+    if np.prod(shape) * 4 <= memory_budget:
+        coords = np.empty(shape, dtype=np.float32)
+    else:
+        handle, scratch_path = tempfile.mkstemp(suffix='.npy', dir=scratch_dir)
+        os.close(handle)
+        try:
+            coords = np.lib.format.open_memmap(scratch_path, mode='w+', dtype=np.float32, shape=shape)
+        finally:
+            os.remove(scratch_path)
+    for first, chunk in reader.iter_chunks(chunk_frames, atoms):
+        coords[first:first + len(chunk)] = chunk
+    return coords
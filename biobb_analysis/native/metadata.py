@@ -0,0 +1,310 @@
+""" Trajectory metadata probe for package biobb_analysis.native
+
+Only the headers (or the frame headers) of the trajectories are read, so the number of frames, the number of atoms,
+the box type and the time step of a trajectory are known without reading its coordinates. """
+from pathlib import Path, PurePath
+import math
+import os
+import struct
+from biobb_analysis.native.cache import file_signature, cache_key, read_json, write_json
+from biobb_analysis.native.trajectory import TRRReader, DCDReader, XTCIndex
+
+# folder where the metadata is persisted between executions, the metadata is always cached in memory
+CACHE_DIR_ENV = 'BIOBB_METADATA_CACHE'
+# DCD time steps are stored in AKMA time units
+AKMA_TO_PS = 0.0488882129
+
+_cache = {}
+
+
+def box_type(lengths, angles):
+    """ Returns the type of a box given its lengths and angles (degrees): orthorhombic, triclinic or None (no box) """
+    if not lengths or not any(lengths):
+        return None
+    if all(abs(angle - 90.0) < 1e-3 for angle in angles):
+        return 'orthorhombic'
+    return 'triclinic'
+
+
+def box_vectors_type(vectors):
+    """ Returns the type of a box given its 3x3 box vectors (GROMACS formats) """
+    if not any(vectors):
+        return None
+    off_diagonal = [value for i, value in enumerate(vectors) if i % 4]
+    return 'triclinic' if any(off_diagonal) else 'orthorhombic'
+
+
+def metadata(fmt, n_frames=None, n_atoms=None, box=None, dt=None):
+    """ Returns the metadata dictionary of a trajectory """
+    return {'format': fmt, 'n_frames': n_frames, 'n_atoms': n_atoms, 'box': box, 'dt': dt}
+
+
+def probe_dcd(path):
+    """ DCD: the number of frames is computed from the header and the frame size, the box is read from the first frame """
+    reader = DCDReader(path)
+    box = None
+    if reader.has_box and reader.n_frames:
+        with open(path, 'rb') as dcd:
+            dcd.seek(reader.frame_offset(0) + 4)
+            a, gamma, b, beta, alpha, c = struct.unpack(reader.endian + '6d', dcd.read(48))
+        angles = [alpha, beta, gamma]
+        # recent CHARMM and NAMD versions store the cosines of the angles
+        if all(abs(angle) <= 1.0 for angle in angles):
+            angles = [math.degrees(math.acos(angle)) for angle in angles]
+        box = box_type([a, b, c], angles)
+    # NSAVC: number of steps between frames
+    dt = reader.delta * reader.icntrl[2] * AKMA_TO_PS if reader.delta and reader.icntrl[2] else None
+    return metadata('dcd', reader.n_frames, reader.n_atoms, box, dt)
+
+
+def probe_xtc(path):
+    """ XTC: the frames are indexed jumping over the compressed coordinates, the box is read from the first frame header """
+    index = XTCIndex(path)
+    box = None
+    if index.n_frames:
+        with open(path, 'rb') as xtc:
+            xtc.seek(index.offsets[0] + 16)
+            box = box_vectors_type(struct.unpack('>9f', xtc.read(36)))
+    dt = index.times[1] - index.times[0] if index.n_frames > 1 else None
+    return metadata('xtc', index.n_frames, index.n_atoms, box, dt)
+
+
+def probe_trr(path):
+    """ TRR: the frames are indexed reading only their headers, the box is read from the first frame """
+    reader = TRRReader(path)
+    box = None
+    if reader.n_frames and reader.layout[0][1] is not None:
+        _, box_offset, precision = reader.layout[0]
+        with open(path, 'rb') as trr:
+            trr.seek(box_offset)
+            box = box_vectors_type(struct.unpack('>9d' if precision == 8 else '>9f', trr.read(9 * precision)))
+    dt = reader.times[1] - reader.times[0] if reader.n_frames > 1 else None
+    return metadata('trr', reader.n_frames, reader.n_atoms, box, dt)
+
+
+class NetCDFHeader:
+    """ Reads the header (dimensions and variables) of a classic, 64 bits offset or CDF-5 NetCDF file """
+
+    TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 4, 6: 8, 7: 1, 8: 2, 9: 4, 10: 8, 11: 8}
+    TYPE_FORMATS = {3: 'h', 4: 'i', 5: 'f', 6: 'd', 8: 'H', 9: 'I', 10: 'q', 11: 'Q'}
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as netcdf:
+            self._netcdf = netcdf
+            magic = netcdf.read(4)
+            if len(magic) < 4 or magic[:3] != b'CDF' or magic[3] not in (1, 2, 5):
+                raise ValueError('%s: Wrong NetCDF header' % self.path)
+            self.version = magic[3]
+            self.numrecs = self._int(self.version == 5)
+            self.dims = self._read_dims()
+            self._skip_atts()
+            self.vars = self._read_vars()
+            self.header_size = netcdf.tell()
+        self.file_size = Path(self.path).stat().st_size
+
+    def _unpack(self, fmt):
+        size = struct.calcsize(fmt)
+        raw = self._netcdf.read(size)
+        if len(raw) < size:
+            raise ValueError('%s: Truncated NetCDF header' % self.path)
+        return struct.unpack(fmt, raw)
+
+    def _int(self, large=None):
+        """ Reads a NON_NEG (int64 in CDF-5) """
+        large = self.version == 5 if large is None else large
+        return self._unpack('>q' if large else '>i')[0]
+
+    def _name(self):
+        size = self._int()
+        return self._netcdf.read(size + (-size % 4)).decode('utf-8', 'replace')[:size]
+
+    def _list(self, tag):
+        """ Reads the header of a list: its tag is ZERO when the list is absent """
+        list_tag = self._unpack('>i')[0]
+        n_elements = self._int()
+        if list_tag not in (0, tag):
+            raise ValueError('%s: Wrong NetCDF header' % self.path)
+        return n_elements
+
+    def _read_dims(self):
+        dims = []
+        for _ in range(self._list(10)):
+            dims.append((self._name(), self._int()))
+        return dims
+
+    def _skip_atts(self):
+        for _ in range(self._list(12)):
+            self._name()
+            nc_type = self._unpack('>i')[0]
+            size = self._int() * self.TYPE_SIZES.get(nc_type, 1)
+            self._netcdf.seek(size + (-size % 4), 1)
+
+    def _read_vars(self):
+        variables = {}
+        for _ in range(self._list(11)):
+            name = self._name()
+            dim_ids = [self._int() for _ in range(self._int())]
+            self._skip_atts()
+            nc_type = self._unpack('>i')[0]
+            vsize = self._int()
+            begin = self._int(self.version != 1)
+            variables[name] = {'dims': [self.dims[i][0] for i in dim_ids], 'type': nc_type, 'vsize': vsize, 'begin': begin,
+                               'record': bool(dim_ids) and self.dims[dim_ids[0]][1] == 0}
+        return variables
+
+    def dim(self, name):
+        return dict(self.dims).get(name)
+
+    @property
+    def record_size(self):
+        """ Size of a record: the size of all the record variables, not padded if there is only one """
+        records = [var for var in self.vars.values() if var['record']]
+        if len(records) == 1:
+            dims = dict(self.dims)
+            return self.TYPE_SIZES[records[0]['type']] * _product(dims[dim] for dim in records[0]['dims'][1:])
+        return sum(var['vsize'] for var in records)
+
+    @property
+    def n_records(self):
+        if self.numrecs >= 0:
+            return self.numrecs
+        # streaming files do not store the number of records
+        begins = [var['begin'] for var in self.vars.values() if var['record']]
+        if not begins or not self.record_size:
+            return None
+        return max(0, (self.file_size - min(begins)) // self.record_size)
+
+    def read_values(self, name, record=0, count=None):
+        """ Reads count values (all the values of a record by default) of a variable """
+        var = self.vars[name]
+        fmt = self.TYPE_FORMATS[var['type']]
+        count = count or var['vsize'] // self.TYPE_SIZES[var['type']]
+        with open(self.path, 'rb') as netcdf:
+            netcdf.seek(var['begin'] + (record * self.record_size if var['record'] else 0))
+            return struct.unpack('>%d%s' % (count, fmt), netcdf.read(count * self.TYPE_SIZES[var['type']]))
+
+
+def _product(values):
+    result = 1
+    for value in values:
+        result *= value
+    return result
+
+
+def probe_netcdf(path):
+    """ AMBER NetCDF trajectories and restarts: frame and atom dimensions, cell variables and times of the two first frames """
+    header = NetCDFHeader(path)
+    n_atoms = header.dim('atom')
+    n_frames = header.n_records if header.dim('frame') == 0 else 1
+    box = None
+    if 'cell_lengths' in header.vars and 'cell_angles' in header.vars and n_frames:
+        box = box_type(header.read_values('cell_lengths', count=3), header.read_values('cell_angles', count=3))
+    dt = None
+    if 'time' in header.vars and header.vars['time']['record'] and n_frames and n_frames > 1:
+        dt = header.read_values('time', 1, 1)[0] - header.read_values('time', 0, 1)[0]
+    return metadata('netcdf', n_frames, n_atoms, box, dt)
+
+
+def probe_mdcrd(path, n_atoms):
+    """ AMBER ASCII trajectories: fixed size frames of 10 coordinates per line, the number of atoms comes from the topology """
+    if not n_atoms:
+        return metadata('mdcrd')
+    n_values = 3 * n_atoms
+    frame_size = (n_values // 10) * 81 + ((n_values % 10) * 8 + 1 if n_values % 10 else 0)
+    with open(path, 'rb') as mdcrd:
+        header_size = len(mdcrd.readline())
+        mdcrd.seek(header_size + frame_size)
+        # the optional box line only has the 3 box lengths
+        box_line = mdcrd.readline()
+    box_size = len(box_line) if len(box_line.split()) == 3 and len(box_line.rstrip()) <= 24 and n_values != 3 else 0
+    n_frames = (Path(path).stat().st_size - header_size) // (frame_size + box_size)
+    return metadata('mdcrd', n_frames, n_atoms, 'orthorhombic' if box_size else None)
+
+
+def probe_pdb(path):
+    """ PDB: models, atoms of the first model and CRYST1 record """
+    n_models, n_atoms, box = 0, 0, None
+    with open(path) as pdb:
+        for line in pdb:
+            if line.startswith(('ATOM', 'HETATM')):
+                if not n_models:
+                    n_atoms += 1
+            elif line.startswith('ENDMDL'):
+                n_models += 1
+            elif line.startswith('CRYST1') and box is None:
+                try:
+                    box = box_type([float(line[6:15]), float(line[15:24]), float(line[24:33])],
+                                   [float(line[33:40]), float(line[40:47]), float(line[47:54])])
+                except ValueError:
+                    pass
+    # single model files do not have MODEL/ENDMDL records
+    return metadata('pdb', n_models or (1 if n_atoms else 0), n_atoms, box)
+
+
+def topology_atoms(path):
+    """ Returns the number of atoms of an AMBER parameter file (NATOM pointer) or a PDB topology, or None if it can not be read """
+    try:
+        with open(path) as top:
+            first_line = top.readline()
+            if first_line.startswith('%VERSION') or first_line.startswith('%FLAG'):
+                line = first_line
+                while line and not line.startswith('%FLAG POINTERS'):
+                    line = top.readline()
+                top.readline()
+                return int(top.readline()[:8])
+        if PurePath(path).suffix[1:].lower() == 'pdb':
+            return probe_pdb(path)['n_atoms']
+    except (OSError, ValueError, UnicodeDecodeError):
+        return None
+    return None
+
+
+PROBES = {
+    'dcd': probe_dcd,
+    'xtc': probe_xtc,
+    'trr': probe_trr,
+    'nc': probe_netcdf,
+    'netcdf': probe_netcdf,
+    'cdf': probe_netcdf,
+    'ncrestart': probe_netcdf,
+    'restartnc': probe_netcdf,
+    'pdb': probe_pdb
+}
+
+MDCRD_FORMATS = ['mdcrd', 'crd']
+
+
+def probe(path, top_path=None, cache_dir=None):
+    """ Returns the metadata (format, n_frames, n_atoms, box and dt in ps) of a trajectory, or None if its format can not be probed.
+
+    The metadata is cached by the path, size and modification time of the trajectory (and of the topology, only needed by ASCII trajectories),
+    in memory and, if given, in cache_dir (BIOBB_METADATA_CACHE environment variable by default). Unknown values are None. """
+    ext = PurePath(path).suffix[1:].lower()
+    if ext not in PROBES and ext not in MDCRD_FORMATS:
+        return None
+    try:
+        signature = [file_signature(path)]
+        if ext in MDCRD_FORMATS and top_path:
+            signature.append(file_signature(top_path))
+    except OSError:
+        return None
+    key = cache_key(*signature)
+    if key in _cache:
+        return dict(_cache[key])
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV)
+    cache_path = Path(cache_dir).joinpath(key + '.json') if cache_dir else None
+    result = read_json(cache_path) if cache_path else None
+    if result is None:
+        try:
+            if ext in MDCRD_FORMATS:
+                result = probe_mdcrd(path, topology_atoms(top_path) if top_path else None)
+            else:
+                result = PROBES[ext](path)
+        except (OSError, ValueError, KeyError, struct.error):
+            return None
+        if cache_path:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            write_json(result, cache_path)
+    _cache[key] = result
+    return dict(result)
@@ -0,0 +1,211 @@
+""" Native RMSD computations for package biobb_analysis.native """
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+
+
+def center(coords):
+    """ Returns the coordinates translated to their geometric center """
+    coords = np.asarray(coords, dtype=np.float64)
+    return coords - coords.mean(axis=-2, keepdims=True)
+
+
+def superpose(coords, reference):
+    """ Returns the centered coordinates of every frame rotated onto the centered reference (Kabsch) """
+    coords, reference = center(coords), center(reference)
+    cov = np.einsum('fai,aj->fij', coords, reference)
+    u, _, vt = np.linalg.svd(cov)
+    # avoid reflections
+    u[:, :, 2] *= np.sign(np.linalg.det(u @ vt))[:, None]
+    return coords @ (u @ vt)
+
+
+def pair_distances(coords):
+    """ Returns the condensed atom-pair distances of every frame """
+    coords = np.asarray(coords, dtype=np.float64)
+    i, j = np.triu_indices(coords.shape[1], k=1)
+    return np.linalg.norm(coords[:, i] - coords[:, j], axis=-1)
+
+
+def pairwise_rmsd(coords_a, coords_b):
+    """ Returns the best-fit RMSD between every frame of coords_a and every frame of coords_b (centered coordinates) """
+    n_a, n_atoms, _ = coords_a.shape
+    n_b = coords_b.shape[0]
+    # covariance matrices of every pair of frames as a single matrix product
+    cov = coords_a.transpose(0, 2, 1).reshape(n_a * 3, n_atoms) @ coords_b.transpose(1, 0, 2).reshape(n_atoms, n_b * 3)
+    cov = cov.reshape(n_a, 3, n_b, 3).transpose(0, 2, 1, 3)
+    singular = np.linalg.svd(cov, compute_uv=False)
+    # avoid reflections
+    singular[..., 2] *= np.sign(np.linalg.det(cov))
+    norm_a = np.einsum('ijk,ijk->i', coords_a, coords_a)
+    norm_b = np.einsum('ijk,ijk->i', coords_b, coords_b)
+    msd = (norm_a[:, None] + norm_b[None, :] - 2 * singular.sum(axis=-1)) / n_atoms
+    return np.sqrt(np.maximum(msd, 0))
+
+
+def pairwise_distance_rmsd(dist_a, dist_b):
+    """ Returns the RMS deviation of atom-pair distances between every frame of dist_a and every frame of dist_b """
+    msd = (np.einsum('ij,ij->i', dist_a, dist_a)[:, None] + np.einsum('ij,ij->i', dist_b, dist_b)[None, :]
+           - 2 * dist_a @ dist_b.T) / dist_a.shape[1]
+    return np.sqrt(np.maximum(msd, 0))
+
+
+def condensed_size(n_frames):
+    """ Returns the number of elements of a condensed (upper triangle) n_frames x n_frames matrix """
+    return n_frames * (n_frames - 1) // 2
+
+
+def condensed_offset(i, n_frames):
+    """ Returns the position of element (i, i + 1) in a condensed matrix """
+    return i * n_frames - i * (i + 1) // 2
+
+
+def iter_condensed_rows(matrix, n_frames):
+    """ Yields (i, distances from frame i to frames i + 1 ... n_frames - 1) reading the condensed matrix sequentially """
+    for i in range(n_frames - 1):
+        offset = condensed_offset(i, n_frames)
+        yield i, matrix[offset:offset + n_frames - i - 1]
+
+
+def condensed_row(matrix, i, n_frames):
+    """ Returns the full row i (distances from frame i to every frame) of a condensed matrix """
+    row = np.zeros(n_frames, dtype=np.float32)
+    if i:
+        j = np.arange(i)
+        row[:i] = matrix[j * n_frames - j * (j + 1) // 2 + i - j - 1]
+    offset = condensed_offset(i, n_frames)
+    row[i + 1:] = matrix[offset:offset + n_frames - i - 1]
+    return row
+
+
+def _compute_tile(coords_path, matrix_path, rows, cols, dista):
+    """ Computes a tile of the condensed matrix and returns its (min, max, sum, count) """
+    coords = np.load(coords_path, mmap_mode='r')
+    matrix = np.load(matrix_path, mmap_mode='r+')
+    n_frames = coords.shape[0]
+    block_a = coords[rows[0]:rows[1]]
+    block_b = coords[cols[0]:cols[1]]
+    if dista:
+        tile = pairwise_distance_rmsd(pair_distances(block_a), pair_distances(block_b))
+    else:
+        tile = pairwise_rmsd(center(block_a), center(block_b))
+    stats = [np.inf, 0.0, 0.0, 0]
+    for k, i in enumerate(range(rows[0], rows[1])):
+        first = max(cols[0], i + 1)
+        if first >= cols[1]:
+            continue
+        values = tile[k, first - cols[0]:]
+        offset = condensed_offset(i, n_frames) + first - i - 1
+        matrix[offset:offset + len(values)] = values
+        stats = [min(stats[0], values.min()), max(stats[1], values.max()), stats[2] + values.sum(), stats[3] + len(values)]
+    matrix.flush()
+    return stats
+
+
+def rmsd_matrix(coords_path, matrix_path, dista=False, tile_size=1000, num_processes=0):
+    """ Computes the condensed pairwise RMSD matrix of the frames stored in coords_path (npy) into matrix_path (npy, float32).
+    The matrix is computed in tiles distributed across a process pool and returns (min, max, mean) of the matrix """
+    n_frames = np.load(coords_path, mmap_mode='r').shape[0]
+    np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.float32, shape=(condensed_size(n_frames),)).flush()
+    tiles = [((a, min(a + tile_size, n_frames)), (b, min(b + tile_size, n_frames)))
+             for a in range(0, n_frames, tile_size) for b in range(a, n_frames, tile_size)]
+    num_processes = num_processes or os.cpu_count()
+    if num_processes == 1 or len(tiles) == 1:
+        results = [_compute_tile(coords_path, matrix_path, rows, cols, dista) for rows, cols in tiles]
+    else:
+        with ProcessPoolExecutor(max_workers=num_processes) as executor:
+            futures = [executor.submit(_compute_tile, coords_path, matrix_path, rows, cols, dista) for rows, cols in tiles]
+            results = [future.result() for future in futures]
+    count = sum(r[3] for r in results)
+    if not count:
+        return 0.0, 0.0, 0.0
+    return float(min(r[0] for r in results)), float(max(r[1] for r in results)), float(sum(r[2] for r in results) / count)
+
+
+# bytes used by every pair of frames of a tile while its RMSD is computed (covariance matrices and their copies for the SVD)
+TILE_PAIR_BYTES = 320
+
+
+def tile_size_for_budget(n_atoms, memory_budget, num_processes, tile_size=1000):
+    """ Returns the largest tile side, up to tile_size, whose computation by num_processes processes at the same
+    time fits in memory_budget bytes """
+    per_process = memory_budget / max(num_processes, 1)
+    # side ** 2 pairs plus the float64 coordinates of both blocks of frames
+    a, b = TILE_PAIR_BYTES, 2 * n_atoms * 3 * 8
+    side = int((-b + np.sqrt(b * b + 4 * a * per_process)) / (2 * a))
+    return max(1, min(tile_size, side))
+
+
+def write_centered(reader, path, atoms=None, frames=None, chunk_frames=1000):
+    """ Writes the centered float32 coordinates of the given frames (a range of 0-based frames, all by default) and
+    atoms of a native reader to path (npy), reading the trajectory chunk by chunk. Returns the number of frames """
+    frames = range(reader.n_frames) if frames is None else frames
+    n_atoms = reader.n_atoms if atoms is None else len(atoms)
+    coords = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(frames), n_atoms, 3))
+    written = 0
+    for first, chunk in reader.iter_chunks(chunk_frames, atoms):
+        if first >= frames.stop:
+            break
+        # frames of the chunk selected by the range
+        selected = np.arange(first, first + len(chunk))
+        selected = selected[(selected >= frames.start) & ((selected - frames.start) % frames.step == 0)]
+        selected = selected[selected < frames.stop]
+        if len(selected):
+            coords[written:written + len(selected)] = center(chunk[selected - first])
+            written += len(selected)
+    coords.flush()
+    del coords
+    return written
+
+
+def _compute_cross_tile(coords_a_path, coords_b_path, matrix_path, rows, cols):
+    """ Computes a tile of the full matrix (and its transposed tile if the matrix is symmetric), returns its (min, max, sum, count) """
+    coords_a = np.load(coords_a_path, mmap_mode='r')
+    coords_b = coords_a if coords_b_path is None else np.load(coords_b_path, mmap_mode='r')
+    tile = pairwise_rmsd(np.asarray(coords_a[rows[0]:rows[1]], dtype=np.float64),
+                         np.asarray(coords_b[cols[0]:cols[1]], dtype=np.float64)).astype(np.float32)
+    mirrored = coords_b_path is None and rows != cols
+    if coords_b_path is None and rows == cols:
+        np.fill_diagonal(tile, 0)
+    matrix = np.load(matrix_path, mmap_mode='r+')
+    matrix[rows[0]:rows[1], cols[0]:cols[1]] = tile
+    if mirrored:
+        matrix[cols[0]:cols[1], rows[0]:rows[1]] = tile.T
+    matrix.flush()
+    del matrix
+    copies = 2 if mirrored else 1
+    return [float(tile.min()), float(tile.max()), float(tile.sum(dtype=np.float64)) * copies, tile.size * copies]
+
+
+def cross_rmsd_matrix(coords_a_path, matrix_path, coords_b_path=None, tile_size=1000, num_processes=0):
+    """ Computes the full best-fit RMSD matrix between every frame of coords_a_path and every frame of coords_b_path
+    (centered coordinates, npy), or of coords_a_path against itself, into matrix_path (npy, float32). The matrix is
+    computed in tiles distributed across a process pool, only the upper tiles if it is symmetric, and it is written
+    through a memory map so it is never fully in memory. Returns (min, max, mean) of the matrix """
+    n_a = np.load(coords_a_path, mmap_mode='r').shape[0]
+    n_b = n_a if coords_b_path is None else np.load(coords_b_path, mmap_mode='r').shape[0]
+    np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.float32, shape=(n_a, n_b)).flush()
+    tiles = [((a, min(a + tile_size, n_a)), (b, min(b + tile_size, n_b)))
+             for a in range(0, n_a, tile_size) for b in range(a if coords_b_path is None else 0, n_b, tile_size)]
+    num_processes = num_processes or os.cpu_count()
+    if num_processes == 1 or len(tiles) == 1:
+        results = [_compute_cross_tile(coords_a_path, coords_b_path, matrix_path, rows, cols) for rows, cols in tiles]
+    else:
+        with ProcessPoolExecutor(max_workers=num_processes) as executor:
+            futures = [executor.submit(_compute_cross_tile, coords_a_path, coords_b_path, matrix_path, rows, cols) for rows, cols in tiles]
+            results = [future.result() for future in futures]
+    count = sum(r[3] for r in results)
+    if not count:
+        return 0.0, 0.0, 0.0
+    return min(r[0] for r in results), max(r[1] for r in results), sum(r[2] for r in results) / count
+
+
+def write_matrix_text(matrix, path, stride=1, frames_a=None, frames_b=None):
+    """ Writes every stride-th row and column of a full matrix as text, reading one row at a time. The first row and
+    column are the frame numbers (frames_a and frames_b, 1-based positions by default) """
+    frames_a = np.arange(1, matrix.shape[0] + 1) if frames_a is None else np.asarray(frames_a)
+    frames_b = np.arange(1, matrix.shape[1] + 1) if frames_b is None else np.asarray(frames_b)
+    with open(path, 'w') as text:
+        text.write('#Frame ' + ' '.join('%8d' % frame for frame in frames_b[::stride]) + '\n')
+        for i in range(0, matrix.shape[0], stride):
+            text.write('%6d ' % frames_a[i] + ' '.join('%8.3f' % value for value in matrix[i, ::stride]) + '\n')
@@ -0,0 +1,104 @@
+""" Atom selection masks for package biobb_analysis.native
+
+The AMBER masks used by the blocks (see get_mask_atoms in biobb_analysis.ambertools.common) are compiled into sorted
+arrays of atom indexes reading the atom and residue names of the topology, so the native readers only read the
+coordinates of the selected atoms. Only simple masks are supported: atom (@) or residue (:) names and numbers,
+comma separated, with * and ? wildcards and number ranges (ie: :1-10), optionally negated with !. """
+from fnmatch import fnmatchcase
+from pathlib import PurePath
+import re
+import numpy as np
+
+SIMPLE_MASK = re.compile(r'^(!?)([@:])([^@:&|()<>]+)$')
+
+
+def _prmtop_section(lines, flag):
+    """ Returns the values of a %FLAG section of an AMBER parameter file, split by its %FORMAT width """
+    try:
+        start = lines.index('%FLAG ' + flag)
+    except ValueError:
+        raise ValueError('No %s section in the topology' % flag)
+    width = int(re.search(r'[aAI](\d+)', lines[start + 1]).group(1))
+    values = []
+    for line in lines[start + 2:]:
+        if line.startswith('%'):
+            break
+        values += [line[i:i + width].strip() for i in range(0, len(line), width) if line[i:i + width].strip()]
+    return values
+
+
+def read_prmtop_names(path):
+    """ Returns the atom names and the residue names and numbers (1-based) of every atom of an AMBER parameter file """
+    with open(path) as prmtop:
+        lines = [line.rstrip('\n') for line in prmtop]
+    lines = [line.rstrip() if line.startswith('%') else line for line in lines]
+    atom_names = _prmtop_section(lines, 'ATOM_NAME')
+    labels = _prmtop_section(lines, 'RESIDUE_LABEL')
+    pointers = [int(pointer) for pointer in _prmtop_section(lines, 'RESIDUE_POINTER')] + [len(atom_names) + 1]
+    residue_names, residue_numbers = [], []
+    for residue, label in enumerate(labels):
+        size = pointers[residue + 1] - pointers[residue]
+        residue_names += [label] * size
+        residue_numbers += [residue + 1] * size
+    return atom_names, residue_names, residue_numbers
+
+
+def read_pdb_names(path):
+    """ Returns the atom names and the residue names and numbers (1-based, in order of appearance) of the first model of a PDB file """
+    atom_names, residue_names, residue_numbers = [], [], []
+    last = None
+    with open(path) as pdb:
+        for line in pdb:
+            if line.startswith('ENDMDL'):
+                break
+            if line.startswith(('ATOM', 'HETATM')):
+                residue = line[17:27]
+                if residue != last:
+                    residue_numbers.append((residue_numbers[-1] if residue_numbers else 0) + 1)
+                    last = residue
+                else:
+                    residue_numbers.append(residue_numbers[-1])
+                atom_names.append(line[12:16].strip())
+                residue_names.append(line[17:21].strip())
+    return atom_names, residue_names, residue_numbers
+
+
+def topology_names(path):
+    """ Returns the atom names, residue names and residue numbers of every atom of a topology (prmtop or pdb) """
+    if PurePath(path).suffix[1:].lower() == 'pdb':
+        return read_pdb_names(path)
+    return read_prmtop_names(path)
+
+
+def _matches(items, names, numbers):
+    selected = np.zeros(len(names), dtype=bool)
+    numbers = np.asarray(numbers)
+    for item in items:
+        item = item.strip()
+        if re.match(r'^\d+(-\d+)?$', item):
+            first, _, last = item.partition('-')
+            selected |= (numbers >= int(first)) & (numbers <= int(last or first))
+        else:
+            selected |= np.array([fnmatchcase(name, item) for name in names], dtype=bool)
+    return selected
+
+
+def compile_mask(mask, atom_names, residue_names, residue_numbers):
+    """ Returns the sorted indexes (0-based) of the atoms selected by a simple AMBER mask """
+    mask = mask.strip()
+    if mask in ('*', ':*', '@*'):
+        return np.arange(len(atom_names))
+    match = SIMPLE_MASK.match(mask)
+    if not match:
+        raise ValueError('Mask %s is not supported by the native engine' % mask)
+    negate, kind, items = match.groups()
+    if kind == '@':
+        selected = _matches(items.split(','), atom_names, np.arange(1, len(atom_names) + 1))
+    else:
+        selected = _matches(items.split(','), residue_names, residue_numbers)
+    return np.nonzero(~selected if negate else selected)[0]
+
+
+def mask_atoms(top_path, mask):
+    """ Returns the sorted indexes of the atoms of the topology selected by the mask """
+    return compile_mask(mask, *topology_names(top_path))
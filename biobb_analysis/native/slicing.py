@@ -0,0 +1,98 @@
+""" Decode-free trajectory slicing for package biobb_analysis.native """
+import os
+import struct
+import numpy as np
+from biobb_analysis.native.trajectory import DCDReader, XTCIndex
+
+
+# maximum number of bytes copied by a single system call
+BLOCK_SIZE = 64 * 1024 * 1024
+
+
+def frame_range(n_frames, start, end, step):
+    """ Returns the 0-based frames between the 1-based start and end (-1 for the last frame) frames """
+    last = n_frames if end == -1 else min(end, n_frames)
+    return range(start - 1, last, step)
+
+
+def merge_ranges(ranges):
+    """ Joins consecutive (offset, length) byte ranges """
+    merged = []
+    for offset, length in ranges:
+        if merged and merged[-1][0] + merged[-1][1] == offset:
+            merged[-1][1] += length
+        else:
+            merged.append([offset, length])
+    return merged
+
+
+def copy_range(src_fd, dst_fd, offset, length):
+    """ Appends length bytes of src_fd starting at offset to dst_fd, inside the kernel when the platform allows it """
+    while length > 0:
+        count = min(length, BLOCK_SIZE)
+        try:
+            if hasattr(os, 'copy_file_range'):
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset)
+            else:
+                copied = os.sendfile(dst_fd, src_fd, offset, count)
+        except OSError:
+            # ie: file systems or platforms without in-kernel copies between regular files
+            copied = os.write(dst_fd, os.pread(src_fd, count, offset))
+        if copied <= 0:
+            raise ValueError('Unexpected end of file copying %d bytes from offset %d' % (length, offset))
+        offset += copied
+        length -= copied
+
+
+def copy_ranges(src_path, dst_fd, ranges):
+    """ Appends the (offset, length) byte ranges of src_path to dst_fd """
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        for offset, length in merge_ranges(ranges):
+            copy_range(src_fd, dst_fd, offset, length)
+    finally:
+        os.close(src_fd)
+
+
+def slice_dcd(input_path, output_path, start=1, end=-1, step=1):
+    """ Writes the start:end:step frames (1-based, end included) of a DCD trajectory copying their raw records.
+    Only the frame count, the first step and the steps between frames of the header are rewritten.
+    Returns the number of frames written """
+    reader = DCDReader(input_path)
+    frames = frame_range(reader.n_frames, start, end, step)
+    with open(input_path, 'rb') as dcd:
+        header = bytearray(dcd.read(reader.header_size))
+    nset, istart, nsavc = reader.icntrl[:3]
+    struct.pack_into(reader.endian + '3i', header, 8, len(frames), istart + frames.start * nsavc, nsavc * step)
+    with open(output_path, 'wb') as output:
+        output.write(header)
+        output.flush()
+        copy_ranges(input_path, output.fileno(), [(reader.frame_offset(frame), reader.frame_size) for frame in frames])
+    return len(frames)
+
+
+def is_time_multiple(time, first_time, dt):
+    """ Checks if time - first_time is a multiple of dt with the float tolerance used by GROMACS """
+    tol = 2 * float(np.finfo(np.float32).eps)
+    quotient = int((time - first_time + tol * time) / dt)
+    return abs(time - first_time - dt * quotient) <= tol * abs(time)
+
+
+def select_times(times, begin=None, end=None, dt=0):
+    """ Returns the frames selected by the trjconv -b, -e and -dt options: times between begin and end
+    (both included) whose difference with the first selected time is a multiple of dt """
+    frames = [i for i, time in enumerate(times) if (begin is None or time >= begin) and (end is None or time <= end)]
+    if dt > 0 and frames:
+        first_time = times[frames[0]]
+        frames = [i for i in frames if is_time_multiple(times[i], first_time, dt)]
+    return frames
+
+
+def slice_xtc(input_path, output_path, begin=None, end=None, dt=0):
+    """ Writes the frames of an XTC trajectory selected by time copying their compressed records,
+    XTC frames are independent so they are not decompressed. Returns the number of frames written """
+    index = XTCIndex(input_path)
+    frames = select_times(index.times, begin, end, dt)
+    with open(output_path, 'wb') as output:
+        copy_ranges(input_path, output.fileno(), [(index.offsets[frame], index.sizes[frame]) for frame in frames])
+    return len(frames)
@@ -0,0 +1,403 @@
+""" Native trajectory readers for package biobb_analysis.native """
+from pathlib import Path, PurePath
+import struct
+import numpy as np
+
+
+# GROMACS formats store nanometers, coordinates are always returned in Angstroms
+NM_TO_ANGSTROM = 10.0
+# atoms closer than this are read in the same run when reading a subset of the atoms
+RUN_GAP = 32
+# above this fraction of the atoms in the runs, the whole frame is read at once
+FULL_READ_FRACTION = 0.5
+
+
+def atom_runs(atoms, max_gap=RUN_GAP):
+    """ Groups the atom indexes into contiguous (first, stop) runs, atoms closer than max_gap share a run.
+    Returns the runs and the position of every given atom in the concatenation of the runs """
+    atoms = np.asarray(atoms, dtype=np.int64)
+    unique = np.unique(atoms)
+    breaks = np.nonzero(np.diff(unique) > max_gap + 1)[0] + 1
+    firsts = unique[np.r_[0, breaks]]
+    stops = unique[np.r_[breaks - 1, len(unique) - 1]] + 1
+    offsets = np.r_[0, np.cumsum(stops - firsts)[:-1]]
+    run = np.searchsorted(firsts, atoms, side='right') - 1
+    return list(zip(firsts.tolist(), stops.tolist())), offsets[run] + atoms - firsts[run]
+
+
+def read_runs(traj_file, offset, runs, item_size):
+    """ Reads the runs of atoms of a block starting at offset, every atom takes item_size bytes """
+    return b''.join(_read_at(traj_file, offset + first * item_size, (stop - first) * item_size) for first, stop in runs)
+
+
+def _read_at(traj_file, offset, size):
+    traj_file.seek(offset)
+    return traj_file.read(size)
+
+
+def subset_runs(atoms, n_atoms):
+    """ Returns the runs and positions of the atoms (see atom_runs), or None if the whole frame should be read """
+    if atoms is None:
+        return None
+    runs, positions = atom_runs(atoms)
+    if sum(stop - first for first, stop in runs) > FULL_READ_FRACTION * n_atoms:
+        return None
+    return runs, positions
+
+
+class TRRReader:
+    """ Reads GROMACS TRR trajectories frame by frame using the XDR frame headers """
+
+    MAGIC = 1993
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.offsets = []
+        self.times = []
+        self.steps = []
+        self.n_atoms = None
+        self._scan()
+
+    def _read_header(self, trr):
+        """ Reads a frame header and returns (header_size, sizes dict, precision) or None at EOF """
+        raw = trr.read(8)
+        if len(raw) < 8:
+            return None
+        magic, slen = struct.unpack('>ii', raw)
+        if magic != self.MAGIC:
+            raise ValueError('%s: Wrong TRR magic number %d' % (self.path, magic))
+        strlen = struct.unpack('>i', trr.read(4))[0]
+        trr.read(strlen + (-strlen % 4))
+        keys = ('ir_size', 'e_size', 'box_size', 'vir_size', 'pres_size', 'top_size', 'sym_size',
+                'x_size', 'v_size', 'f_size', 'natoms', 'step', 'nre')
+        sizes = dict(zip(keys, struct.unpack('>13i', trr.read(52))))
+        if sizes['box_size']:
+            precision = sizes['box_size'] // 9
+        elif sizes['x_size']:
+            precision = sizes['x_size'] // (sizes['natoms'] * 3)
+        elif sizes['v_size']:
+            precision = sizes['v_size'] // (sizes['natoms'] * 3)
+        else:
+            precision = sizes['f_size'] // (sizes['natoms'] * 3)
+        time = struct.unpack('>d' if precision == 8 else '>f', trr.read(precision))[0]
+        trr.read(precision)
+        return 12 + strlen + (-strlen % 4) + 52 + 2 * precision, sizes, precision, time
+
+    def _scan(self):
+        """ Builds the frame offset index reading only the frame headers """
+        self.layout = []
+        with open(self.path, 'rb') as trr:
+            offset = 0
+            while True:
+                trr.seek(offset)
+                header = self._read_header(trr)
+                if not header:
+                    break
+                header_size, sizes, precision, time = header
+                if self.n_atoms is None:
+                    self.n_atoms = sizes['natoms']
+                data = offset + header_size
+                x_offset = data + sizes['box_size'] + sizes['vir_size'] + sizes['pres_size']
+                box_offset = data if sizes['box_size'] else None
+                self.offsets.append(offset)
+                self.times.append(time)
+                self.steps.append(sizes['step'])
+                self.layout.append((x_offset if sizes['x_size'] else None, box_offset, precision))
+                offset = data + sum(sizes[k] for k in ('ir_size', 'e_size', 'box_size', 'vir_size', 'pres_size',
+                                                        'top_size', 'sym_size', 'x_size', 'v_size', 'f_size'))
+        self.n_atoms = self.n_atoms or 0
+
+    @property
+    def n_frames(self):
+        return len(self.offsets)
+
+    def read_frames(self, frames=None, atoms=None):
+        """ Returns the coordinates (Angstroms) of the given frames and atoms as a float32 array """
+        frames = range(self.n_frames) if frames is None else frames
+        n_atoms = self.n_atoms if atoms is None else len(atoms)
+        coords = np.empty((len(frames), n_atoms, 3), dtype=np.float32)
+        subset = subset_runs(atoms, self.n_atoms)
+        with open(self.path, 'rb') as trr:
+            for i, frame in enumerate(frames):
+                x_offset, box_offset, precision = self.layout[frame]
+                if x_offset is None:
+                    raise ValueError('%s: Frame %d has no coordinates' % (self.path, frame))
+                dtype = '>f8' if precision == 8 else '>f4'
+                if subset:
+                    # only the runs of atoms with selected atoms are read
+                    runs, positions = subset
+                    coords[i] = np.frombuffer(read_runs(trr, x_offset, runs, 3 * precision), dtype=dtype).reshape(-1, 3)[positions]
+                    continue
+                trr.seek(x_offset)
+                xyz = np.frombuffer(trr.read(self.n_atoms * 3 * precision), dtype=dtype).reshape(self.n_atoms, 3)
+                coords[i] = xyz if atoms is None else xyz[atoms]
+        coords *= NM_TO_ANGSTROM
+        return coords
+
+    def iter_chunks(self, chunk_size, atoms=None):
+        """ Yields (first_frame, coordinates) chunks of at most chunk_size frames """
+        for start in range(0, self.n_frames, chunk_size):
+            frames = range(start, min(start + chunk_size, self.n_frames))
+            yield start, self.read_frames(frames, atoms)
+
+
+class DCDReader:
+    """ Reads CHARMM/NAMD DCD trajectories, frames are located from the header without reading the previous ones """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._read_header()
+
+    def _read_header(self):
+        """ Reads the three header records and computes the size of every frame """
+        with open(self.path, 'rb') as dcd:
+            raw = dcd.read(92)
+            if len(raw) < 92:
+                raise ValueError('%s: Truncated DCD header' % self.path)
+            for endian in ('<', '>'):
+                if struct.unpack(endian + 'i', raw[:4])[0] == 84 and raw[4:8] == b'CORD':
+                    break
+            else:
+                raise ValueError('%s: Wrong DCD header' % self.path)
+            self.endian = endian
+            self.icntrl = struct.unpack(endian + '20i', raw[8:88])
+            self.delta = struct.unpack(endian + 'f', raw[44:48])[0]
+            title_size = struct.unpack(endian + 'i', dcd.read(4))[0]
+            dcd.seek(title_size + 4, 1)
+            self.n_atoms = struct.unpack(endian + 'iii', dcd.read(12))[1]
+            self.header_size = dcd.tell()
+        if self.icntrl[8]:
+            raise ValueError('%s: DCD files with fixed atoms are not supported' % self.path)
+        charmm = self.icntrl[19] != 0
+        self.has_box = charmm and self.icntrl[10] != 0
+        self.has_4d = charmm and self.icntrl[11] != 0
+        self.box_size = 56 if self.has_box else 0
+        self.frame_size = self.box_size + (4 if self.has_4d else 3) * (4 * self.n_atoms + 8)
+        self.file_size = Path(self.path).stat().st_size
+
+    @property
+    def n_frames(self):
+        return (self.file_size - self.header_size) // self.frame_size
+
+    def frame_offset(self, frame):
+        """ Returns the position of the given frame in the file """
+        return self.header_size + frame * self.frame_size
+
+    def read_frames(self, frames=None, atoms=None):
+        """ Returns the coordinates (Angstroms) of the given frames and atoms as a float32 array """
+        frames = range(self.n_frames) if frames is None else frames
+        n_atoms = self.n_atoms if atoms is None else len(atoms)
+        coords = np.empty((len(frames), n_atoms, 3), dtype=np.float32)
+        dtype = np.dtype(self.endian + 'f4')
+        subset = subset_runs(atoms, self.n_atoms)
+        with open(self.path, 'rb') as dcd:
+            for i, frame in enumerate(frames):
+                if subset:
+                    # the X, Y and Z blocks are records of n_atoms floats, only the runs of selected atoms are read
+                    runs, positions = subset
+                    for axis in range(3):
+                        offset = self.frame_offset(frame) + self.box_size + axis * (4 * self.n_atoms + 8) + 4
+                        coords[i, :, axis] = np.frombuffer(read_runs(dcd, offset, runs, 4), dtype=dtype)[positions]
+                    continue
+                dcd.seek(self.frame_offset(frame) + self.box_size)
+                xyz = np.frombuffer(dcd.read(3 * (4 * self.n_atoms + 8)), dtype=dtype).reshape(3, self.n_atoms + 2)[:, 1:-1]
+                coords[i] = (xyz if atoms is None else xyz[:, atoms]).T
+        return coords
+
+    def iter_chunks(self, chunk_size, atoms=None):
+        """ Yields (first_frame, coordinates) chunks of at most chunk_size frames """
+        for start in range(0, self.n_frames, chunk_size):
+            frames = range(start, min(start + chunk_size, self.n_frames))
+            yield start, self.read_frames(frames, atoms)
+
+
+class XTCIndex:
+    """ Indexes GROMACS XTC trajectories reading only the frame headers, the coordinates are not decompressed """
+
+    MAGIC = 1995
+    # large systems store the size of the compressed coordinates as a 64 bits integer
+    MAGIC_LARGE = 2023
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.offsets = []
+        self.sizes = []
+        self.times = []
+        self.steps = []
+        self.n_atoms = None
+        self._scan()
+
+    def _scan(self):
+        """ Builds the frame offset index jumping over the compressed coordinates of every frame """
+        file_size = Path(self.path).stat().st_size
+        with open(self.path, 'rb') as xtc:
+            offset = 0
+            while offset < file_size:
+                xtc.seek(offset)
+                raw = xtc.read(56)
+                if len(raw) < 56:
+                    break
+                magic, natoms, step, time = struct.unpack('>iiif', raw[:16])
+                if magic not in (self.MAGIC, self.MAGIC_LARGE):
+                    raise ValueError('%s: Wrong XTC magic number %d' % (self.path, magic))
+                if natoms <= 9:
+                    size = 56 + natoms * 12
+                elif magic == self.MAGIC_LARGE:
+                    xtc.seek(offset + 88)
+                    nbytes = struct.unpack('>q', xtc.read(8))[0]
+                    size = 96 + nbytes + (-nbytes % 4)
+                else:
+                    xtc.seek(offset + 88)
+                    nbytes = struct.unpack('>i', xtc.read(4))[0]
+                    size = 92 + nbytes + (-nbytes % 4)
+                # truncated last frame (ie: the simulation is still running)
+                if offset + size > file_size:
+                    break
+                if self.n_atoms is None:
+                    self.n_atoms = natoms
+                self.offsets.append(offset)
+                self.sizes.append(size)
+                self.times.append(time)
+                self.steps.append(step)
+                offset += size
+        self.n_atoms = self.n_atoms or 0
+
+    @property
+    def n_frames(self):
+        return len(self.offsets)
+
+
+class NetCDFReader:
+    """ Reads AMBER NetCDF trajectories, the coordinates of a frame are a hyperslab of the coordinates record variable """
+
+    def __init__(self, path):
+        from biobb_analysis.native.metadata import NetCDFHeader
+        self.path = str(path)
+        self.header = NetCDFHeader(path)
+        if 'coordinates' not in self.header.vars or not self.header.vars['coordinates']['record']:
+            raise ValueError('%s: No coordinates in the NetCDF trajectory' % self.path)
+        self.n_atoms = self.header.dim('atom')
+        self.n_frames = self.header.n_records or 0
+        self.itemsize = self.header.TYPE_SIZES[self.header.vars['coordinates']['type']]
+        self.dtype = np.dtype('>f8' if self.itemsize == 8 else '>f4')
+        self.times = list(self.read_times()) if 'time' in self.header.vars else None
+
+    def read_times(self):
+        var = self.header.vars['time']
+        with open(self.path, 'rb') as netcdf:
+            for frame in range(self.n_frames):
+                yield struct.unpack('>f', _read_at(netcdf, var['begin'] + frame * self.header.record_size, 4))[0]
+
+    def frame_offset(self, frame):
+        """ Returns the position of the coordinates of the given frame in the file """
+        return self.header.vars['coordinates']['begin'] + frame * self.header.record_size
+
+    def read_frames(self, frames=None, atoms=None):
+        """ Returns the coordinates (Angstroms) of the given frames and atoms as a float32 array """
+        frames = range(self.n_frames) if frames is None else frames
+        n_atoms = self.n_atoms if atoms is None else len(atoms)
+        coords = np.empty((len(frames), n_atoms, 3), dtype=np.float32)
+        subset = subset_runs(atoms, self.n_atoms)
+        with open(self.path, 'rb') as netcdf:
+            for i, frame in enumerate(frames):
+                if subset:
+                    runs, positions = subset
+                    coords[i] = np.frombuffer(read_runs(netcdf, self.frame_offset(frame), runs, 3 * self.itemsize), dtype=self.dtype).reshape(-1, 3)[positions]
+                    continue
+                xyz = np.frombuffer(_read_at(netcdf, self.frame_offset(frame), self.n_atoms * 3 * self.itemsize), dtype=self.dtype).reshape(self.n_atoms, 3)
+                coords[i] = xyz if atoms is None else xyz[atoms]
+        return coords
+
+    def iter_chunks(self, chunk_size, atoms=None):
+        """ Yields (first_frame, coordinates) chunks of at most chunk_size frames """
+        for start in range(0, self.n_frames, chunk_size):
+            frames = range(start, min(start + chunk_size, self.n_frames))
+            yield start, self.read_frames(frames, atoms)
+
+
+def netcdf_frames(path):
+    """ Returns the number of records (frames) of a classic NetCDF file reading only its first bytes """
+    with open(path, 'rb') as netcdf:
+        raw = netcdf.read(12)
+    if len(raw) < 8 or raw[:3] != b'CDF':
+        return None
+    numrecs = struct.unpack('>q', raw[4:12])[0] if raw[3] == 5 else struct.unpack('>i', raw[4:8])[0]
+    # streaming files do not store the number of records
+    return None if numrecs < 0 else numrecs
+
+
+def open_trajectory(path):
+    """ Returns a native reader for the given trajectory according to its extension """
+    readers = {
+        'trr': TRRReader,
+        'dcd': DCDReader,
+        'nc': NetCDFReader,
+        'netcdf': NetCDFReader,
+        'cdf': NetCDFReader
+    }
+    ext = PurePath(path).suffix[1:].lower()
+    if ext not in readers:
+        raise ValueError('Format %s is not supported by the native engine' % ext)
+    return readers[ext](path)
+
+
+def is_native_trajectory(ext):
+    """ Checks if trajectory format can be read by the native engine """
+    formats = ['trr', 'dcd', 'nc', 'netcdf', 'cdf']
+    return ext in formats
+
+
+def count_frames(path):
+    """ Returns the number of frames of a trajectory reading only its headers, or None if it can not be known this way """
+    ext = PurePath(path).suffix[1:].lower()
+    try:
+        if ext in ('nc', 'netcdf', 'cdf'):
+            return netcdf_frames(path)
+        if ext == 'xtc':
+            return XTCIndex(path).n_frames
+        if is_native_trajectory(ext):
+            return open_trajectory(path).n_frames
+    except (OSError, ValueError, struct.error):
+        return None
+    return None
+
+
+def frame_times(path):
+    """ Returns the time of every frame of a GROMACS trajectory reading only its headers, or None if it can not be known this way """
+    ext = PurePath(path).suffix[1:].lower()
+    try:
+        if ext == 'xtc':
+            return XTCIndex(path).times
+        if ext == 'trr':
+            return TRRReader(path).times
+    except (OSError, ValueError, struct.error):
+        return None
+    return None
+
+
+def read_pdb_models(path):
+    """ Returns the list of models (list of ATOM/HETATM/TER lines) of a multi-model PDB file """
+    models, current = [], []
+    with open(path) as pdb:
+        for line in pdb:
+            if line.startswith(('ATOM', 'HETATM', 'TER')):
+                current.append(line)
+            elif line.startswith('ENDMDL') and current:
+                models.append(current)
+                current = []
+    if current:
+        models.append(current)
+    return models
+
+
+def write_pdb_models(models, path, title=None):
+    """ Writes the given models as a multi-model PDB file """
+    with open(path, 'w') as pdb:
+        if title:
+            pdb.write('TITLE     %s\n' % title)
+        for i, model in enumerate(models, 1):
+            pdb.write('MODEL %8d\n' % i)
+            pdb.writelines(model)
+            pdb.write('ENDMDL\n')
+        pdb.write('END\n')
+    return path
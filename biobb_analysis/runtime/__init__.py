@@ -0,0 +1,2 @@
+name = "runtime"
+__all__ = ["incremental", "checkpoint", "pipeline", "containers", "workflow"]
\ No newline at end of file
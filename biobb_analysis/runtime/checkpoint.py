@@ -0,0 +1,67 @@
+""" Chunk checkpointing of long-running analyses for package biobb_analysis.runtime """
+from pathlib import Path
+import os
+import shutil
+from biobb_analysis.native.cache import file_signature, read_json, write_json, store_file
+
+
+def checkpoint_dir(output_path):
+    """ Returns the folder where the committed chunks of an output are kept """
+    return Path(str(output_path) + '.ckpt')
+
+
+def chunk_ranges(start, last, step, chunk_size):
+    """ Returns the (first, last) frames of every chunk of chunk_size frames between start and last """
+    ranges = []
+    for first in range(start, last + 1, chunk_size * step):
+        ranges.append((first, min(first + (chunk_size - 1) * step, last)))
+    return ranges
+
+
+def load_manifest(output_path, params, input_path):
+    """ Returns the manifest of the checkpoint of an output. Checkpoints of a different input file
+    or different parameters are discarded """
+    folder = checkpoint_dir(output_path)
+    signature = file_signature(input_path)[1:]
+    manifest = read_json(folder.joinpath('manifest.json'))
+    if manifest and (manifest.get('params') != params or manifest.get('input') != signature):
+        shutil.rmtree(folder, ignore_errors=True)
+        manifest = None
+    if not manifest:
+        folder.mkdir(parents=True, exist_ok=True)
+        manifest = dict(params=params, input=signature, chunks={})
+        write_json(manifest, folder.joinpath('manifest.json'))
+    return manifest
+
+
+def committed_chunk(output_path, manifest, index):
+    """ Returns the path of a committed chunk or None if it has to be computed """
+    chunk = manifest['chunks'].get(str(index))
+    if chunk and checkpoint_dir(output_path).joinpath(chunk['file']).exists():
+        return str(checkpoint_dir(output_path).joinpath(chunk['file']))
+    return None
+
+
+def commit_chunk(output_path, manifest, index, chunk_path, first, last):
+    """ Atomically moves a finished chunk to the checkpoint folder and records it in the manifest """
+    folder = checkpoint_dir(output_path)
+    name = 'chunk_%05d%s' % (index, Path(chunk_path).suffix)
+    tmp_path = folder.joinpath('%s.%d.tmp' % (name, os.getpid()))
+    try:
+        os.replace(chunk_path, tmp_path)
+    except OSError:
+        # different file systems
+        store_file(chunk_path, tmp_path)
+    os.replace(tmp_path, folder.joinpath(name))
+    manifest['chunks'][str(index)] = dict(file=name, first=first, last=last)
+    write_json(manifest, folder.joinpath('manifest.json'))
+    return str(folder.joinpath(name))
+
+
+def link_file(src, dest):
+    """ Hard links src to dest, copying it if it is not possible """
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+    return str(dest)
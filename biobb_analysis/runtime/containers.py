@@ -0,0 +1,254 @@
+""" Pool of warm containers for package biobb_analysis.runtime
+
+The biobb blocks launch every command with a fresh ``docker run`` or ``singularity exec``. Setting the
+**container_path** property of any block to ``biobb_analysis_pool_docker`` or ``biobb_analysis_pool_singularity``
+runs the command with ``exec`` inside a long-running container of the pool instead. Every container of the pool has
+its own host folder mounted on the container volume path, the staged files of the block are moved to this folder
+during the execution. The pool is configured with environment variables:
+
+    * BIOBB_POOL_DIR: folder of the pool state and of the host folders of the containers (~/.biobb_analysis_pool).
+    * BIOBB_POOL_SIZE: maximum number of containers per image and volume path (2).
+    * BIOBB_POOL_MAX_JOBS: number of executions after which a container is recycled (100).
+    * BIOBB_POOL_IDLE_TIMEOUT: seconds after which an unused container is stopped (600).
+    * BIOBB_POOL_RUNTIME: path to the docker or singularity executable binary.
+
+The idle containers are stopped whenever a container is acquired or released. When no more blocks run, the
+``biobb_analysis_pool_docker reap`` command (ie: from cron or at the end of a workflow) stops the containers idle for
+longer than the timeout, and ``biobb_analysis_pool_docker shutdown`` stops all of them. Any other command than run or
+exec (ie: the ``singularity pull`` of the remote images) is passed to the runtime binary.
+"""
+from pathlib import Path
+import fcntl
+import os
+import shutil
+import subprocess
+import sys
+import time
+import uuid
+from biobb_analysis.native.cache import read_json, write_json
+
+
+class DockerRuntime:
+    """ Starts long-running Docker containers and runs commands inside them """
+
+    def __init__(self, binary_path='docker'):
+        self.binary_path = binary_path
+
+    def start(self, image, host_dir, volume_path):
+        """ Starts a container that does nothing until it is stopped, returns its id """
+        cmd = [self.binary_path, 'run', '-d', '-v', '%s:%s' % (host_dir, volume_path), '--entrypoint', 'tail', image, '-f', '/dev/null']
+        return subprocess.run(cmd, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+
+    def exec(self, container_id, cmd, user=None, working_dir=None):
+        """ Runs cmd inside the container and returns its exit code """
+        # -i forwards the standard input of the block (ie: the piped cpptraj instructions)
+        exec_cmd = [self.binary_path, 'exec', '-i']
+        if user:
+            exec_cmd.extend(['-u', user])
+        if working_dir:
+            exec_cmd.extend(['-w', working_dir])
+        return subprocess.call(exec_cmd + [container_id] + cmd)
+
+    def stop(self, container_id):
+        """ Stops and removes the container """
+        subprocess.call([self.binary_path, 'rm', '-f', container_id], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class SingularityRuntime:
+    """ Starts Singularity instances and runs commands inside them """
+
+    def __init__(self, binary_path='singularity'):
+        self.binary_path = binary_path
+
+    def start(self, image, host_dir, volume_path):
+        """ Starts an instance, returns its name """
+        name = 'biobb_%s' % uuid.uuid4().hex[:12]
+        subprocess.run([self.binary_path, 'instance', 'start', '--bind', '%s:%s' % (host_dir, volume_path), image, name], check=True)
+        return name
+
+    def exec(self, container_id, cmd, user=None, working_dir=None):
+        """ Runs cmd inside the instance and returns its exit code, instances always run as the current user """
+        exec_cmd = [self.binary_path, 'exec', '-e']
+        if working_dir:
+            exec_cmd.extend(['--pwd', working_dir])
+        return subprocess.call(exec_cmd + ['instance://' + container_id] + cmd)
+
+    def stop(self, container_id):
+        """ Stops the instance """
+        subprocess.call([self.binary_path, 'instance', 'stop', container_id], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def move_contents(src_dir, dest_dir):
+    """ Moves every file and folder of src_dir to dest_dir """
+    for path in Path(src_dir).iterdir():
+        shutil.move(str(path), str(Path(dest_dir).joinpath(path.name)))
+
+
+def is_alive(pid):
+    """ Checks if a process exists """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ContainerPool:
+    """ Keeps up to size warm containers per image and volume path. The state is kept in pool_dir and shared
+    by all the processes using the same pool_dir, every container runs one command at a time """
+
+    def __init__(self, runtime, pool_dir, size=2, max_jobs=100, idle_timeout=600, poll_interval=0.2):
+        self.runtime = runtime
+        self.pool_dir = Path(pool_dir)
+        self.size = size
+        self.max_jobs = max_jobs
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.pool_dir.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.pool_dir.joinpath('pool.json')
+
+    def _locked(self, update):
+        """ Applies update to the containers of the state holding the pool lock, returns its result """
+        with open(self.pool_dir.joinpath('pool.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                containers = (read_json(self.state_path) or {}).get('containers', [])
+                result = update(containers)
+                write_json({'containers': containers}, self.state_path)
+                return result
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _stop(self, container):
+        self.runtime.stop(container['id'])
+        shutil.rmtree(container['host_dir'], ignore_errors=True)
+
+    def _reap(self, containers):
+        """ Stops the idle containers and the ones left busy by processes that do not exist anymore """
+        now = time.time()
+        for container in list(containers):
+            if container['busy'] and is_alive(container['busy']):
+                continue
+            if container['busy'] or now - container['last_used'] > self.idle_timeout:
+                self._stop(container)
+                containers.remove(container)
+
+    def acquire(self, image, volume_path):
+        """ Returns a container of the pool for the image and volume path, starting it if needed """
+        key = [image, volume_path]
+
+        def take(containers):
+            self._reap(containers)
+            same = [c for c in containers if c['key'] == key]
+            free = [c for c in same if not c['busy']]
+            if free:
+                container = free[0]
+            elif len(same) < self.size:
+                host_dir = self.pool_dir.joinpath(uuid.uuid4().hex)
+                host_dir.mkdir()
+                container = dict(key=key, host_dir=str(host_dir), jobs=0, last_used=time.time(),
+                                 id=self.runtime.start(image, str(host_dir), volume_path))
+                containers.append(container)
+            else:
+                return None
+            container['busy'] = os.getpid()
+            return dict(container)
+
+        while True:
+            container = self._locked(take)
+            if container:
+                return container
+            time.sleep(self.poll_interval)
+
+    def release(self, container):
+        """ Returns a container to the pool, recycling it if it has run max_jobs commands """
+        def give_back(containers):
+            for c in containers:
+                if c['id'] == container['id']:
+                    c['busy'], c['jobs'], c['last_used'] = None, c['jobs'] + 1, time.time()
+                    if c['jobs'] >= self.max_jobs:
+                        self._stop(c)
+                        containers.remove(c)
+                    break
+            self._reap(containers)
+        self._locked(give_back)
+
+    def reap(self):
+        """ Stops the containers idle for longer than idle_timeout and the ones left busy by dead processes """
+        self._locked(self._reap)
+
+    def run(self, image, host_volume, volume_path, cmd, user=None, working_dir=None):
+        """ Runs cmd in a warm container with the contents of host_volume available in volume_path, returns its exit code """
+        container = self.acquire(image, volume_path)
+        try:
+            move_contents(host_volume, container['host_dir'])
+            try:
+                return self.runtime.exec(container['id'], cmd, user, working_dir)
+            finally:
+                move_contents(container['host_dir'], host_volume)
+        finally:
+            self.release(container)
+
+    def shutdown(self):
+        """ Stops all the containers of the pool """
+        def stop_all(containers):
+            for container in containers:
+                self._stop(container)
+            containers.clear()
+        self._locked(stop_all)
+
+
+def parse_run_args(args):
+    """ Returns the image, host volume, volume path, user, working dir and command of the docker/singularity
+    arguments built by the biobb blocks (after the generic command) """
+    options = {'-v': 'volume', '--bind': 'volume', '-B': 'volume', '--user': 'user', '-u': 'user', '-w': 'working_dir', '--pwd': 'working_dir'}
+    parsed = dict(volume=None, user=None, working_dir=None)
+    i = 0
+    while i < len(args) and args[i].startswith('-'):
+        if args[i] in options:
+            # the first volume is the staging folder
+            parsed[options[args[i]]] = parsed[options[args[i]]] or args[i + 1]
+            i += 2
+        else:
+            # flags without value (ie: -e)
+            i += 1
+    if i >= len(args) or not parsed['volume']:
+        raise ValueError('No image or volume in the container arguments: %s' % ' '.join(args))
+    host_volume, volume_path = parsed['volume'].split(':')[:2]
+    return args[i], host_volume, volume_path, parsed['user'], parsed['working_dir'], args[i + 1:]
+
+
+def get_pool(runtime_name):
+    """ Returns the pool configured by the environment variables """
+    runtimes = {'docker': DockerRuntime, 'singularity': SingularityRuntime}
+    runtime = runtimes[runtime_name](os.environ.get('BIOBB_POOL_RUNTIME', runtime_name))
+    pool_dir = os.environ.get('BIOBB_POOL_DIR', str(Path.home().joinpath('.biobb_analysis_pool', runtime_name)))
+    return ContainerPool(runtime, pool_dir,
+                         size=int(os.environ.get('BIOBB_POOL_SIZE', 2)),
+                         max_jobs=int(os.environ.get('BIOBB_POOL_MAX_JOBS', 100)),
+                         idle_timeout=float(os.environ.get('BIOBB_POOL_IDLE_TIMEOUT', 600)))
+
+
+def main(argv=None):
+    """ Command line used as container_path of the biobb blocks: biobb_analysis_pool_docker run|exec [options] image cmd,
+    biobb_analysis_pool_docker reap to stop the idle containers or biobb_analysis_pool_docker shutdown to stop all the
+    containers of the pool. Any other command is run by the runtime binary """
+    argv = sys.argv if argv is None else argv
+    runtime_name = 'singularity' if Path(argv[0]).name.endswith('singularity') else 'docker'
+    pool = get_pool(runtime_name)
+    if argv[1:] == ['shutdown']:
+        pool.shutdown()
+        return 0
+    if argv[1:] == ['reap']:
+        pool.reap()
+        return 0
+    if len(argv) < 2 or argv[1] not in ('run', 'exec'):
+        return subprocess.call([pool.runtime.binary_path] + argv[1:])
+    image, host_volume, volume_path, user, working_dir, cmd = parse_run_args(argv[2:])
+    return pool.run(image, host_volume, volume_path, cmd, user, working_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+""" Incremental analysis of growing trajectories for package biobb_analysis.runtime """
+from pathlib import Path, PurePath
+import hashlib
+import math
+import os
+import re
+from biobb_common.tools import file_utils as fu
+from biobb_analysis.native.cache import read_json, write_json
+
+# bytes of the beginning of the input hashed to recognize it when the native readers can not read its first frame
+SIGNATURE_BYTES = 4096
+
+
+def get_incremental(properties, out_log, classname):
+    """ Gets the incremental property of a block """
+    incremental = properties.get('incremental', False)
+    if incremental not in [True, False]:
+        fu.log(classname + ': Incorrect incremental provided, exiting', out_log)
+        raise SystemExit(classname + ': Incorrect incremental provided')
+    return incremental
+
+
+def state_path(output_path):
+    """ Returns the path of the state file of an output """
+    return str(output_path) + '.state.json'
+
+
+def input_signature(input_path, size=SIGNATURE_BYTES):
+    """ Returns a hash of the beginning of the input, that does not change when frames are appended to it: the
+    coordinates of the first frame of the trajectories read by the native engine (their headers store the number
+    of frames), or the first size bytes of any other file """
+    from biobb_analysis.native.trajectory import is_native_trajectory, open_trajectory
+    if is_native_trajectory(Path(input_path).suffix[1:].lower()):
+        try:
+            reader = open_trajectory(input_path)
+            if reader.n_frames:
+                return hashlib.sha1(reader.read_frames([0]).tobytes()).hexdigest()
+        except Exception:
+            pass
+    with open(input_path, 'rb') as input_file:
+        return hashlib.sha1(input_file.read(size)).hexdigest()
+
+
+def partial_output_name(output_path):
+    """ Returns the file name of the output of the new frames, different from the staged output so copying the
+    outputs of a container to the host does not overwrite the previous output with it """
+    return 'incremental_' + PurePath(output_path).name
+
+
+def load_state(output_path, params, input_path):
+    """ Returns the state of the previous execution, or None if the output has to be computed from scratch
+    (no previous execution, different parameters, input file replaced by a smaller one or by a different one) """
+    state = read_json(state_path(output_path))
+    if not state or not Path(output_path).exists():
+        return None
+    if state.get('params') != params or os.path.getsize(input_path) < state.get('input_size', 0):
+        return None
+    # only the bytes that were already in the input when the state was saved
+    if state.get('input_signature') != input_signature(input_path, min(SIGNATURE_BYTES, state.get('input_size', 0))):
+        return None
+    return state
+
+
+def save_state(output_path, params, input_path, rows, accumulators, **kwargs):
+    """ Saves the state after processing the input, kwargs are stored as they are (ie: last_frame, last_time) """
+    state = dict(params=params, input_size=os.path.getsize(input_path), input_signature=input_signature(input_path),
+                 rows=rows, accumulators=accumulators, **kwargs)
+    return write_json(state, state_path(output_path))
+
+
+def read_rows(path):
+    """ Returns the header lines and the data lines of a .dat or .xvg file """
+    header, rows = [], []
+    with open(path) as data_file:
+        for line in data_file:
+            if line.startswith(('#', '@')):
+                header.append(line)
+            elif line.strip():
+                rows.append(line)
+    return header, rows
+
+
+def renumber(line, number):
+    """ Replaces the first column (frame number) of a data line keeping its width """
+    match = re.match(r'\s*\S+', line)
+    return str(number).rjust(match.end()) + line[match.end():]
+
+
+def append_rows(output_path, rows):
+    """ Appends data lines to an output """
+    with open(output_path, 'a') as data_file:
+        data_file.writelines(rows)
+
+
+def update_accumulators(accumulators, rows):
+    """ Updates the count, sum and sum of squares of every value column (all but the first one) with the given rows """
+    for line in rows:
+        values = [float(v) for v in line.split()[1:]]
+        if not accumulators:
+            accumulators = {'n': 0, 'sum': [0.0] * len(values), 'sumsq': [0.0] * len(values)}
+        accumulators['n'] += 1
+        for i, value in enumerate(values[:len(accumulators['sum'])]):
+            accumulators['sum'][i] += value
+            accumulators['sumsq'][i] += value * value
+    return accumulators
+
+
+def averages(accumulators):
+    """ Returns the (average, standard deviation) of every value column """
+    if not accumulators or not accumulators['n']:
+        return []
+    n = accumulators['n']
+    return [(s / n, math.sqrt(max(sq / n - (s / n) ** 2, 0.0))) for s, sq in zip(accumulators['sum'], accumulators['sumsq'])]
@@ -0,0 +1,64 @@
+""" MPI launcher of the cpptraj commands for package biobb_analysis.runtime
+
+cpptraj.MPI divides the frames of the input trajectories across the MPI ranks, but only some actions give the same
+results than the serial cpptraj when the frames are divided. The instructions are checked against the actions known
+to be MPI-safe and the command is run serially if any of them is not. """
+from pathlib import PurePath
+import shutil
+
+# first word of the cpptraj instructions that are MPI-safe (setup commands and frame-parallel actions)
+MPI_SAFE_COMMANDS = ['parm', 'parmstrip', 'trajin', 'reference', 'readdata', 'strip', 'autoimage', 'image', 'center',
+                     'rms', 'rmsd', 'radgyr', 'average', 'atomicfluct', 'distance', 'angle', 'dihedral', 'trajout',
+                     'run', 'go', 'quit']
+# trajectory formats cpptraj.MPI can write in parallel
+MPI_TRAJOUT_FORMATS = ['netcdf', 'nc', 'cdf', 'dcd', 'charmm', 'crd', 'mdcrd']
+# option setting the number of ranks of the launchers that do not take -np (mpirun and mpiexec)
+RANKS_FLAGS = {'srun': '-n', 'aprun': '-n'}
+
+
+def unsafe_instructions(instructions):
+    """ Returns the cpptraj instructions (text or list of lines) that can not be divided across MPI ranks """
+    lines = instructions.splitlines() if isinstance(instructions, str) else instructions
+    unsafe = []
+    for line in lines:
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        if words[0] not in MPI_SAFE_COMMANDS:
+            unsafe.append(line.strip())
+        elif words[0] == 'trajout' and not trajout_format(words) in MPI_TRAJOUT_FORMATS:
+            unsafe.append(line.strip())
+        elif words[0] == 'trajout' and ('onlyframes' in words or 'multi' in words):
+            unsafe.append(line.strip())
+    return unsafe
+
+
+def trajout_format(words):
+    """ Returns the format of a trajout instruction: its keyword or the extension of the output """
+    formats = [word for word in words[2:] if word in MPI_TRAJOUT_FORMATS + ['pdb', 'mol2', 'trr', 'xtc', 'gro', 'binpos', 'cif', 'restart', 'ncrestart']]
+    if formats:
+        return formats[0]
+    return words[1].rsplit('.', 1)[-1].lower() if '.' in words[1] else None
+
+
+def ranks_flag(mpi_launcher):
+    """ Returns the option of the launcher setting the number of ranks """
+    return RANKS_FLAGS.get(PurePath(mpi_launcher.split()[0]).name, '-np')
+
+
+def launcher_cmd(cmd, mpi_ranks, mpi_launcher='mpirun', mpi_binary_path='cpptraj.MPI'):
+    """ Returns the MPI command line of a serial cpptraj command line: mpirun -np N cpptraj.MPI [arguments] """
+    return mpi_launcher.split() + [ranks_flag(mpi_launcher), str(mpi_ranks), mpi_binary_path] + cmd[1:]
+
+
+def mpi_fallback_reason(instructions, mpi_launcher, stdin_pipe=False, container_path=None):
+    """ Returns why the instructions can not be run with MPI, or None if they can """
+    unsafe = unsafe_instructions(instructions)
+    if unsafe:
+        return 'the instructions %s are not MPI-safe' % ', '.join("'%s'" % line for line in unsafe)
+    if stdin_pipe:
+        return 'the instructions are sent through a pipe'
+    # inside a container the launcher is looked for in the image
+    if not container_path and not shutil.which(mpi_launcher.split()[0]):
+        return 'the MPI launcher %s is not found' % mpi_launcher.split()[0]
+    return None
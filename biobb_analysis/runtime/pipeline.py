@@ -0,0 +1,229 @@
+""" Chaining of Cpptraj blocks in a single execution for package biobb_analysis.runtime """
+from pathlib import Path, PurePath
+import copy
+from biobb_analysis.runtime.staging import StagingBiobbObject
+from biobb_common.tools import file_utils as fu
+from biobb_common.tools.file_utils import launchlogger
+from biobb_analysis.ambertools.common import get_binary_path, get_launcher_cmd
+
+
+class CpptrajPipeline(StagingBiobbObject):
+    """
+    | biobb_analysis CpptrajPipeline
+    | Runs a linear chain of Cpptraj blocks (ie: CpptrajStrip, CpptrajImage and CpptrajRms) in a single cpptraj execution.
+    | Every block after the first one reads the trajectory written by the previous block. The instructions of the blocks are joined so the frames go through the actions of all of them in memory: the intermediate trajectories are never written and the topology modified by the previous actions (ie: strip) is used instead of the topology of the block. When the blocks can not be joined (slicing or incremental mode out of the first block, or average references) they are launched one after the other.
+    | With the **branches** property the blocks are independent analyses of the same topology and trajectory (ie: CpptrajRgyr and CpptrajRms), the trajectory is read once and every frame goes through the actions of every block, restoring the original topology and coordinates (unstrip) before the actions of the next block.
+
+    Args:
+        blocks (list): Cpptraj blocks in execution order, already constructed and not launched.
+        properties (dic - Python dictionary object containing the tool parameters, not input/output files):
+            * **branches** (*bool*) - (False) The blocks read the same topology and trajectory with the same slicing instead of the output of the previous block.
+            * **binary_path** (*str*) - ("cpptraj") Path to the cpptraj executable binary.
+            * **mpi_ranks** (*int*) - (1) [1~1024|1] Number of MPI ranks. With more than one, **mpi_binary_path** is launched with **mpi_launcher** and the frames are divided across the ranks if all the cpptraj actions are MPI-safe, cpptraj runs serially otherwise.
+            * **mpi_launcher** (*str*) - ("mpirun") MPI launcher command. The number of ranks is given with -n to srun and aprun and with -np to any other launcher.
+            * **mpi_binary_path** (*str*) - ("cpptraj.MPI") Path to the MPI build of cpptraj.
+            * **omp_threads** (*int*) - (None) [1~256|1] Number of OpenMP threads of cpptraj (OMP_NUM_THREADS).
+            * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
+            * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **stdin_pipe** (*bool*) - (False) Send the cpptraj instructions to the standard input of the command through a pipe instead of writing them to a temporary file.
+            * **progress** (*bool*) - (False) Report the progress of the command while it runs (frames processed, frames per second and estimated time left) in the log every **progress_interval** seconds. From Python, a **progress_callback** function receiving the progress events can also be given.
+            * **progress_interval** (*float*) - (10.0) [1~3600|1] Seconds between progress reports.
+            * **container_path** (*str*) - (None) Container path definition.
+            * **container_image** (*str*) - ('afandiadib/ambertools:serial') Container image definition.
+            * **container_volume_path** (*str*) - ('/tmp') Container volume path definition.
+            * **container_working_dir** (*str*) - (None) Container working directory definition.
+            * **container_user_id** (*str*) - (None) Container user_id definition.
+            * **container_shell_path** (*str*) - ('/bin/bash') Path to default shell inside the container.
+            * **container_staging** (*str*) - ("copy") Container staging of the input files. Values: copy (copy the inputs to a folder mounted in **container_volume_path**), bind (mount the folders of the inputs read-only in the container and hard link the outputs to their final path).
+
+    Examples:
+        This is a use example of how to use the pipeline from Python::
+
+            from biobb_analysis.ambertools.cpptraj_strip import CpptrajStrip
+            from biobb_analysis.ambertools.cpptraj_image import CpptrajImage
+            from biobb_analysis.ambertools.cpptraj_rms import CpptrajRms
+            from biobb_analysis.runtime.pipeline import cpptraj_pipeline
+            blocks = [
+                CpptrajStrip(input_top_path='/path/to/myTopology.top',
+                            input_traj_path='/path/to/myTrajectory.dcd',
+                            output_cpptraj_path='/path/to/stripped.netcdf',
+                            properties={ 'mask': 'solute' }),
+                CpptrajImage(input_top_path='/path/to/myStrippedTopology.top',
+                            input_traj_path='/path/to/stripped.netcdf',
+                            output_cpptraj_path='/path/to/imaged.netcdf'),
+                CpptrajRms(input_top_path='/path/to/myStrippedTopology.top',
+                            input_traj_path='/path/to/imaged.netcdf',
+                            output_cpptraj_path='/path/to/rms.dat',
+                            properties={ 'mask': 'c-alpha', 'reference': 'first' })
+            ]
+            cpptraj_pipeline(blocks=blocks)
+
+    """
+
+    def __init__(self, blocks, properties=None, **kwargs) -> None:
+        properties = properties or {}
+
+        # Call parent class constructor
+        super().__init__(properties)
+        self.locals_var_dict = locals().copy()
+
+        self.blocks = blocks
+        self.branches = properties.get('branches', False)
+        self.chained = [None] * len(blocks) if self.branches else self.get_chained_outputs()
+
+        # Input/Output files, the intermediate trajectories are neither inputs nor outputs of the pipeline
+        self.io_dict = {"in": {}, "out": {}}
+        shared = ('input_traj_path', 'input_top_path') if self.branches else ('input_traj_path',)
+        for i, block in enumerate(self.blocks):
+            for key, path in block.io_dict["in"].items():
+                if path and not (i and key in shared):
+                    self.io_dict["in"]['%d_%s' % (i, key)] = path
+            for key, path in block.io_dict["out"].items():
+                if path and key != self.chained[i]:
+                    self.io_dict["out"]['%d_%s' % (i, key)] = path
+
+        # Properties common in all Cpptraj BB
+        self.properties = properties
+        self.binary_path = get_binary_path(properties, 'binary_path')
+        self.mpi_ranks = properties.get('mpi_ranks', 1)
+        self.mpi_launcher = properties.get('mpi_launcher', 'mpirun')
+        self.mpi_binary_path = properties.get('mpi_binary_path', 'cpptraj.MPI')
+        self.omp_threads = properties.get('omp_threads', None)
+
+        # Check the properties
+        self.check_properties(properties)
+
+    def get_chained_outputs(self):
+        """ Returns, for every block, the key of the output read by the next block (None for the last block) """
+        chained = []
+        for block, next_block in zip(self.blocks, self.blocks[1:]):
+            next_input = Path(next_block.io_dict["in"]["input_traj_path"]).resolve()
+            keys = [key for key, path in block.io_dict["out"].items() if path and Path(path).resolve() == next_input]
+            if not keys:
+                fu.log(self.__class__.__name__ + ': %s does not read the output of %s, exiting' % (next_block.__class__.__name__, block.__class__.__name__), self.out_log)
+                raise SystemExit(self.__class__.__name__ + ': %s does not read the output of %s' % (next_block.__class__.__name__, block.__class__.__name__))
+            chained.append(keys[0])
+        return chained + [None]
+
+    def get_block_instructions(self, i, block):
+        """ Returns the instructions of a block using the staged paths, or None if it can not be joined to the previous blocks """
+        block = copy.deepcopy(block)
+        block.container_path = None
+        # the intermediate trajectory does not exist, the input of the pipeline is checked instead and its trajin discarded
+        if i:
+            block.io_dict["in"]["input_traj_path"] = self.blocks[0].io_dict["in"]["input_traj_path"]
+        if getattr(block, 'incremental', False):
+            fu.log('%s in incremental mode can not be chained' % block.__class__.__name__, self.out_log)
+            return None
+        block.check_data_params(self.out_log, self.err_log)
+        # planning must not run cpptraj nor create folders: no prelude artifact nor cache of the average frames in the copy
+        block.prelude_cache_dir = None
+        if hasattr(block, 'average_cache'):
+            block.average_cache = 'none'
+        block.tmp_files = []
+
+        # staged paths of the block
+        intermediate = '%d_intermediate' % i
+        container_io_dict = {"in": {}, "out": {}}
+        for key, path in block.io_dict["in"].items():
+            if path:
+                container_io_dict["in"][key] = self.stage_io_dict["in"].get('%d_%s' % (i, key), path)
+        if i:
+            container_io_dict["in"]["input_traj_path"] = self.stage_io_dict["in"]["0_input_traj_path"]
+        if i and self.branches:
+            container_io_dict["in"]["input_top_path"] = self.stage_io_dict["in"]["0_input_top_path"]
+        for key, path in block.io_dict["out"].items():
+            if path:
+                container_io_dict["out"][key] = self.stage_io_dict["out"].get('%d_%s' % (i, key), intermediate)
+
+        # the instructions of the block are kept in memory
+        block.stdin_pipe = True
+        try:
+            block.create_instructions_file(container_io_dict, self.out_log, self.err_log)
+        finally:
+            fu.rm_file_list(block.tmp_files)
+        lines = [line.strip() for line in block.stdin_text.splitlines() if line.strip()]
+
+        if any(line.split()[0] == 'run' for line in lines):
+            fu.log('%s needs more than one pass over the trajectory and can not be chained' % block.__class__.__name__, self.out_log)
+            return None
+        if i and self.branches:
+            first = self.blocks[0]
+            same_inputs = all(Path(self.blocks[i].io_dict["in"][key]).resolve() == Path(first.io_dict["in"][key]).resolve() for key in ('input_top_path', 'input_traj_path'))
+            if not same_inputs or self.first_lines[:2] != lines[:2] or [line.split()[0] for line in lines[:2]] != ['parm', 'trajin']:
+                fu.log('%s does not read the same topology and frames than %s and can not be joined' % (block.__class__.__name__, first.__class__.__name__), self.out_log)
+                return None
+            # every block starts from the frames read from the trajectory
+            return ['unstrip'] + lines[2:]
+        if i:
+            trajin = [line for line in lines if line.split()[0] == 'trajin']
+            if len(trajin) != 1 or trajin[0].split()[2:] not in ([], ['1', '-1', '1']):
+                fu.log('%s slices the trajectory and can not be chained' % block.__class__.__name__, self.out_log)
+                return None
+            # the topology and the frames come from the previous block
+            lines.remove([line for line in lines if line.split()[0] == 'parm'][0])
+            lines.remove(trajin[0])
+        if not i:
+            self.first_lines = lines
+        return [line for line in lines if not (line.split()[0] == 'trajout' and line.split()[1] == intermediate)]
+
+    @launchlogger
+    def launch(self) -> int:
+        """Execute the :class:`CpptrajPipeline <runtime.pipeline.CpptrajPipeline>` runtime.pipeline.CpptrajPipeline object."""
+
+        # Setup Biobb
+        if self.check_restart(): return 0
+        self.stage_files()
+
+        instructions_list = []
+        for i, block in enumerate(self.blocks):
+            block_instructions = self.get_block_instructions(i, block)
+            if block_instructions is None:
+                instructions_list = None
+                break
+            instructions_list += block_instructions
+
+        if instructions_list is None:
+            fu.log('Launching the blocks one after the other', self.out_log)
+            self.tmp_files.append(self.stage_io_dict.get("unique_dir"))
+            self.remove_tmp_files()
+            for block in self.blocks:
+                self.return_code = block.launch()
+                if self.return_code:
+                    break
+            return self.return_code
+
+        # create cmd and launch execution
+        if self.stdin_pipe:
+            instructions_dir = None
+            self.stdin_text = ''.join(line + '\n' for line in instructions_list)
+            self.cmd = get_launcher_cmd(self, [self.binary_path], instructions_list)
+        else:
+            # create instructions file, in the staging folder if container execution
+            instructions_dir = self.stage_io_dict.get("unique_dir") or fu.create_unique_dir()
+            instructions_file = str(PurePath(instructions_dir).joinpath('instructions.in'))
+            with open(instructions_file, 'w') as mdp:
+                for line in instructions_list:
+                    mdp.write(line + '\n')
+            if self.container_path:
+                instructions_file = str(PurePath(self.container_volume_path).joinpath('instructions.in'))
+            self.cmd = get_launcher_cmd(self, [self.binary_path, '-i', instructions_file], instructions_list)
+
+        # Run Biobb block
+        self.run_biobb()
+
+        # Copy files to host
+        self.copy_to_host()
+
+        # remove temporary folder(s)
+        self.tmp_files.append(instructions_dir)
+        self.remove_tmp_files()
+
+        return self.return_code
+
+
+def cpptraj_pipeline(blocks: list, properties: dict = None, **kwargs) -> int:
+    """Execute the :class:`CpptrajPipeline <runtime.pipeline.CpptrajPipeline>` class and
+    execute the :meth:`launch() <runtime.pipeline.CpptrajPipeline.launch>` method."""
+
+    return CpptrajPipeline(blocks=blocks, properties=properties, **kwargs).launch()
@@ -0,0 +1,176 @@
+""" Live progress reporting of the cpptraj and GROMACS commands for package biobb_analysis.runtime
+
+The output of the command is read while it runs, the progress lines of cpptraj (trajectory headers, progress bar,
+frames read and throughput) and GROMACS (Reading frame / Last frame) are parsed and progress events are sent to
+a callback and to the log every interval seconds, also when the command does not write anything (stalled jobs). """
+import codecs
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+
+# ----- traj.nc (1-101, 1) -----
+CPPTRAJ_TRAJ = re.compile(r'^-----\s+.+\((\d+)-(\d+),\s*(\d+)\)\s+-----')
+# 0% 10% 20% ... 100% Complete.
+CPPTRAJ_PERCENT = re.compile(r'(?:^|\s)(\d{1,3})%(?=\s)')
+# Read 101 frames and processed 101 frames.
+CPPTRAJ_READ = re.compile(r'Read\s+(\d+)\s+frames\s+and\s+processed\s+(\d+)\s+frames')
+# TIME: Avg. throughput= 3045.1211 frames / second.
+CPPTRAJ_THROUGHPUT = re.compile(r'TIME:\s+Avg\.\s+throughput=\s*([\d.eE+-]+)\s+frames')
+# Reading frame      10 time  100.000 / Last frame        100 time 1000.000
+GMX_FRAME = re.compile(r'(Reading|Last)\s+frame\s+(\d+)\s+time\s+([\d.eE+-]+)')
+
+
+class ProgressParser:
+    """ Parses the output of cpptraj or GROMACS and returns the number of frames processed so far """
+
+    def __init__(self, total=None):
+        self.total = total
+        self.frames = 0
+        self.done = False
+        self.fps = None
+        self.buffers = {}
+        # frames of the previous trajectories and (frames, percent) of the current one (cpptraj)
+        self.offset = 0
+        self.traj_frames = None
+        self.percent = -1
+
+    def feed(self, text, stream='stdout'):
+        """ Parses a chunk of output of the given stream, returns True if the number of frames changed """
+        before = (self.frames, self.done)
+        *lines, self.buffers[stream] = re.split(r'[\r\n]', self.buffers.get(stream, '') + text)
+        for line in lines:
+            self.parse_line(line)
+        # the progress bar of cpptraj is written in a single line and GROMACS ends its lines with the next carriage return
+        self.parse_percent(self.buffers[stream])
+        self.parse_gmx_frame(self.buffers[stream])
+        return (self.frames, self.done) != before
+
+    def parse_line(self, line):
+        match = CPPTRAJ_TRAJ.search(line)
+        if match:
+            start, end, step = [int(group) for group in match.groups()]
+            if self.traj_frames is not None:
+                self.offset += self.traj_frames
+            self.traj_frames, self.percent = len(range(start, end + 1, step)), -1
+            if self.total is None or self.total < self.offset + self.traj_frames:
+                self.total = self.offset + self.traj_frames
+            return
+        self.parse_percent(line)
+        match = CPPTRAJ_READ.search(line)
+        if match:
+            self.frames, self.done = int(match.group(2)), True
+            return
+        match = CPPTRAJ_THROUGHPUT.search(line)
+        if match:
+            self.fps = float(match.group(1))
+            return
+        self.parse_gmx_frame(line)
+
+    def parse_gmx_frame(self, text):
+        match = GMX_FRAME.search(text)
+        if match:
+            self.frames = max(self.frames, int(match.group(2)) + 1)
+            self.done = self.done or match.group(1) == 'Last'
+
+    def parse_percent(self, text):
+        if self.traj_frames is None:
+            return
+        percents = [int(percent) for percent in CPPTRAJ_PERCENT.findall(text)]
+        if percents and max(percents) > self.percent:
+            self.percent = max(percents)
+            self.frames = max(self.frames, self.offset + self.traj_frames * self.percent // 100)
+
+
+class ProgressReporter:
+    """ Sends progress events (frames, total, frames per second, estimated time left and seconds without progress)
+    to a callback and to the log """
+
+    def __init__(self, parser, callback=None, out_log=None, interval=10.0):
+        self.parser = parser
+        self.callback = callback
+        self.out_log = out_log
+        self.interval = interval
+        self.start = self.last_report = self.last_progress = time.monotonic()
+        self.final = False
+
+    def event(self):
+        now = time.monotonic()
+        elapsed = now - self.start
+        frames, total = self.parser.frames, self.parser.total
+        fps = self.parser.fps if self.parser.done and self.parser.fps else (frames / elapsed if frames and elapsed else None)
+        eta = (total - frames) / fps if total and fps and total >= frames else None
+        return {'frames': frames, 'total': total, 'fps': round(fps, 2) if fps else None, 'eta': round(eta, 1) if eta is not None else None,
+                'elapsed': round(elapsed, 1), 'stalled': round(now - self.last_progress, 1), 'done': self.parser.done}
+
+    def update(self, changed):
+        """ Reports the progress when it is done or if interval seconds have passed since the last report """
+        now = time.monotonic()
+        if changed:
+            self.last_progress = now
+        if self.parser.done and not self.final:
+            return self.report()
+        if self.final or now - self.last_report < self.interval:
+            return None
+        return self.report()
+
+    def report(self):
+        self.last_report = time.monotonic()
+        self.final = self.final or self.parser.done
+        event = self.event()
+        if self.callback:
+            self.callback(event)
+        if self.out_log:
+            self.out_log.info('Progress: ' + json.dumps(event))
+        return event
+
+
+def read_stream(stream, name, events):
+    """ Reads the stream as it is written and puts its (name, bytes) chunks in the events queue """
+    for chunk in iter(lambda: os.read(stream.fileno(), 4096), b''):
+        events.put((name, chunk))
+    events.put((name, None))
+
+
+def write_stdin(stream, text):
+    """ Writes the text to the standard input of the command, which may exit before reading it """
+    try:
+        stream.write(text.encode())
+        stream.close()
+    except OSError:
+        pass
+
+
+def run_with_progress(cmd, reporter=None, stdin_text=None, env=None):
+    """ Runs the command line reporting its progress if a reporter is given, returns (return code, stdout, stderr) """
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE if stdin_text is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True,
+                               executable=os.getenv('SHELL', '/bin/sh'), env=env)
+    events = queue.Queue()
+    outputs = {'stdout': [], 'stderr': []}
+    for name in outputs:
+        threading.Thread(target=read_stream, args=(getattr(process, name), name, events), daemon=True).start()
+    if stdin_text is not None:
+        threading.Thread(target=write_stdin, args=(process.stdin, stdin_text), daemon=True).start()
+
+    decoders = {name: codecs.getincrementaldecoder('utf-8')('replace') for name in outputs}
+    open_streams = len(outputs)
+    while open_streams:
+        try:
+            name, chunk = events.get(timeout=reporter.interval if reporter else None)
+        except queue.Empty:
+            reporter.update(False)
+            continue
+        if chunk is None:
+            open_streams -= 1
+            continue
+        outputs[name].append(chunk)
+        if reporter:
+            reporter.update(reporter.parser.feed(decoders[name].decode(chunk), name))
+    return_code = process.wait()
+    if reporter and not reporter.final:
+        reporter.report()
+    return return_code, b''.join(outputs['stdout']), b''.join(outputs['stderr'])
@@ -0,0 +1,140 @@
+""" Container staging and execution modes for package biobb_analysis.runtime """
+from pathlib import Path, PurePath
+import hashlib
+import os
+from biobb_common.generic.biobb_object import BiobbObject
+from biobb_common.tools import file_utils as fu
+from biobb_analysis.runtime.checkpoint import link_file
+
+
+# folder of the container where the input folders are mounted
+INPUTS_MOUNT_PATH = '/biobb_inputs'
+
+
+def input_mount_path(host_dir):
+    """ Returns the deterministic container path where a host folder of inputs is mounted """
+    return str(PurePath(INPUTS_MOUNT_PATH).joinpath(hashlib.sha1(str(host_dir).encode()).hexdigest()[:12]))
+
+
+def insert_mounts(cmd, volume, mounts):
+    """ Adds read-only mounts of the (host, container) folders to a docker/singularity command line after its volume """
+    i = cmd.index(volume)
+    flag = cmd[i - 1]
+    for host_dir, container_dir in mounts.items():
+        i += 2
+        cmd[i - 1:i - 1] = [flag, '%s:%s:ro' % (host_dir, container_dir)]
+    return cmd
+
+
+class StagingBiobbObject(BiobbObject):
+    """ BiobbObject with the **container_staging** and **stdin_pipe** properties. The default 'copy' staging mode
+    copies the inputs to a staging folder mounted in **container_volume_path**. The 'bind' mode mounts the folders
+    of the inputs read-only in the container instead, only the outputs are written to the staging folder, which is
+    created next to the first output so they are hard linked instead of copied to their final path.
+    With **stdin_pipe** the blocks keep the text of their instructions or selections in stdin_text instead of
+    writing it to a temporary file, and it is sent through the standard input of the command.
+    With **progress** (or a **progress_callback** function) the output of the command is parsed while it runs
+    and its progress is reported every **progress_interval** seconds """
+
+    def __init__(self, properties=None, **kwargs) -> None:
+        properties = properties or {}
+        super().__init__(properties, **kwargs)
+        self.container_staging = properties.get('container_staging', 'copy')
+        self.stdin_pipe = properties.get('stdin_pipe', False)
+        self.stdin_text = None
+        self.progress = properties.get('progress', False)
+        self.progress_interval = properties.get('progress_interval', 10.0)
+        self.progress_callback = properties.get('progress_callback', None)
+
+    def is_bind_staging(self):
+        """ Checks if the inputs are mounted instead of copied """
+        if not self.container_path or self.container_staging != 'bind':
+            return False
+        container_name = Path(self.container_path).name
+        if container_name.startswith('biobb_analysis_pool') or not container_name.endswith(('docker', 'singularity')):
+            fu.log('container_staging bind is not available for %s, copying the inputs' % container_name, self.out_log)
+            self.container_staging = 'copy'
+            return False
+        return True
+
+    def stage_files(self):
+        if not self.is_bind_staging():
+            return super().stage_files()
+
+        out_paths = [path for path in self.io_dict["out"].values() if path]
+        unique_dir = str(Path(fu.create_unique_dir(path=str(Path(out_paths[0]).resolve().parent) if out_paths else '')).resolve())
+        self.stage_io_dict = {"in": {}, "out": {}, "unique_dir": unique_dir, "mounts": {}}
+
+        # IN files MOUNT and assign INTERNAL PATH
+        for file_ref, file_path in self.io_dict["in"].items():
+            if file_path:
+                if Path(file_path).exists():
+                    host_path = Path(file_path).resolve()
+                    container_dir = self.stage_io_dict["mounts"].setdefault(str(host_path.parent), input_mount_path(host_path.parent))
+                    fu.log(f'Mount: {host_path.parent} to {container_dir}', self.out_log)
+                    self.stage_io_dict["in"][file_ref] = str(PurePath(container_dir).joinpath(host_path.name))
+                else:
+                    self.stage_io_dict["in"][file_ref] = file_path
+
+        # OUT files assign INTERNAL PATH
+        for file_ref, file_path in self.io_dict["out"].items():
+            if file_path:
+                self.stage_io_dict["out"][file_ref] = str(PurePath(self.container_volume_path).joinpath(Path(file_path).name))
+
+    def create_cmd_line(self):
+        super().create_cmd_line()
+        if self.stage_io_dict.get("mounts"):
+            insert_mounts(self.cmd, self.stage_io_dict["unique_dir"] + ':' + self.container_volume_path, self.stage_io_dict["mounts"])
+        # docker only forwards the standard input to interactive containers
+        if self.stdin_text is not None and self.container_path and self.container_path.endswith('docker'):
+            self.cmd.insert(2, '-i')
+
+    def expected_frames(self):
+        """ Returns the number of frames the command will process according to the headers of the input trajectory, or None """
+        from biobb_analysis.native.metadata import probe
+        traj_path = self.io_dict["in"].get("input_traj_path")
+        metadata = probe(traj_path, self.io_dict["in"].get("input_top_path")) if traj_path else None
+        if not metadata or metadata['n_frames'] is None:
+            return None
+        in_parameters = getattr(self, 'in_parameters', None) or {}
+        start, end, step = [in_parameters.get(key) if isinstance(in_parameters.get(key), int) else default
+                            for key, default in (('start', 1), ('end', -1), ('step', 1))]
+        last = metadata['n_frames'] if end < 1 else min(end, metadata['n_frames'])
+        return len(range(start, last + 1, max(step, 1)))
+
+    def execute_command(self):
+        if self.stdin_text is None and not self.progress and not self.progress_callback:
+            return super().execute_command()
+        from biobb_analysis.runtime.progress import ProgressParser, ProgressReporter, run_with_progress
+
+        # same logging than the biobb_common command wrapper
+        cmd = " ".join(self.cmd)
+        if self.out_log:
+            self.out_log.info(cmd + (' (standard input through a pipe)' if self.stdin_text is not None else '') + '\n')
+        reporter = None
+        if self.progress or self.progress_callback:
+            reporter = ProgressReporter(ProgressParser(self.expected_frames()), self.progress_callback, self.out_log, self.progress_interval)
+        return_code, out, err = run_with_progress(cmd, reporter, self.stdin_text, self.environment or os.environ.copy())
+        if self.out_log:
+            self.out_log.info("Exit code {}".format(return_code) + '\n')
+            if out:
+                self.out_log.info(out.decode("utf-8", "replace"))
+        if self.global_log:
+            self.global_log.info(fu.get_logs_prefix() + 'Executing: ' + cmd[0:80] + '...')
+            self.global_log.info(fu.get_logs_prefix() + "Exit code {}".format(return_code))
+        if self.err_log and err:
+            self.err_log.info(err.decode("utf-8", "replace"))
+        self.return_code = return_code
+
+    def copy_to_host(self):
+        if not self.is_bind_staging():
+            return super().copy_to_host()
+
+        # OUT files LINK, the staging folder is in the same file system
+        for file_ref, file_path in self.stage_io_dict["out"].items():
+            if file_path:
+                container_file_path = Path(self.stage_io_dict["unique_dir"]).joinpath(Path(file_path).name)
+                if container_file_path.exists():
+                    if Path(self.io_dict["out"][file_ref]).exists():
+                        Path(self.io_dict["out"][file_ref]).unlink()
+                    link_file(container_file_path, self.io_dict["out"][file_ref])
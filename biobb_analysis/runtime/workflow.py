@@ -0,0 +1,294 @@
+""" Lazy workflows of blocks for package biobb_analysis.runtime
+
+The block calls are declared with Workflow.add() and nothing runs until Workflow.run(). The planner builds the
+graph of the calls (a call depends on the calls writing its inputs), then:
+
+    * Removes the duplicated calls (same block, inputs and properties), their outputs are copied from the first one.
+    * Joins the chains of GMXTrjConvTrj calls whose intermediate trajectory is not needed in a single trjconv.
+    * Joins the independent Cpptraj calls reading the same topology and trajectory in a single cpptraj execution
+      (see the branches property of CpptrajPipeline), so the trajectory is read once.
+
+The tasks of the plan run in threads as soon as their dependencies finish, as long as the CPUs and memory they
+declare fit in the ones of the executor::
+
+    from biobb_analysis.runtime.workflow import Workflow
+    workflow = Workflow(cpus=8)
+    workflow.add('cpptraj_rgyr', input_top_path='top.prmtop', input_traj_path='traj.nc', output_cpptraj_path='rgyr.dat')
+    workflow.add('cpptraj_rms', input_top_path='top.prmtop', input_traj_path='traj.nc', output_cpptraj_path='rms.dat',
+                 properties={'mask': 'c-alpha'})
+    return_codes = workflow.run()
+"""
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+import importlib
+import json
+import os
+import shutil
+from biobb_analysis.native.cache import available_memory
+
+# properties of the blocks giving the number of CPUs they use
+CPU_PROPERTIES = ['num_processes', 'mpi_ranks', 'omp_threads', 'num_threads']
+# GMXTrjConvTrj properties that select frames
+TRJCONV_SLICING = ['start', 'end', 'dt']
+# properties of the joined Cpptraj calls that must be the same in all of them
+CPPTRAJ_RUNTIME = ['binary_path', 'mpi_ranks', 'mpi_launcher', 'mpi_binary_path', 'omp_threads', 'container_path', 'container_image',
+                   'container_volume_path', 'container_working_dir', 'container_user_id', 'container_shell_path', 'container_staging',
+                   'remove_tmp', 'restart', 'stdin_pipe', 'progress', 'progress_interval']
+
+
+def get_block_class(block):
+    """ Returns the class of a block given the class, its command line name (ie: cpptraj_rgyr) or module:class """
+    if isinstance(block, type):
+        return block
+    if ':' in block:
+        module, class_name = block.split(':', 1)
+        return getattr(importlib.import_module(module), class_name)
+    from biobb_analysis.cli import get_blocks
+    blocks = get_blocks()
+    if block not in blocks:
+        raise ValueError('Unknown block %s' % block)
+    module = importlib.import_module(blocks[block])
+    classes = [value for key, value in vars(module).items() if isinstance(value, type) and key.lower() == block.replace('_', '')]
+    if not classes:
+        raise ValueError('No class found for block %s' % block)
+    return classes[0]
+
+
+def resolve(path):
+    return str(Path(path).resolve())
+
+
+class Step:
+    """ Call of a block: the block class, its paths and properties and the resources it needs """
+
+    def __init__(self, step_id, block, paths, properties, cpus=None, memory=0, intermediate=False):
+        self.id = step_id
+        self.block = block
+        self.paths = {key: path for key, path in paths.items() if path}
+        self.properties = dict(properties or {})
+        self.cpus = cpus or max([int(self.properties.get(key) or 1) for key in CPU_PROPERTIES] + [1])
+        self.memory = memory
+        self.intermediate = intermediate
+
+    @property
+    def inputs(self):
+        return {key: path for key, path in self.paths.items() if key.startswith('input_')}
+
+    @property
+    def outputs(self):
+        return {key: path for key, path in self.paths.items() if key.startswith('output_')}
+
+    def key(self):
+        """ Identity of the computation: block, inputs and properties """
+        return json.dumps([self.block.__module__ + '.' + self.block.__name__, {key: resolve(path) for key, path in self.inputs.items()},
+                           self.properties], sort_keys=True, default=str)
+
+    def create(self):
+        return self.block(**self.paths, properties=dict(self.properties))
+
+    def launch(self):
+        return self.create().launch()
+
+
+class Task:
+    """ Unit of execution of the plan: a step, a joined trjconv, a group of joined Cpptraj steps or a copy of the outputs of a duplicated step """
+
+    def __init__(self, kind, steps, source=None):
+        self.kind = kind
+        self.steps = steps
+        self.source = source
+        self.deps = set()
+        self.cpus = max(step.cpus for step in steps)
+        self.memory = max(step.memory for step in steps)
+
+    @property
+    def name(self):
+        return '%s(%s)' % (self.kind, ', '.join(step.id for step in self.steps))
+
+    def run(self):
+        if self.kind == 'copy':
+            for key, path in self.steps[0].outputs.items():
+                if resolve(path) != resolve(self.source.outputs[key]):
+                    shutil.copyfile(self.source.outputs[key], path)
+            return 0
+        if self.kind == 'cpptraj':
+            from biobb_analysis.runtime.pipeline import CpptrajPipeline
+            properties = {key: value for key, value in self.steps[0].properties.items() if key in CPPTRAJ_RUNTIME}
+            properties['branches'] = True
+            return CpptrajPipeline([step.create() for step in self.steps], properties=properties).launch()
+        return self.steps[0].launch()
+
+
+class Workflow:
+    """ Graph of block calls planned and run lazily, cpus and memory (bytes) are the resources of the executor,
+    all the CPUs and the available memory by default """
+
+    def __init__(self, cpus=None, memory=None, fuse=True):
+        self.steps = []
+        self.cpus = cpus or os.cpu_count() or 1
+        self.memory = memory or available_memory()
+        self.fuse = fuse
+        self.tasks = None
+
+    def add(self, block, properties=None, cpus=None, memory=0, intermediate=False, step_id=None, **paths):
+        """ Declares a call of a block (class, command line name or module:class) with its paths and properties.
+        The outputs of intermediate calls may be not written if they are only read by the following calls """
+        step = Step(step_id or '%d_%s' % (len(self.steps), getattr(block, '__name__', block)), get_block_class(block), paths, properties,
+                    cpus, memory, intermediate)
+        self.steps.append(step)
+        self.tasks = None
+        return step
+
+    def producers(self, steps):
+        """ Returns the step writing every output path """
+        return {resolve(path): step for step in steps for path in step.outputs.values()}
+
+    def deduplicate(self, steps):
+        """ Returns the unique steps and the (duplicated step, first step) pairs """
+        unique, duplicates, seen = [], [], {}
+        for step in steps:
+            key = step.key()
+            if key in seen:
+                duplicates.append((step, seen[key]))
+            else:
+                seen[key] = step
+                unique.append(step)
+        return unique, duplicates
+
+    def fuse_trjconv(self, steps):
+        """ Joins a GMXTrjConvTrj step with the following one when the intermediate trajectory is only read by it,
+        the second step converts the whole system and only one of them selects frames """
+        steps = list(steps)
+        joined = True
+        while joined:
+            joined = False
+            readers = {}
+            for step in steps:
+                for path in step.inputs.values():
+                    readers.setdefault(resolve(path), []).append(step)
+            for first in steps:
+                if first.block.__name__ != 'GMXTrjConvTrj' or not first.intermediate or not first.outputs.get('output_traj_path'):
+                    continue
+                next_steps = readers.get(resolve(first.outputs['output_traj_path']), [])
+                if len(next_steps) != 1 or next_steps[0].block is not first.block:
+                    continue
+                second = next_steps[0]
+                if second.properties.get('selection', 'System') != 'System' or not set(second.inputs) <= {'input_traj_path', 'input_top_path'}:
+                    continue
+                if any(first.properties.get(key) for key in TRJCONV_SLICING) and any(second.properties.get(key) for key in TRJCONV_SLICING):
+                    continue
+                properties = dict(second.properties, **first.properties)
+                properties.update({key: second.properties[key] for key in TRJCONV_SLICING if second.properties.get(key)})
+                paths = dict(first.inputs, output_traj_path=second.outputs['output_traj_path'])
+                step = Step(first.id + '+' + second.id, first.block, paths, properties, max(first.cpus, second.cpus),
+                            max(first.memory, second.memory), second.intermediate)
+                steps[steps.index(first)] = step
+                steps.remove(second)
+                joined = True
+                break
+        return steps
+
+    def is_cpptraj(self, step):
+        return step.block.__module__.startswith('biobb_analysis.ambertools.cpptraj_') and step.block.__name__ != 'CpptrajInput' \
+            and {'input_top_path', 'input_traj_path'} <= set(step.inputs)
+
+    def plan(self):
+        """ Returns the tasks to run, their deps are the tasks they wait for """
+        steps, duplicates = self.deduplicate(self.steps)
+        if self.fuse:
+            steps = self.fuse_trjconv(steps)
+        producers = self.producers(steps)
+        copies = []
+        for duplicate, source in duplicates:
+            # the outputs of the first step may not be written anymore (joined trjconv)
+            if all(resolve(path) in producers for path in source.outputs.values()):
+                copies.append((duplicate, source))
+            else:
+                steps.append(duplicate)
+        producers = self.producers(steps)
+        for duplicate, source in copies:
+            producers.update({resolve(path): duplicate for path in duplicate.outputs.values() if resolve(path) not in producers})
+        deps = {}
+        for step in steps + [duplicate for duplicate, _ in copies]:
+            deps[step.id] = {producers[resolve(path)].id for path in step.inputs.values() if resolve(path) in producers} - {step.id}
+        for duplicate, source in copies:
+            deps[duplicate.id] = {producers[resolve(path)].id for path in source.outputs.values()}
+        ancestors = {}
+
+        def get_ancestors(step_id, visiting=()):
+            if step_id not in ancestors:
+                if step_id in visiting:
+                    raise ValueError('The workflow has a cycle through %s' % step_id)
+                ancestors[step_id] = set(deps[step_id])
+                for dep in deps[step_id]:
+                    ancestors[step_id] |= get_ancestors(dep, visiting + (step_id,))
+            return ancestors[step_id]
+
+        # independent Cpptraj steps reading the same inputs with the same runtime properties run together
+        groups, tasks = {}, []
+        for step in steps:
+            if self.fuse and self.is_cpptraj(step):
+                runtime = {key: step.properties.get(key) for key in CPPTRAJ_RUNTIME}
+                key = json.dumps([resolve(step.inputs['input_top_path']), resolve(step.inputs['input_traj_path']), runtime], sort_keys=True, default=str)
+                group = groups.get(key)
+                if group and not any(other.id in get_ancestors(step.id) or step.id in get_ancestors(other.id) for other in group.steps):
+                    group.steps.append(step)
+                    continue
+                groups[key] = Task('cpptraj', [step])
+                tasks.append(groups[key])
+            else:
+                tasks.append(Task('block', [step]))
+        tasks += [Task('copy', [duplicate], source) for duplicate, source in copies]
+        task_of = {step.id: task for task in tasks for step in task.steps}
+        for task in tasks:
+            if task.kind == 'cpptraj' and len(task.steps) == 1:
+                task.kind = 'block'
+            task.cpus = max(step.cpus for step in task.steps)
+            task.memory = max(step.memory for step in task.steps)
+            task.deps = {task_of[dep] for step in task.steps for dep in deps[step.id]} - {task}
+            get_ancestors(task.steps[0].id)
+        self.tasks = tasks
+        return tasks
+
+    def fits(self, task, running):
+        """ Checks if the task fits in the resources left by the running tasks, a task alone always runs """
+        if not running:
+            return True
+        cpus = sum(other.cpus for other in running) + task.cpus
+        memory = sum(other.memory for other in running) + task.memory
+        return cpus <= self.cpus and (not self.memory or memory <= self.memory)
+
+    def run(self):
+        """ Runs the tasks of the plan, returns the return code of every step (None if it did not run because a dependency failed) """
+        tasks = self.tasks or self.plan()
+        pending = list(tasks)
+        return_codes = {}
+        done, failed, running = set(), set(), {}
+        with ThreadPoolExecutor(max_workers=max(1, len(tasks))) as executor:
+            while pending or running:
+                skipped = True
+                while skipped:
+                    skipped = False
+                    for task in list(pending):
+                        if task.deps & failed:
+                            pending.remove(task)
+                            failed.add(task)
+                            return_codes.update({step.id: None for step in task.steps})
+                            skipped = True
+                        elif task.deps <= done and self.fits(task, running.values()):
+                            pending.remove(task)
+                            running[executor.submit(task.run)] = task
+                if not running:
+                    if pending:
+                        raise RuntimeError('The tasks %s wait for each other' % ', '.join(task.name for task in pending))
+                    continue
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        return_code = future.result() or 0
+                    except (Exception, SystemExit) as error:
+                        return_code = error.code if isinstance(error, SystemExit) and isinstance(error.code, int) else 1
+                    return_codes.update({step.id: return_code for step in task.steps})
+                    (failed if return_code else done).add(task)
+        return {step.id: return_codes.get(step.id) for step in self.steps}
@@ -0,0 +1,225 @@
+""" Shared file system work queue for package biobb_analysis.runtime
+
+Jobs are JSON files in a folder shared by all the nodes, no broker service is needed. The workers
+(``biobb_analysis worker <queue_dir>``) claim the jobs renaming them, which is atomic, and touch their heartbeat
+file while they run. The jobs of the workers whose heartbeat is older than the dead timeout are put back
+in the queue by the other workers. The folders of the queue are:
+
+    * pending: jobs waiting for a worker.
+    * running: claimed jobs, named <job id>@<worker id>.json.
+    * done / failed: finished jobs with their return code, worker and times.
+    * workers: heartbeat files of the workers.
+
+A job is a block (command line name of the block, ie: cpptraj_rgyr, or module:function) with its paths and properties::
+
+    {"id": "...", "block": "cpptraj_rgyr", "paths": {"input_top_path": "...", ...}, "properties": {...}, "attempts": 0, "max_attempts": 3}
+"""
+from pathlib import Path
+import argparse
+import importlib
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+from biobb_common.tools import file_utils as fu
+from biobb_analysis.native.cache import read_json, write_json
+
+QUEUE_FOLDERS = ['pending', 'running', 'done', 'failed', 'workers']
+
+
+def queue_folders(queue_dir):
+    """ Returns the folders of the queue by name, creating them if needed """
+    folders = {name: Path(queue_dir).joinpath(name) for name in QUEUE_FOLDERS}
+    for folder in folders.values():
+        folder.mkdir(parents=True, exist_ok=True)
+    return folders
+
+
+def submit(queue_dir, block, paths, properties=None, job_id=None, max_attempts=3):
+    """ Adds a job to the queue and returns its id """
+    job_id = job_id or uuid.uuid4().hex
+    job = {'id': job_id, 'block': block, 'paths': paths, 'properties': properties or {}, 'attempts': 0,
+           'max_attempts': max_attempts, 'submitted': time.time()}
+    write_json(job, queue_folders(queue_dir)['pending'].joinpath(job_id + '.json'))
+    return job_id
+
+
+def status(queue_dir):
+    """ Returns the number of jobs of every folder of the queue """
+    folders = queue_folders(queue_dir)
+    return {name: len(list(folders[name].glob('*.json'))) for name in QUEUE_FOLDERS if name != 'workers'}
+
+
+def submission_order(path):
+    """ Sorting key of the pending jobs: oldest first """
+    try:
+        return path.stat().st_mtime, path.name
+    except FileNotFoundError:
+        return 0, path.name
+
+
+def claim(queue_dir, worker_id):
+    """ Claims the oldest pending job for the worker, returns (job, running path) or (None, None) if there are no pending jobs """
+    folders = queue_folders(queue_dir)
+    for path in sorted(folders['pending'].glob('*.json'), key=submission_order):
+        running_path = folders['running'].joinpath('%s@%s.json' % (path.stem, worker_id))
+        try:
+            # only one worker succeeds renaming the job
+            os.rename(str(path), str(running_path))
+        except FileNotFoundError:
+            continue
+        job = read_json(running_path)
+        if job is None:
+            os.rename(str(running_path), str(folders['failed'].joinpath(path.name)))
+            continue
+        return job, running_path
+    return None, None
+
+
+def finish(queue_dir, job, running_path, return_code, worker_id, started):
+    """ Moves the job to the done or failed folder with its result """
+    folders = queue_folders(queue_dir)
+    job = dict(job, return_code=return_code, worker=worker_id, started=started, finished=time.time())
+    write_json(job, folders['done' if return_code == 0 else 'failed'].joinpath(job['id'] + '.json'))
+    # the job may have been requeued if the heartbeat of the worker was delayed
+    if Path(running_path).exists():
+        Path(running_path).unlink()
+    return job
+
+
+def heartbeat(queue_dir, worker_id):
+    """ Writes or touches the heartbeat file of the worker """
+    path = queue_folders(queue_dir)['workers'].joinpath(worker_id + '.json')
+    if path.exists():
+        os.utime(str(path))
+    else:
+        write_json({'worker': worker_id, 'host': socket.gethostname(), 'pid': os.getpid(), 'started': time.time()}, path)
+    return path
+
+
+def requeue_dead(queue_dir, dead_timeout):
+    """ Puts back in the queue the jobs of the workers without heartbeat for dead_timeout seconds, returns their ids.
+    The jobs that already reached their maximum number of attempts are moved to the failed folder """
+    folders = queue_folders(queue_dir)
+    now = time.time()
+    requeued = []
+    for running_path in folders['running'].glob('*@*.json'):
+        job_id, worker_id = running_path.stem.split('@', 1)
+        worker_path = folders['workers'].joinpath(worker_id + '.json')
+        try:
+            if worker_path.exists() and now - worker_path.stat().st_mtime < dead_timeout:
+                continue
+            # only one worker succeeds renaming the job of the dead worker
+            reaping_path = running_path.with_name(running_path.name + '.%s.requeue' % uuid.uuid4().hex)
+            os.rename(str(running_path), str(reaping_path))
+        except FileNotFoundError:
+            continue
+        job = read_json(reaping_path) or {'id': job_id, 'attempts': 0, 'max_attempts': 1}
+        job['attempts'] = job.get('attempts', 0) + 1
+        job.setdefault('dead_workers', []).append(worker_id)
+        folder = 'pending' if job['attempts'] < job.get('max_attempts', 3) else 'failed'
+        job_path = write_json(job, folders[folder].joinpath(job_id + '.json'))
+        # the requeued job keeps its place in the queue
+        if job.get('submitted'):
+            os.utime(job_path, (job['submitted'], job['submitted']))
+        reaping_path.unlink()
+        requeued.append(job_id)
+    return requeued
+
+
+def get_block_function(block):
+    """ Returns the function of the block given its command line name (ie: cpptraj_rgyr) or module:function """
+    if ':' in block:
+        module, function = block.split(':', 1)
+        return getattr(importlib.import_module(module), function)
+    from biobb_analysis.cli import get_blocks
+    blocks = get_blocks()
+    if block not in blocks:
+        raise ValueError('Unknown block %s' % block)
+    return getattr(importlib.import_module(blocks[block]), block)
+
+
+def run_job(job):
+    """ Launches the block of the job, returns its return code (1 if it raises an exception) """
+    try:
+        return_code = get_block_function(job['block'])(**job['paths'], properties=dict(job['properties']))
+    except SystemExit as exit_error:
+        traceback.print_exc()
+        return_code = exit_error.code if isinstance(exit_error.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        return_code = 1
+    return return_code or 0
+
+
+class Worker:
+    """ Claims and launches the jobs of the queue, touching its heartbeat file every heartbeat_interval seconds.
+    The jobs launched and finished are logged in out_log (the logger of this module by default) """
+
+    def __init__(self, queue_dir, worker_id=None, poll_interval=2.0, heartbeat_interval=10.0, dead_timeout=60.0, out_log=None):
+        self.queue_dir = str(queue_dir)
+        self.out_log = out_log or logging.getLogger(__name__)
+        self.worker_id = worker_id or '%s-%d-%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.dead_timeout = dead_timeout
+        self.stopped = threading.Event()
+
+    def beat(self):
+        while not self.stopped.wait(self.heartbeat_interval):
+            heartbeat(self.queue_dir, self.worker_id)
+
+    def run(self, max_jobs=None, exit_when_empty=False):
+        """ Runs jobs until the queue is empty (if exit_when_empty) or max_jobs are done, returns the number of failed jobs """
+        heartbeat(self.queue_dir, self.worker_id)
+        beat_thread = threading.Thread(target=self.beat, daemon=True)
+        beat_thread.start()
+        n_jobs = n_failed = 0
+        try:
+            while max_jobs is None or n_jobs < max_jobs:
+                requeue_dead(self.queue_dir, self.dead_timeout)
+                job, running_path = claim(self.queue_dir, self.worker_id)
+                if not job:
+                    # the jobs of the running workers may still be requeued
+                    if exit_when_empty and not status(self.queue_dir)['running']:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                started = time.time()
+                fu.log('%s: running job %s (%s)' % (self.worker_id, job['id'], job['block']), self.out_log)
+                return_code = run_job(job)
+                finish(self.queue_dir, job, running_path, return_code, self.worker_id, started)
+                fu.log('%s: job %s finished with exit code %d' % (self.worker_id, job['id'], return_code), self.out_log)
+                n_jobs += 1
+                n_failed += bool(return_code)
+        finally:
+            self.stopped.set()
+            worker_path = queue_folders(self.queue_dir)['workers'].joinpath(self.worker_id + '.json')
+            if worker_path.exists():
+                worker_path.unlink()
+        return n_failed
+
+
+def main(argv=None):
+    """ Command line of the workers: biobb_analysis worker <queue_dir> [options] """
+    parser = argparse.ArgumentParser(prog='biobb_analysis worker', description="Claims and launches the biobb_analysis jobs of a shared file system queue.")
+    parser.add_argument('queue_dir', help='Folder of the queue, shared by all the workers.')
+    parser.add_argument('--exit_when_empty', action='store_true', help='Exit when there are no pending or running jobs.')
+    parser.add_argument('--max_jobs', type=int, default=None, help='Exit after running this number of jobs.')
+    parser.add_argument('--poll_interval', type=float, default=2.0, help='Seconds between checks of the queue when it is empty.')
+    parser.add_argument('--heartbeat_interval', type=float, default=10.0, help='Seconds between heartbeats of the worker.')
+    parser.add_argument('--dead_timeout', type=float, default=60.0, help='Seconds without heartbeat after which the jobs of a worker are requeued.')
+    parser.add_argument('--worker_id', default=None, help='Id of the worker (hostname-pid by default).')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+    worker = Worker(args.queue_dir, args.worker_id, args.poll_interval, args.heartbeat_interval, args.dead_timeout)
+    return 1 if worker.run(args.max_jobs, args.exit_when_empty) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+import zipfile
+import pytest
+from biobb_common.tools import test_fixtures as fx
+from biobb_analysis.ambertools.cpptraj_fanout import cpptraj_fanout
+
+
+class TestCpptrajFanout():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_fanout')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_fanout(self):
+        cpptraj_fanout(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_cpptraj_path'])
+        names = zipfile.ZipFile(self.paths['output_cpptraj_path']).namelist()
+        assert 'solute.netcdf' in names and 'calpha.dcd' in names
+        assert len([name for name in names if name.startswith('snapshot.pdb.')]) == 2
+
+
+class TestCpptrajFanoutPastEnd():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_fanout_past_end')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_fanout_past_end(self):
+        # the late output starts after the last frame of the trajectory
+        with pytest.raises(SystemExit):
+            cpptraj_fanout(properties=self.properties, **self.paths)
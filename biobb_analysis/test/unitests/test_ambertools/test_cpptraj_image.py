@@ -14,3 +14,17 @@ class TestCpptrajImage():
         cpptraj_image(properties=self.properties, **self.paths)
         assert fx.not_empty(self.paths['output_cpptraj_path'])
         assert fx.equal(self.paths['output_cpptraj_path'], self.paths['ref_output_cpptraj_path'])
+
+
+class TestCpptrajImageChunks():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_image_chunks')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_image_chunks(self):
+        cpptraj_image(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_cpptraj_path'])
+        assert fx.equal(self.paths['output_cpptraj_path'], self.paths['ref_output_cpptraj_path'])
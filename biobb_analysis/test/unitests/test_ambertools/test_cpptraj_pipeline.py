@@ -0,0 +1,45 @@
+from pathlib import Path
+import subprocess
+from biobb_common.tools import test_fixtures as fx
+from biobb_analysis.ambertools.common import get_mask_atoms
+from biobb_analysis.ambertools.cpptraj_strip import CpptrajStrip
+from biobb_analysis.ambertools.cpptraj_image import CpptrajImage
+from biobb_analysis.ambertools.cpptraj_rms import CpptrajRms
+from biobb_analysis.runtime.pipeline import cpptraj_pipeline
+
+
+class TestCpptrajPipeline():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_pipeline')
+        # topology of the stripped trajectory, read by the blocks after the strip
+        mask, _ = get_mask_atoms(self.properties['strip']['mask'])
+        instructions = 'parm %s\nparmstrip %s\nparmwrite out %s\n' % (self.paths['input_top_path'], mask, self.paths['output_strip_top_path'])
+        subprocess.run(['cpptraj'], input=instructions, universal_newlines=True, check=True)
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def get_blocks(self, rms_properties):
+        return [
+            CpptrajStrip(input_top_path=self.paths['input_top_path'], input_traj_path=self.paths['input_traj_path'],
+                         output_cpptraj_path=self.paths['output_strip_path'], properties=self.properties['strip']),
+            CpptrajImage(input_top_path=self.paths['output_strip_top_path'], input_traj_path=self.paths['output_strip_path'],
+                         output_cpptraj_path=self.paths['output_image_path']),
+            CpptrajRms(input_top_path=self.paths['output_strip_top_path'], input_traj_path=self.paths['output_image_path'],
+                       output_cpptraj_path=self.paths['output_rms_path'], properties=rms_properties)
+        ]
+
+    def test_pipeline(self):
+        cpptraj_pipeline(blocks=self.get_blocks(self.properties['rms']))
+        assert fx.not_empty(self.paths['output_rms_path'])
+        assert fx.equal(self.paths['output_rms_path'], self.paths['ref_output_rms_path'])
+        assert not Path(self.paths['output_strip_path']).exists()
+        assert not Path(self.paths['output_image_path']).exists()
+
+    def test_pipeline_sequential(self):
+        # the sliced rms can not be joined, the blocks are launched one after the other
+        cpptraj_pipeline(blocks=self.get_blocks(self.properties['rms_sliced']))
+        assert fx.not_empty(self.paths['output_rms_path'])
+        assert fx.not_empty(self.paths['output_strip_path'])
+        assert fx.not_empty(self.paths['output_image_path'])
@@ -14,3 +14,17 @@ class TestCpptrajRgyr():
         cpptraj_rgyr(properties=self.properties, **self.paths)
         assert fx.not_empty(self.paths['output_cpptraj_path'])
         assert fx.equal(self.paths['output_cpptraj_path'], self.paths['ref_output_cpptraj_path'])
+
+
+class TestCpptrajRgyrPipe():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_rgyr_pipe')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_rgyr_pipe(self):
+        cpptraj_rgyr(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_cpptraj_path'])
+        assert fx.equal(self.paths['output_cpptraj_path'], self.paths['ref_output_cpptraj_path'])
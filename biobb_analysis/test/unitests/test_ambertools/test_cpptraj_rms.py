@@ -40,3 +40,51 @@ class TestCpptrajRmsExperimental():
         cpptraj_rms(properties=self.properties, **self.paths)
         assert fx.not_empty(self.paths['output_cpptraj_path'])
         assert fx.equal(self.paths['output_cpptraj_path'], self.paths['ref_output_cpptraj_path'])
+
+class TestCpptrajRmsAverageCache():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_rms_average_cache')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_rms_average_cache(self):
+        # without fitting, the second pass must read the frames as they are in the trajectory
+        cpptraj_rms(input_top_path=self.paths['input_top_path'], input_traj_path=self.paths['input_traj_path'],
+                    output_cpptraj_path=self.paths['output_cpptraj_path'], properties=self.properties)
+        cpptraj_rms(input_top_path=self.paths['input_top_path'], input_traj_path=self.paths['input_traj_path'],
+                    output_cpptraj_path=self.paths['output_uncached_path'], properties=dict(self.properties, average_cache='none'))
+        assert fx.not_empty(self.paths['output_cpptraj_path'])
+        assert fx.equal(self.paths['output_cpptraj_path'], self.paths['output_uncached_path'])
+
+class TestCpptrajRmsIncremental():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_rms_incremental')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_rms_incremental(self):
+        cpptraj_rms(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_cpptraj_path'] + '.state.json')
+        # no new frames, the output is not modified
+        cpptraj_rms(properties=self.properties, **self.paths)
+        assert fx.equal(self.paths['output_cpptraj_path'], self.paths['ref_output_cpptraj_path'])
+
+class TestCpptrajRmsMulti():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_rms_multi')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_rms_multi(self):
+        cpptraj_rms(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_cpptraj_path'])
+        with open(self.paths['output_cpptraj_path']) as output:
+            header = output.readline().split()
+        assert header[1:] == ['RMSD_first_backbone', 'RMSD_first_c-alpha', 'RMSD_first_heavy-atoms',
+                              'RMSD_average_backbone', 'RMSD_average_c-alpha', 'RMSD_average_heavy-atoms']
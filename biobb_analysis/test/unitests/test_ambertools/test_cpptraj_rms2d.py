@@ -0,0 +1,20 @@
+import numpy as np
+from biobb_common.tools import test_fixtures as fx
+from biobb_analysis.ambertools.cpptraj_rms2d import cpptraj_rms2d
+
+
+class TestCpptrajRms2d():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_rms2d')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_rms2d(self):
+        cpptraj_rms2d(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_matrix_path'])
+        assert fx.not_empty(self.paths['output_text_path'])
+        matrix = np.load(self.paths['output_matrix_path'])
+        assert matrix.shape[0] == matrix.shape[1]
+        assert np.allclose(matrix, matrix.T) and np.allclose(np.diag(matrix), 0, atol=1e-3)
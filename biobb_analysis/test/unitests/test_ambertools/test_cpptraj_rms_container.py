@@ -1,4 +1,8 @@
+import shutil
+from pathlib import Path
 from biobb_common.tools import test_fixtures as fx
+from biobb_analysis.native.slicing import slice_dcd
+from biobb_analysis.runtime.incremental import read_rows
 from biobb_analysis.ambertools.cpptraj_rms import cpptraj_rms
 
 
@@ -15,6 +19,28 @@ class TestCpptrajRmsFirstDocker():
         assert fx.not_empty(self.paths['output_cpptraj_path'])
         assert fx.equal(self.paths['output_cpptraj_path'], self.paths['ref_output_cpptraj_path'])
 
+class TestCpptrajRmsIncrementalDocker():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_rms_incremental_docker')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_rms_incremental_docker(self):
+        # the trajectory grows from its first 5 frames to all its frames between both executions
+        full_traj_path = self.paths['input_traj_path']
+        growing_traj_path = str(Path(self.paths['output_cpptraj_path']).parent.joinpath('growing.dcd'))
+        slice_dcd(full_traj_path, growing_traj_path, 1, 5)
+        paths = dict(self.paths, input_traj_path=growing_traj_path)
+        cpptraj_rms(properties=self.properties, **paths)
+        assert len(read_rows(self.paths['output_cpptraj_path'])[1]) == 5
+        shutil.copy2(full_traj_path, growing_traj_path)
+        cpptraj_rms(properties=self.properties, **paths)
+        rows = read_rows(self.paths['output_cpptraj_path'])[1]
+        assert len(rows) > 5
+        assert len(rows) == len(read_rows(self.paths['ref_output_cpptraj_path'])[1])
+
 class TestCpptrajRmsAverageDocker():
     def setup_class(self):
         fx.test_setup(self,'cpptraj_rms_average_docker')
@@ -14,3 +14,16 @@ class TestCpptrajSlice():
         cpptraj_slice(properties=self.properties, **self.paths)
         assert fx.not_empty(self.paths['output_cpptraj_path'])
         assert fx.equal(self.paths['output_cpptraj_path'], self.paths['ref_output_cpptraj_path'])
+
+
+class TestCpptrajSliceDCD():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_slice_dcd')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_slice_dcd(self):
+        cpptraj_slice(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_cpptraj_path'])
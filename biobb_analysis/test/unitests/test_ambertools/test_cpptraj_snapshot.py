@@ -1,3 +1,4 @@
+import zipfile
 from biobb_common.tools import test_fixtures as fx
 from biobb_analysis.ambertools.cpptraj_snapshot import cpptraj_snapshot
 
@@ -14,3 +15,33 @@ class TestCpptrajSnapshot():
         cpptraj_snapshot(properties=self.properties, **self.paths)
         assert fx.not_empty(self.paths['output_cpptraj_path'])
         assert fx.equal(self.paths['output_cpptraj_path'], self.paths['ref_output_cpptraj_path'])
+
+
+class TestCpptrajSnapshotMulti():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_snapshot_multi')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_snapshot_multi(self):
+        cpptraj_snapshot(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_cpptraj_path'])
+        with open(self.paths['output_cpptraj_path']) as pdb:
+            assert sum(line.startswith('MODEL') for line in pdb) == 3
+
+
+class TestCpptrajSnapshotZip():
+    def setup_class(self):
+        fx.test_setup(self,'cpptraj_snapshot_zip')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_snapshot_zip(self):
+        cpptraj_snapshot(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_cpptraj_path'])
+        with zipfile.ZipFile(self.paths['output_cpptraj_path']) as zip_file:
+            assert sorted(zip_file.namelist()) == ['output_12.pdb', 'output_3.pdb', 'output_7.pdb']
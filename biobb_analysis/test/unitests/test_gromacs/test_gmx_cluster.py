@@ -14,3 +14,47 @@ class TestGMXCluster():
         gmx_cluster(properties=self.properties, **self.paths)
         assert fx.not_empty(self.paths['output_pdb_path'])
         assert fx.equal(self.paths['output_pdb_path'], self.paths['ref_output_pdb_path'])
+
+
+class TestGMXClusterNative():
+    def setup_class(self):
+        fx.test_setup(self,'gmx_cluster_native')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_cluster_native(self):
+        gmx_cluster(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_pdb_path'])
+
+
+class TestGMXClusterSweep():
+    def setup_class(self):
+        fx.test_setup(self,'gmx_cluster_sweep')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_cluster_sweep(self):
+        gmx_cluster(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_pdb_path'])
+        for setting in ('linkage_0.1', 'gromos_0.2'):
+            assert fx.not_empty(self.paths['output_pdb_path'].replace('.pdb', '_%s.pdb' % setting))
+            assert fx.not_empty(self.paths['output_pdb_path'].replace('.pdb', '_%s.log' % setting))
+
+
+class TestGMXClusterSweepGmx():
+    def setup_class(self):
+        fx.test_setup(self,'gmx_cluster_sweep_gmx')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_cluster_sweep_gmx(self):
+        gmx_cluster(properties=self.properties, **self.paths)
+        for setting in ('gromos_0.1', 'monte-carlo_0.1'):
+            assert fx.not_empty(self.paths['output_pdb_path'].replace('.pdb', '_%s.pdb' % setting))
+            assert fx.not_empty(self.paths['output_pdb_path'].replace('.pdb', '_%s.log' % setting))
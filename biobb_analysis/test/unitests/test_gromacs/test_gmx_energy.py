@@ -14,3 +14,19 @@ class TestGMXEnergy():
         gmx_energy(properties=self.properties, **self.paths)
         assert fx.not_empty(self.paths['output_xvg_path'])
         assert fx.equal(self.paths['output_xvg_path'], self.paths['ref_output_xvg_path'])
+
+
+class TestGMXEnergyIncremental():
+    def setup_class(self):
+        fx.test_setup(self,'gmx_energy_incremental')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_energy_incremental(self):
+        gmx_energy(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_xvg_path'] + '.state.json')
+        # no new energy frames, the output is not modified
+        gmx_energy(properties=self.properties, **self.paths)
+        assert fx.equal(self.paths['output_xvg_path'], self.paths['ref_output_xvg_path'])
@@ -15,3 +15,18 @@ class TestGMXImage():
         assert fx.not_empty(self.paths['output_traj_path'])
         if platform.system() == 'Darwin':
             assert fx.equal(self.paths['output_traj_path'], self.paths['ref_output_traj_path'])
+
+
+class TestGMXImageChunks():
+    def setup_class(self):
+        fx.test_setup(self,'gmx_image_chunks')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_image_chunks(self):
+        gmx_image(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_traj_path'])
+        if platform.system() == 'Darwin':
+            assert fx.equal(self.paths['output_traj_path'], self.paths['ref_output_traj_path'])
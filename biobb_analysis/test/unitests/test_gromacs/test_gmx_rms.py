@@ -15,3 +15,18 @@ class TestGMXRms():
         assert fx.not_empty(self.paths['output_xvg_path'])
         if platform.system() == 'Darwin':
             assert fx.equal(self.paths['output_xvg_path'], self.paths['ref_output_xvg_path'])
+
+
+class TestGMXRmsPipe():
+    def setup_class(self):
+        fx.test_setup(self,'gmx_rms_pipe')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_rms_pipe(self):
+        gmx_rms(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_xvg_path'])
+        if platform.system() == 'Darwin':
+            assert fx.equal(self.paths['output_xvg_path'], self.paths['ref_output_xvg_path'])
@@ -14,3 +14,16 @@ class TestGMXTrjConvTrj():
         gmx_trjconv_trj(properties=self.properties, **self.paths)
         assert fx.not_empty(self.paths['output_traj_path'])
         assert fx.equal(self.paths['output_traj_path'], self.paths['ref_output_traj_path'])
+
+
+class TestGMXTrjConvTrjXTC():
+    def setup_class(self):
+        fx.test_setup(self,'gmx_trjconv_trj_xtc')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+        pass
+
+    def test_trjconv_trj_xtc(self):
+        gmx_trjconv_trj(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_traj_path'])
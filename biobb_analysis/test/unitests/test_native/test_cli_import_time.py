@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+from biobb_analysis.cli import get_blocks
+
+# maximum import time of a block module in ms, including biobb_common
+IMPORT_BUDGET = float(os.environ.get('BIOBB_IMPORT_BUDGET', 300))
+
+
+def run_python(code):
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code], check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+class TestCliImportTime():
+    def test_multiplexer_help(self):
+        modules = json.loads(run_python("import sys, json\nfrom biobb_analysis import cli\ncli.main(['--help'])\n"
+                                        "print(json.dumps(list(sys.modules)))").stdout.splitlines()[-1])
+        assert not [module for module in modules if module.startswith('biobb_common')]
+
+    def test_dispatch_imports_one_block(self):
+        modules = json.loads(run_python("import sys, json\nfrom biobb_analysis import cli\ntry:\n    cli.main(['cpptraj_rgyr', '--help'])\n"
+                                        "except SystemExit:\n    pass\nprint(json.dumps(list(sys.modules)))").stdout.splitlines()[-1])
+        assert 'biobb_analysis.ambertools.cpptraj_rgyr' in modules
+        assert not [module for module in get_blocks().values() if module in modules and not module.endswith('cpptraj_rgyr')]
+        # heavy dependencies are only imported by launch()
+        assert 'numpy' not in modules and 'yaml' not in modules
+
+    def test_import_budget(self):
+        for name, module in get_blocks().items():
+            last_line = run_python('import ' + module).stderr.strip().splitlines()[-1]
+            cumulative_us = int(last_line.split('|')[1])
+            assert cumulative_us / 1000 < IMPORT_BUDGET, '%s imports in %.1f ms' % (name, cumulative_us / 1000)
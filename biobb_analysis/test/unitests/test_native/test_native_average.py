@@ -0,0 +1,57 @@
+import numpy as np
+from biobb_analysis.ambertools.common import cache_average_frames, get_reference
+from biobb_analysis.native.analysis import RmsdAnalysis, RmsfAnalysis, average_structure, run_average_reference
+from biobb_analysis.native.framestore import cache_frames
+from biobb_analysis.native.rmsd import center, pairwise_rmsd, superpose
+from biobb_analysis.native.trajectory import open_trajectory
+from test_native_trajectory import write_dcd
+
+
+class CountingReader:
+    def __init__(self, reader):
+        self.reader = reader
+        self.n_frames, self.n_atoms = reader.n_frames, reader.n_atoms
+        self.reads = 0
+
+    def iter_chunks(self, chunk_size, atoms=None):
+        self.reads += 1
+        return self.reader.iter_chunks(chunk_size, atoms)
+
+
+class TestNativeAverage():
+    def setup_class(self):
+        rng = np.random.default_rng(3)
+        self.coords = (rng.normal(scale=10, size=(1, 10, 3)) + rng.normal(scale=0.5, size=(30, 10, 3))).astype(np.float32)
+
+    def test_cache_frames(self, tmp_path):
+        write_dcd(tmp_path / 'traj.dcd', self.coords)
+        reader = open_trajectory(str(tmp_path / 'traj.dcd'))
+        in_memory = cache_frames(reader, atoms=[0, 4, 7], chunk_frames=7)
+        assert type(in_memory) is np.ndarray and np.allclose(in_memory, self.coords[:, [0, 4, 7]], atol=1e-3)
+        # over the memory budget the frames are mapped from a scratch file, removed once mapped
+        mapped = cache_frames(reader, scratch_dir=str(tmp_path), memory_budget=0, chunk_frames=7)
+        assert isinstance(mapped, np.memmap) and np.allclose(mapped, self.coords, atol=1e-3)
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['traj.dcd']
+
+    def test_run_average_reference(self, tmp_path):
+        write_dcd(tmp_path / 'traj.dcd', self.coords)
+        reader = CountingReader(open_trajectory(str(tmp_path / 'traj.dcd')))
+        rmsd, rmsf = run_average_reference(reader, [RmsdAnalysis, RmsfAnalysis], chunk_frames=8, memory_budget=0, scratch_dir=str(tmp_path))
+        assert reader.reads == 1
+        coords = open_trajectory(str(tmp_path / 'traj.dcd')).read_frames()
+        average = average_structure(coords)
+        assert np.allclose(average, superpose(coords, center(coords[:1])[0]).mean(axis=0), atol=1e-4)
+        assert np.allclose(rmsd, pairwise_rmsd(center(average[None]), center(coords))[0], atol=1e-4)
+        fitted = superpose(coords, center(average[None])[0])
+        assert np.allclose(rmsf, np.sqrt(((fitted - fitted.mean(axis=0)) ** 2).sum(axis=2).mean(axis=0)), atol=1e-4)
+
+    def test_cache_average_frames(self):
+        instructions = ['parm top.prmtop', 'trajin traj.nc 1 -1 1', 'strip :WAT', 'strip !@CA']
+        instructions += get_reference('average', 'rmsf.dat', None, '@CA', False, 'CpptrajRmsf', None)
+        instructions.append('atomicfluct out rmsf.dat byres')
+        assert cache_average_frames(instructions, None) == instructions
+        # the frames are cached before the strip actions, the second pass reads them with the input topology
+        assert cache_average_frames(instructions, '/scratch') == [
+            'parm top.prmtop', 'trajin traj.nc 1 -1 1', 'outtraj /scratch/frames.nc netcdf', 'strip :WAT', 'strip !@CA',
+            'average crdset MyAvg', 'run', 'clear trajin', 'trajin /scratch/frames.nc parmindex 0',
+            'rms ref MyAvg @CA', 'atomicfluct out rmsf.dat byres']
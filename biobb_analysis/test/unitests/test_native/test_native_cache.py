@@ -0,0 +1,21 @@
+import os
+from biobb_analysis.native.cache import cache_entry, cache_key, file_signature, read_json, write_json
+
+
+class TestNativeCache():
+    def test_cache_key(self, tmp_path):
+        traj = tmp_path / 'traj.trr'
+        traj.write_bytes(b'0' * 10)
+        key = cache_key([file_signature(traj)], 'System', False)
+        assert key == cache_key([file_signature(traj)], 'System', False)
+        assert key != cache_key([file_signature(traj)], 'Protein', False)
+        traj.write_bytes(b'0' * 20)
+        assert key != cache_key([file_signature(traj)], 'System', False)
+
+    def test_cache_entry(self, tmp_path):
+        entry = cache_entry(tmp_path / 'cache', cache_key('a'))
+        assert entry.is_dir()
+        assert read_json(entry / 'meta.json') is None
+        write_json({'n_frames': 3}, entry / 'meta.json')
+        assert read_json(entry / 'meta.json') == {'n_frames': 3}
+        assert os.listdir(entry) == ['meta.json']
@@ -0,0 +1,117 @@
+import struct
+import numpy as np
+from biobb_analysis.native import cluster, rmsd
+from biobb_analysis.native.trajectory import open_trajectory
+
+
+def kabsch_rmsd(a, b):
+    a = a - a.mean(axis=0)
+    b = b - b.mean(axis=0)
+    u, s, vt = np.linalg.svd(a.T @ b)
+    d = np.sign(np.linalg.det(u @ vt))
+    rot = u @ np.diag([1, 1, d]) @ vt
+    return np.sqrt(((a @ rot - b) ** 2).sum() / len(a))
+
+
+def random_rotation(rng):
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    return q * np.sign(np.linalg.det(q))
+
+
+def grouped_frames(rng, n_atoms=12, sizes=(6, 4, 2)):
+    """ Frames around len(sizes) well separated conformations, randomly rotated and translated """
+    frames = []
+    for size in sizes:
+        base = rng.normal(scale=5.0, size=(n_atoms, 3))
+        for _ in range(size):
+            noisy = base + rng.normal(scale=0.05, size=base.shape)
+            frames.append(noisy @ random_rotation(rng) + rng.normal(size=3))
+    return np.array(frames, dtype=np.float32)
+
+
+def write_trr(path, coords, dt=2.0):
+    """ Writes single precision TRR frames with box and coordinates (nm) """
+    with open(path, 'wb') as trr:
+        for i, frame in enumerate(coords):
+            n_atoms = len(frame)
+            version = b'GMX_trn_file'
+            trr.write(struct.pack('>iii', 1993, 13, 12) + version)
+            trr.write(struct.pack('>13i', 0, 0, 36, 0, 0, 0, 0, n_atoms * 12, 0, 0, n_atoms, i * 1000, 0))
+            trr.write(struct.pack('>ff', i * dt, 0.0))
+            trr.write(np.eye(3, dtype='>f4').tobytes())
+            trr.write(np.asarray(frame, dtype='>f4').tobytes())
+
+
+class TestNativeCluster():
+    def setup_class(self):
+        self.rng = np.random.default_rng(7)
+        self.frames = grouped_frames(self.rng)
+
+    def test_pairwise_rmsd(self):
+        block = rmsd.pairwise_rmsd(rmsd.center(self.frames[:5]), rmsd.center(self.frames[3:]))
+        for i in range(5):
+            for j in range(len(self.frames) - 3):
+                assert abs(block[i, j] - kabsch_rmsd(self.frames[i].astype(float), self.frames[j + 3].astype(float))) < 1e-3
+
+    def test_rmsd_matrix(self, tmp_path):
+        np.save(tmp_path / 'coords.npy', self.frames)
+        stats = rmsd.rmsd_matrix(str(tmp_path / 'coords.npy'), str(tmp_path / 'rmsd.npy'), tile_size=5, num_processes=2)
+        matrix = np.load(tmp_path / 'rmsd.npy')
+        n_frames = len(self.frames)
+        assert len(matrix) == rmsd.condensed_size(n_frames)
+        full = np.array([rmsd.condensed_row(matrix, i, n_frames) for i in range(n_frames)])
+        assert np.allclose(full, full.T)
+        assert abs(full[2, 9] - kabsch_rmsd(self.frames[2].astype(float), self.frames[9].astype(float))) < 1e-3
+        assert abs(stats[1] - matrix.max()) < 1e-5
+
+    def test_cross_rmsd_matrix(self, tmp_path):
+        class Reader:
+            n_frames, n_atoms = len(self.frames), self.frames.shape[1]
+
+            def iter_chunks(reader, chunk_size, atoms=None):
+                for first in range(0, len(self.frames), chunk_size):
+                    yield first, self.frames[first:first + chunk_size][:, atoms if atoms is not None else slice(None)]
+        atoms = [0, 2, 3, 7, 11]
+        assert rmsd.write_centered(Reader(), str(tmp_path / 'a.npy'), atoms, range(1, 12, 2), chunk_frames=4) == 6
+        assert rmsd.write_centered(Reader(), str(tmp_path / 'b.npy'), atoms) == len(self.frames)
+        stats = rmsd.cross_rmsd_matrix(str(tmp_path / 'a.npy'), str(tmp_path / 'ab.npy'), str(tmp_path / 'b.npy'), tile_size=4, num_processes=2)
+        matrix = np.load(tmp_path / 'ab.npy')
+        assert matrix.shape == (6, len(self.frames)) and matrix.dtype == np.float32
+        assert abs(matrix[2, 9] - kabsch_rmsd(self.frames[5, atoms].astype(float), self.frames[9, atoms].astype(float))) < 1e-3
+        assert abs(stats[2] - matrix.mean()) < 1e-4
+        # against itself only the upper tiles are computed
+        rmsd.cross_rmsd_matrix(str(tmp_path / 'b.npy'), str(tmp_path / 'bb.npy'), tile_size=5, num_processes=1)
+        square = np.load(tmp_path / 'bb.npy')
+        assert np.allclose(square, square.T) and not square.diagonal().any()
+        assert np.allclose(square[1::2], matrix, atol=1e-5)
+        rmsd.write_matrix_text(square, str(tmp_path / 'bb.dat'), stride=4)
+        lines = (tmp_path / 'bb.dat').read_text().splitlines()
+        assert lines[0].split() == ['#Frame', '1', '5', '9'] and len(lines) == 4
+        # the tiles shrink to fit in the memory budget
+        assert rmsd.tile_size_for_budget(300, 64e9, 8, 1000) == 1000
+        side = rmsd.tile_size_for_budget(300, 1e9, 8, 1000)
+        assert side < 1000 and side ** 2 * rmsd.TILE_PAIR_BYTES * 8 <= 1e9
+
+    def test_methods(self, tmp_path):
+        np.save(tmp_path / 'coords.npy', self.frames)
+        rmsd.rmsd_matrix(str(tmp_path / 'coords.npy'), str(tmp_path / 'rmsd.npy'), num_processes=1)
+        matrix = np.load(tmp_path / 'rmsd.npy', mmap_mode='r')
+        expected = np.repeat([0, 1, 2], [6, 4, 2])
+        for method in (cluster.gromos, cluster.linkage):
+            labels = cluster.sort_clusters(method(matrix, len(self.frames), 1.0))
+            assert np.array_equal(labels, expected)
+        labels = cluster.sort_clusters(cluster.jarvis_patrick(matrix, len(self.frames), 1.0, n_neighbors=5, n_common=2))
+        assert np.array_equal(labels[:10], expected[:10])
+        middle, average, middle_average = cluster.cluster_statistics(matrix, len(self.frames), expected)
+        assert [expected[m] for m in middle] == [0, 1, 2]
+        assert (average < 1.0).all() and (middle_average <= average * 2).all()
+
+    def test_trr_reader(self, tmp_path):
+        write_trr(tmp_path / 'traj.trr', self.frames / 10)
+        reader = open_trajectory(str(tmp_path / 'traj.trr'))
+        assert reader.n_frames == len(self.frames)
+        assert reader.n_atoms == self.frames.shape[1]
+        assert reader.times[3] == 6.0
+        assert np.allclose(reader.read_frames([4], atoms=[1, 2])[0], self.frames[4, [1, 2]], atol=1e-4)
+        chunks = [chunk for _, chunk in reader.iter_chunks(5)]
+        assert np.allclose(np.concatenate(chunks), self.frames, atol=1e-4)
@@ -0,0 +1,58 @@
+import threading
+import time
+import numpy as np
+import pytest
+from biobb_analysis.native import framebus
+from biobb_analysis.native.analysis import RgyrAnalysis, RmsdAnalysis, RmsfAnalysis
+from biobb_analysis.native.framestore import FrameStore
+from biobb_analysis.native.rmsd import center, pairwise_rmsd, superpose
+from test_native_trajectory import write_dcd
+
+pytestmark = pytest.mark.skipif(not framebus.is_available(), reason='multiprocessing.shared_memory needs Python 3.8')
+
+
+class FailingAnalysis(RgyrAnalysis):
+    def consume(self, first_frame, coords):
+        raise ValueError('wrong frame %d' % first_frame)
+
+
+class TestNativeFramebus():
+    def setup_class(self):
+        rng = np.random.default_rng(11)
+        self.coords = (rng.normal(scale=10, size=(1, 12, 3)) + rng.normal(scale=0.5, size=(23, 12, 3))).astype(np.float32)
+
+    def test_backpressure(self):
+        bus = framebus.FrameBus(n_atoms=12, n_consumers=1, chunk_frames=2, n_slots=2)
+        chunks = [(first, self.coords[first:first + 4]) for first in range(0, 23, 4)]
+        reader = threading.Thread(target=bus.publish, args=(chunks,))
+        reader.start()
+        consumer = bus.consume(0)
+        first_frame, coords = next(consumer)
+        time.sleep(0.3)
+        # the reader waits for the consumer when all the slots are full
+        assert bus.published == 2 and reader.is_alive()
+        received = [(first_frame, coords.copy())] + [(first, frames.copy()) for first, frames in consumer]
+        reader.join()
+        assert [first for first, _ in received] == list(range(0, 23, 2))
+        assert np.array_equal(np.concatenate([frames for _, frames in received]), self.coords)
+        bus.unlink()
+
+    def test_run_analyses(self, tmp_path):
+        write_dcd(tmp_path / 'traj.dcd', self.coords)
+        rgyr, rmsd, rmsf = framebus.run_analyses(str(tmp_path / 'traj.dcd'), [RgyrAnalysis(), RmsdAnalysis(), RmsfAnalysis()], chunk_frames=5, n_slots=2)
+        centered = center(self.coords)
+        assert np.allclose(rgyr, np.sqrt((centered ** 2).sum(axis=2).mean(axis=1)))
+        assert np.allclose(rmsd, pairwise_rmsd(centered[:1], centered)[0], atol=1e-4)
+        fitted = superpose(self.coords, self.coords[0])
+        assert np.allclose(np.sqrt(((fitted - centered[0]) ** 2).sum(axis=2).mean(axis=1)), rmsd, atol=1e-4)
+        assert np.allclose(rmsf, np.sqrt(((fitted - fitted.mean(axis=0)) ** 2).sum(axis=2).mean(axis=0)), atol=1e-4)
+        # the second run reads the frames stored by the first one
+        store = FrameStore(tmp_path / 'store')
+        for _ in range(2):
+            stored_rgyr, = framebus.run_analyses(str(tmp_path / 'traj.dcd'), [RgyrAnalysis()], chunk_frames=5, n_slots=2, store=store)
+            assert np.allclose(stored_rgyr, rgyr) and len(store.entries()) == 1
+
+    def test_failing_consumer(self, tmp_path):
+        write_dcd(tmp_path / 'traj.dcd', self.coords)
+        with pytest.raises(RuntimeError, match='wrong frame 0'):
+            framebus.run_analyses(str(tmp_path / 'traj.dcd'), [RgyrAnalysis(), FailingAnalysis()], chunk_frames=5, n_slots=2)
@@ -0,0 +1,51 @@
+import os
+import numpy as np
+from biobb_analysis.native.framestore import FrameStore, FrameStoreEntry
+from biobb_analysis.native.trajectory import open_trajectory
+from test_native_trajectory import write_dcd
+
+
+class TestNativeFramestore():
+    def setup_class(self):
+        rng = np.random.default_rng(5)
+        self.coords = rng.normal(scale=10, size=(25, 8, 3)).astype(np.float32)
+
+    def test_open_and_subset(self, tmp_path):
+        traj_path = str(tmp_path / 'traj.dcd')
+        write_dcd(traj_path, self.coords)
+        store = FrameStore(tmp_path / 'store')
+        assert store.lookup(traj_path) is None
+        entry = store.open(traj_path, atoms=[1, 3, 5, 6])
+        assert isinstance(entry, FrameStoreEntry) and entry.n_frames == 25 and entry.n_atoms == 4
+        # a smaller subset is read from the stored one, all the atoms are not stored yet
+        assert store.lookup(traj_path, atoms=[3, 6]).path == entry.path
+        assert store.lookup(traj_path) is None
+        assert np.allclose(np.concatenate([chunk for _, chunk in entry.iter_chunks(7, atoms=[3, 6])]), self.coords[:, [3, 6]], atol=1e-3)
+        full = store.open(traj_path)
+        assert full.n_atoms == 8 and np.allclose(full.read_frames([24, 0, 13]), self.coords[[24, 0, 13]], atol=1e-3)
+        assert np.allclose(full.read_frames(atoms=[2]), open_trajectory(traj_path).read_frames(atoms=[2]))
+        # a modified trajectory does not match its stored entries
+        write_dcd(traj_path, self.coords[:10])
+        os.utime(traj_path, (1, 1))
+        assert store.lookup(traj_path) is None
+
+    def test_selection_and_eviction(self, tmp_path):
+        paths = [str(tmp_path / ('traj%d.dcd' % i)) for i in range(3)]
+        for path in paths:
+            write_dcd(path, self.coords)
+        selection = {'group': 'C-alpha'}
+        store = FrameStore(tmp_path / 'store', budget=2.5 * self.coords.nbytes)
+        for i, path in enumerate(paths):
+            with store.writer(path, 8, selection=selection, chunk_frames=10) as writer:
+                for start in range(0, 25, 4):
+                    writer.add(self.coords[start:start + 4] + i)
+            os.utime(str(writer.entry_dir.joinpath('manifest.json')), (i, i))
+            if i == 1:
+                # the first trajectory is used again, the second one is the least recently used
+                store.lookup(paths[0], selection=selection)
+        assert [chunk['n_frames'] for chunk in writer.manifest['chunks']] == [10, 10, 5]
+        assert store.lookup(paths[1], selection=selection) is None
+        assert store.lookup(paths[0], selection={'group': 'Protein'}) is None and store.lookup(paths[0]) is None
+        entry = store.lookup(paths[2], selection=selection)
+        assert np.array_equal(entry.read_frames(), self.coords + 2)
+        assert len(store.entries()) == 2 and not list(store.store_dir.glob('*.tmp'))
@@ -0,0 +1,84 @@
+import struct
+import numpy as np
+import pytest
+from biobb_analysis.native.metadata import probe, topology_atoms, AKMA_TO_PS
+from test_native_trajectory import write_dcd, write_xtc
+
+
+def nc_name(name):
+    return struct.pack('>i', len(name)) + name.encode() + b'\x00' * (-len(name) % 4)
+
+
+def write_amber_netcdf(path, coords, times, angles=(90.0, 90.0, 90.0)):
+    """ Writes an AMBER NetCDF trajectory (64 bits offset format) with time, coordinates and cell records """
+    n_frames, n_atoms, _ = coords.shape
+    dims = [('frame', 0), ('spatial', 3), ('atom', n_atoms), ('cell_spatial', 3), ('cell_angular', 3)]
+    variables = [('time', [0], 5, 4), ('coordinates', [0, 2, 1], 5, n_atoms * 12), ('cell_lengths', [0, 3], 6, 24), ('cell_angles', [0, 4], 6, 24)]
+    header = b'CDF\x02' + struct.pack('>i', n_frames)
+    header += struct.pack('>ii', 10, len(dims)) + b''.join(nc_name(name) + struct.pack('>i', size) for name, size in dims)
+    header += struct.pack('>ii', 12, 1) + nc_name('Conventions') + struct.pack('>ii', 2, 5) + b'AMBER\x00\x00\x00'
+    header_size = len(header) + 8 + sum(len(nc_name(name)) + 4 + 4 * len(ids) + 8 + 8 + 8 for name, ids, _, _ in variables)
+    header += struct.pack('>ii', 11, len(variables))
+    begin = header_size
+    for name, ids, nc_type, vsize in variables:
+        header += nc_name(name) + struct.pack('>i%di' % len(ids), len(ids), *ids) + struct.pack('>ii', 0, 0) + struct.pack('>iiq', nc_type, vsize, begin)
+        begin += vsize
+    with open(path, 'wb') as netcdf:
+        netcdf.write(header)
+        for frame in range(n_frames):
+            netcdf.write(struct.pack('>f', times[frame]) + coords[frame].astype('>f4').tobytes())
+            netcdf.write(struct.pack('>3d', 30.0, 30.0, 30.0) + struct.pack('>3d', *angles))
+
+
+def write_mdcrd(path, coords, box=True):
+    """ Writes an AMBER ASCII trajectory """
+    with open(path, 'w') as mdcrd:
+        mdcrd.write('test\n')
+        for frame in coords:
+            values = frame.ravel()
+            for line in range(0, len(values), 10):
+                mdcrd.write(''.join('%8.3f' % value for value in values[line:line + 10]) + '\n')
+            if box:
+                mdcrd.write('%8.3f%8.3f%8.3f\n' % (30.0, 30.0, 30.0))
+
+
+def write_prmtop(path, n_atoms):
+    with open(path, 'w') as prmtop:
+        prmtop.write('%VERSION  VERSION_STAMP = V0001.000\n%FLAG TITLE\n%FORMAT(20a4)\ntest\n')
+        prmtop.write('%%FLAG POINTERS\n%%FORMAT(10I8)\n%8d%8d\n' % (n_atoms, 1))
+
+
+class TestNativeMetadata():
+    def setup_class(self):
+        self.coords = np.random.default_rng(7).normal(scale=10, size=(5, 7, 3)).astype(np.float32)
+
+    def test_binary_formats(self, tmp_path):
+        write_dcd(tmp_path / 'traj.dcd', self.coords)
+        assert probe(str(tmp_path / 'traj.dcd')) == {'format': 'dcd', 'n_frames': 5, 'n_atoms': 7, 'box': 'orthorhombic',
+                                                      'dt': pytest.approx(0.002 * AKMA_TO_PS)}
+        write_xtc(tmp_path / 'traj.xtc', 6, dt=2.0, truncated=True)
+        assert probe(str(tmp_path / 'traj.xtc')) == {'format': 'xtc', 'n_frames': 6, 'n_atoms': 20, 'box': 'orthorhombic', 'dt': 2.0}
+        write_amber_netcdf(tmp_path / 'traj.nc', self.coords, [0.0, 10.0, 20.0, 30.0, 40.0], angles=(109.47, 109.47, 109.47))
+        assert probe(str(tmp_path / 'traj.nc')) == {'format': 'netcdf', 'n_frames': 5, 'n_atoms': 7, 'box': 'triclinic', 'dt': 10.0}
+
+    def test_ascii_formats(self, tmp_path):
+        write_prmtop(tmp_path / 'top.prmtop', 7)
+        assert topology_atoms(str(tmp_path / 'top.prmtop')) == 7
+        for box in (True, False):
+            write_mdcrd(tmp_path / 'traj.mdcrd', self.coords, box)
+            metadata = probe(str(tmp_path / 'traj.mdcrd'), str(tmp_path / 'top.prmtop'))
+            assert (metadata['n_frames'], metadata['n_atoms'], metadata['box']) == (5, 7, 'orthorhombic' if box else None)
+        (tmp_path / 'traj.pdb').write_text('CRYST1   30.000   30.000   30.000  90.00  90.00  90.00 P 1           1\n' +
+                                           ''.join('MODEL %8d\n' % model + 'ATOM      1  CA  ALA A   1       0.000   0.000   0.000\n' * 3 + 'ENDMDL\n' for model in range(4)))
+        assert probe(str(tmp_path / 'traj.pdb')) == {'format': 'pdb', 'n_frames': 4, 'n_atoms': 3, 'box': 'orthorhombic', 'dt': None}
+        (tmp_path / 'traj.gro').write_text('')
+        assert probe(str(tmp_path / 'traj.gro')) is None
+
+    def test_cache(self, tmp_path):
+        write_dcd(tmp_path / 'traj.dcd', self.coords, box=False)
+        metadata = probe(str(tmp_path / 'traj.dcd'), cache_dir=str(tmp_path / 'cache'))
+        assert metadata['n_frames'] == 5 and metadata['box'] is None
+        assert len(list((tmp_path / 'cache').iterdir())) == 1
+        # a new signature (size and modification time) invalidates the cached metadata
+        write_dcd(tmp_path / 'traj.dcd', self.coords[:3], box=False)
+        assert probe(str(tmp_path / 'traj.dcd'), cache_dir=str(tmp_path / 'cache'))['n_frames'] == 3
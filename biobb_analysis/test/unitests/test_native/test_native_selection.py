@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from biobb_analysis.native.selection import mask_atoms
+from biobb_analysis.native.trajectory import atom_runs, open_trajectory
+from test_native_cluster import write_trr
+from test_native_metadata import write_amber_netcdf
+from test_native_trajectory import write_dcd
+
+ATOMS = [('N', 'ALA'), ('CA', 'ALA'), ('C', 'ALA'), ('O', 'ALA'), ('H1', 'ALA'), ('N', 'GLY'), ('CA', 'GLY'), ('HA2', 'GLY'),
+         ('O', 'WAT'), ('H1', 'WAT'), ('H2', 'WAT'), ('O', 'WAT'), ('H1', 'WAT'), ('H2', 'WAT'), ('NA', 'NA')]
+RESIDUES = [1, 1, 1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5]
+
+
+def write_named_prmtop(path):
+    labels = ['ALA', 'GLY', 'WAT', 'WAT', 'NA']
+    pointers = [1, 6, 9, 12, 15]
+    with open(path, 'w') as prmtop:
+        prmtop.write('%VERSION  VERSION_STAMP = V0001.000\n%FLAG POINTERS\n%FORMAT(10I8)\n' + '%8d%8d\n' % (len(ATOMS), 1))
+        prmtop.write('%FLAG ATOM_NAME\n%FORMAT(20a4)\n')
+        names = ''.join('%-4s' % name for name, _ in ATOMS)
+        prmtop.write('\n'.join(names[i:i + 80] for i in range(0, len(names), 80)) + '\n')
+        prmtop.write('%FLAG RESIDUE_LABEL\n%FORMAT(20a4)\n' + ''.join('%-4s' % label for label in labels) + '\n')
+        prmtop.write('%FLAG RESIDUE_POINTER\n%FORMAT(10I8)\n' + ''.join('%8d' % pointer for pointer in pointers) + '\n')
+
+
+def write_named_pdb(path):
+    with open(path, 'w') as pdb:
+        for i, ((name, residue), number) in enumerate(zip(ATOMS, RESIDUES)):
+            pdb.write('ATOM  %5d %-4s %-4s %4d    %8.3f%8.3f%8.3f\n' % (i + 1, name, residue, number, 0, 0, 0))
+
+
+class TestNativeSelection():
+    def setup_class(self):
+        self.coords = np.random.default_rng(9).normal(scale=10, size=(6, 300, 3)).astype(np.float32)
+
+    def test_masks(self, tmp_path):
+        write_named_prmtop(tmp_path / 'top.prmtop')
+        write_named_pdb(tmp_path / 'top.pdb')
+        for top in ('top.prmtop', 'top.pdb'):
+            top_path = str(tmp_path / top)
+            assert mask_atoms(top_path, '@CA').tolist() == [1, 6]
+            assert mask_atoms(top_path, '!@H*,1H*,2H*,3H*').tolist() == [0, 1, 2, 3, 5, 6, 8, 11, 14]
+            assert mask_atoms(top_path, ':WAT,HOH,SOL').tolist() == list(range(8, 14))
+            assert mask_atoms(top_path, '!:WAT,HOH,SOL,TIP3,TP3,SOD,CLA,Na+,Cl-,NA,CL,K+,K').tolist() == list(range(8))
+            assert mask_atoms(top_path, ':2-3').tolist() == list(range(5, 11))
+            assert mask_atoms(top_path, ':*').tolist() == list(range(15))
+        with pytest.raises(ValueError):
+            mask_atoms(str(tmp_path / 'top.prmtop'), ':1-10&@CA')
+
+    def test_atom_runs(self):
+        runs, positions = atom_runs([250, 3, 4, 30, 5, 3], max_gap=32)
+        assert runs == [(3, 31), (250, 251)]
+        assert positions.tolist() == [28, 0, 1, 27, 2, 0]
+        assert atom_runs([3, 40], max_gap=32)[0] == [(3, 4), (40, 41)]
+
+    def test_subset_reads(self, tmp_path):
+        write_dcd(tmp_path / 'traj.dcd', self.coords)
+        write_amber_netcdf(tmp_path / 'traj.nc', self.coords, [float(i) for i in range(6)])
+        write_trr(tmp_path / 'traj.trr', self.coords / 10)
+        atoms = [5, 1, 2, 3, 120, 121, 299, 160]
+        for name in ('traj.dcd', 'traj.nc', 'traj.trr'):
+            reader = open_trajectory(str(tmp_path / name))
+            assert reader.n_frames == 6 and reader.n_atoms == 300
+            assert np.allclose(reader.read_frames([4, 1], atoms=atoms), self.coords[[4, 1]][:, atoms], atol=1e-4)
+            assert np.allclose(np.concatenate([chunk for _, chunk in reader.iter_chunks(4, atoms)]), self.coords[:, atoms], atol=1e-4)
+            # large selections are read as whole frames
+            assert np.allclose(reader.read_frames([0], atoms=list(range(1, 299))), self.coords[:1, 1:299], atol=1e-4)
+        assert open_trajectory(str(tmp_path / 'traj.nc')).times == [float(i) for i in range(6)]
@@ -0,0 +1,38 @@
+import numpy as np
+from biobb_analysis.native.slicing import merge_ranges, select_times, slice_dcd, slice_xtc
+from biobb_analysis.native.trajectory import open_trajectory, XTCIndex
+from test_native_trajectory import write_dcd, write_xtc
+
+
+class TestNativeSlicing():
+    def setup_class(self):
+        self.coords = np.random.default_rng(7).normal(scale=10, size=(12, 5, 3)).astype(np.float32)
+
+    def test_merge_ranges(self):
+        assert merge_ranges([(10, 5), (15, 5), (30, 5)]) == [[10, 10], [30, 5]]
+
+    def test_slice_dcd(self, tmp_path):
+        for box in (True, False):
+            write_dcd(tmp_path / 'traj.dcd', self.coords, box)
+            for start, end, step in ((1, -1, 1), (2, 9, 3), (4, 100, 2)):
+                n_frames = slice_dcd(str(tmp_path / 'traj.dcd'), str(tmp_path / 'slice.dcd'), start, end, step)
+                reader = open_trajectory(str(tmp_path / 'slice.dcd'))
+                expected = self.coords[start - 1:None if end == -1 else end:step]
+                assert n_frames == reader.n_frames == reader.icntrl[0] == len(expected)
+                assert reader.icntrl[2] == step and reader.has_box == box
+                assert np.array_equal(reader.read_frames(), expected)
+
+    def test_select_times(self):
+        times = [0.0, 2.0, 4.0, 6.0, 8.0, 10.0]
+        assert select_times(times, 0, 0) == [0]
+        assert select_times(times, 3, 10) == [2, 3, 4, 5]
+        assert select_times(times, 2, 10, 4) == [1, 3, 5]
+
+    def test_slice_xtc(self, tmp_path):
+        write_xtc(tmp_path / 'traj.xtc', 8)
+        index = XTCIndex(str(tmp_path / 'traj.xtc'))
+        assert slice_xtc(str(tmp_path / 'traj.xtc'), str(tmp_path / 'slice.xtc'), 2, 12, 4) == 3
+        sliced = XTCIndex(str(tmp_path / 'slice.xtc'))
+        assert sliced.times == [2.0, 6.0, 10.0]
+        data, output = (tmp_path / 'traj.xtc').read_bytes(), (tmp_path / 'slice.xtc').read_bytes()
+        assert output == b''.join(data[index.offsets[i]:index.offsets[i] + index.sizes[i]] for i in (1, 3, 5))
@@ -0,0 +1,66 @@
+import struct
+import numpy as np
+from biobb_analysis.native.trajectory import count_frames, open_trajectory, frame_times, XTCIndex
+
+
+def write_dcd(path, coords, box=True):
+    """ Writes a CHARMM DCD trajectory (Angstroms) with unit cell records """
+    n_frames, n_atoms, _ = coords.shape
+    icntrl = [n_frames, 1, 1, n_frames, 0, 0, 0, 0, 0, 0, int(box), 0, 0, 0, 0, 0, 0, 0, 0, 24]
+    with open(path, 'wb') as dcd:
+        dcd.write(struct.pack('<i4s9if10ii', 84, b'CORD', *icntrl[:9], 0.002, *icntrl[10:], 84))
+        dcd.write(struct.pack('<ii80si', 84, 1, b'test'.ljust(80), 84))
+        dcd.write(struct.pack('<iii', 4, n_atoms, 4))
+        for frame in coords:
+            if box:
+                dcd.write(struct.pack('<i6di', 48, 10.0, 90.0, 10.0, 90.0, 90.0, 10.0, 48))
+            for axis in range(3):
+                dcd.write(struct.pack('<i', 4 * n_atoms) + frame[:, axis].astype('<f4').tobytes() + struct.pack('<i', 4 * n_atoms))
+
+
+def write_netcdf_header(path, n_frames):
+    """ Writes the first bytes of a classic NetCDF file """
+    with open(path, 'wb') as netcdf:
+        netcdf.write(b'CDF\x02' + struct.pack('>i', n_frames) + b'\x00' * 8)
+
+
+def write_xtc(path, n_frames, n_atoms=20, dt=2.0, truncated=False):
+    """ Writes XTC frame headers followed by random bytes in place of the compressed coordinates """
+    rng = np.random.default_rng(3)
+    with open(path, 'wb') as xtc:
+        for frame in range(n_frames):
+            nbytes = int(rng.integers(30, 60))
+            xtc.write(struct.pack('>iiif', 1995, n_atoms, frame * 1000, frame * dt) + struct.pack('>9f', *np.eye(3).ravel()))
+            xtc.write(struct.pack('>if6iii', n_atoms, 1000.0, 0, 0, 0, 10, 10, 10, 0, nbytes) + rng.bytes(nbytes) + b'\x00' * (-nbytes % 4))
+        if truncated:
+            xtc.write(struct.pack('>iiif', 1995, n_atoms, n_frames * 1000, n_frames * dt))
+
+
+class TestNativeTrajectory():
+    def setup_class(self):
+        self.coords = np.random.default_rng(5).normal(scale=10, size=(7, 9, 3)).astype(np.float32)
+
+    def test_dcd_reader(self, tmp_path):
+        for box in (True, False):
+            write_dcd(tmp_path / 'traj.dcd', self.coords, box)
+            reader = open_trajectory(str(tmp_path / 'traj.dcd'))
+            assert reader.n_frames == 7 and reader.n_atoms == 9 and reader.has_box == box
+            assert np.allclose(reader.read_frames([5, 1]), self.coords[[5, 1]])
+            assert np.allclose(reader.read_frames([3], atoms=[0, 4])[0], self.coords[3, [0, 4]])
+
+    def test_count_frames(self, tmp_path):
+        write_dcd(tmp_path / 'traj.dcd', self.coords)
+        write_netcdf_header(tmp_path / 'traj.nc', 42)
+        (tmp_path / 'traj.gro').write_bytes(b'')
+        assert count_frames(str(tmp_path / 'traj.dcd')) == 7
+        assert count_frames(str(tmp_path / 'traj.nc')) == 42
+        assert count_frames(str(tmp_path / 'traj.gro')) is None
+
+    def test_xtc_index(self, tmp_path):
+        write_xtc(tmp_path / 'traj.xtc', 6, truncated=True)
+        index = XTCIndex(str(tmp_path / 'traj.xtc'))
+        assert index.n_frames == 6 and index.n_atoms == 20
+        assert index.steps == [0, 1000, 2000, 3000, 4000, 5000]
+        assert index.offsets[1] == index.sizes[0] and sum(index.sizes) == (tmp_path / 'traj.xtc').stat().st_size - 16
+        assert count_frames(str(tmp_path / 'traj.xtc')) == 6
+        assert frame_times(str(tmp_path / 'traj.xtc')) == [0.0, 2.0, 4.0, 6.0, 8.0, 10.0]
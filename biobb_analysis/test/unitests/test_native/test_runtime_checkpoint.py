@@ -0,0 +1,24 @@
+from biobb_analysis.runtime.checkpoint import checkpoint_dir, chunk_ranges, commit_chunk, committed_chunk, load_manifest
+
+
+class TestRuntimeCheckpoint():
+    def test_chunk_ranges(self):
+        assert chunk_ranges(1, 11, 2, 3) == [(1, 5), (7, 11)]
+        assert chunk_ranges(1, 10, 1, 4) == [(1, 4), (5, 8), (9, 10)]
+
+    def test_manifest(self, tmp_path):
+        traj, output = tmp_path / 'traj.dcd', tmp_path / 'image.nc'
+        traj.write_bytes(b'0' * 100)
+        manifest = load_manifest(output, {'mask': 'c-alpha'}, traj)
+        chunk = tmp_path / 'chunk.nc'
+        chunk.write_text('frames 1-4')
+        commit_chunk(output, manifest, 0, chunk, 1, 4)
+        assert not chunk.exists()
+        manifest = load_manifest(output, {'mask': 'c-alpha'}, traj)
+        assert committed_chunk(output, manifest, 0) == str(checkpoint_dir(output) / 'chunk_00000.nc')
+        assert committed_chunk(output, manifest, 1) is None
+        # a different input discards the committed chunks
+        traj.write_bytes(b'0' * 50)
+        manifest = load_manifest(output, {'mask': 'c-alpha'}, traj)
+        assert committed_chunk(output, manifest, 0) is None
+        assert not (checkpoint_dir(output) / 'chunk_00000.nc').exists()
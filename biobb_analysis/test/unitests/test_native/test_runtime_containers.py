@@ -0,0 +1,78 @@
+import stat
+import subprocess
+from biobb_analysis.runtime.containers import ContainerPool, parse_run_args, main
+
+
+class FakeRuntime():
+    """ Runs the commands in the host replacing the volume path by the host folder of the container """
+    def __init__(self):
+        self.started, self.stopped, self.mounts = [], [], {}
+
+    def start(self, image, host_dir, volume_path):
+        container_id = 'fake%d' % len(self.started)
+        self.started.append(container_id)
+        self.mounts[container_id] = (volume_path, host_dir)
+        return container_id
+
+    def exec(self, container_id, cmd, user=None, working_dir=None):
+        volume_path, host_dir = self.mounts[container_id]
+        return subprocess.call([arg.replace(volume_path, host_dir) for arg in cmd])
+
+    def stop(self, container_id):
+        self.stopped.append(container_id)
+
+
+class TestRuntimeContainers():
+    def run_job(self, pool, tmp_path, name):
+        volume = tmp_path / name
+        volume.mkdir()
+        (volume / 'input.txt').write_text(name)
+        assert pool.run('ambertools', str(volume), '/inout', ['cp', '/inout/input.txt', '/inout/output.txt']) == 0
+        assert (volume / 'output.txt').read_text() == name
+        assert (volume / 'input.txt').exists()
+
+    def test_reuse_and_recycle(self, tmp_path):
+        runtime = FakeRuntime()
+        pool = ContainerPool(runtime, tmp_path / 'pool', size=1, max_jobs=2)
+        self.run_job(pool, tmp_path, 'job1')
+        self.run_job(pool, tmp_path, 'job2')
+        assert runtime.started == ['fake0'] and runtime.stopped == ['fake0']
+        self.run_job(pool, tmp_path, 'job3')
+        assert runtime.started == ['fake0', 'fake1']
+        pool.shutdown()
+        assert runtime.stopped == ['fake0', 'fake1']
+
+    def test_idle_timeout(self, tmp_path):
+        runtime = FakeRuntime()
+        pool = ContainerPool(runtime, tmp_path / 'pool', idle_timeout=-1)
+        # the containers are stopped when they are released, without waiting for another job
+        self.run_job(pool, tmp_path, 'job1')
+        assert runtime.stopped == ['fake0']
+        self.run_job(pool, tmp_path, 'job2')
+        assert runtime.started == ['fake0', 'fake1'] and runtime.stopped == ['fake0', 'fake1']
+
+    def test_reap(self, tmp_path):
+        runtime = FakeRuntime()
+        pool = ContainerPool(runtime, tmp_path / 'pool', idle_timeout=3600)
+        self.run_job(pool, tmp_path, 'job1')
+        pool.reap()
+        assert runtime.stopped == []
+        pool.idle_timeout = -1
+        pool.reap()
+        assert runtime.stopped == ['fake0']
+
+    def test_parse_run_args(self):
+        docker = ['-w', '/tmp', '-v', '/host/dir:/tmp', '--user', '1000', 'afandiadib/ambertools:serial', '/bin/bash', '-c', 'cpptraj -i /tmp/instructions.in']
+        assert parse_run_args(docker) == ('afandiadib/ambertools:serial', '/host/dir', '/tmp', '1000', '/tmp', ['/bin/bash', '-c', 'cpptraj -i /tmp/instructions.in'])
+        singularity = ['-e', '--bind', '/host/dir:/tmp', 'gromacs.sif', 'gmx', 'rms']
+        assert parse_run_args(singularity) == ('gromacs.sif', '/host/dir', '/tmp', None, None, ['gmx', 'rms'])
+
+    def test_passthrough(self, tmp_path, monkeypatch):
+        # singularity pull of the remote images is run by the runtime binary
+        binary = tmp_path / 'singularity'
+        binary.write_text('#!/bin/sh\necho "$@" > %s\n' % (tmp_path / 'args.txt'))
+        binary.chmod(binary.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv('BIOBB_POOL_RUNTIME', str(binary))
+        monkeypatch.setenv('BIOBB_POOL_DIR', str(tmp_path / 'pool'))
+        assert main(['biobb_analysis_pool_singularity', 'pull', '--name', 'gromacs.sif', 'shub://michael-tn/gromacs']) == 0
+        assert (tmp_path / 'args.txt').read_text() == 'pull --name gromacs.sif shub://michael-tn/gromacs\n'
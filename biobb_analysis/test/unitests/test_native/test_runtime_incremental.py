@@ -0,0 +1,39 @@
+import pytest
+from biobb_analysis.runtime.incremental import append_rows, averages, get_incremental, load_state, read_rows, renumber, save_state, update_accumulators
+
+
+class TestRuntimeIncremental():
+    def test_state(self, tmp_path):
+        traj, output = tmp_path / 'traj.dcd', tmp_path / 'rms.dat'
+        traj.write_bytes(b'0' * 100)
+        output.write_text('#Frame RMSD_00001\n       1       0.0000\n       2       1.0000\n')
+        header, rows = read_rows(output)
+        accumulators = update_accumulators(None, rows)
+        save_state(output, {'mask': 'c-alpha'}, traj, len(rows), accumulators, last_frame=2)
+        assert load_state(output, {'mask': 'backbone'}, traj) is None
+        state = load_state(output, {'mask': 'c-alpha'}, traj)
+        assert state['last_frame'] == 2 and state['rows'] == 2
+        # frames appended to the same trajectory
+        traj.write_bytes(b'0' * 150)
+        assert load_state(output, {'mask': 'c-alpha'}, traj)['rows'] == 2
+        # trajectory replaced by a larger different one
+        traj.write_bytes(b'1' * 200)
+        assert load_state(output, {'mask': 'c-alpha'}, traj) is None
+        save_state(output, {'mask': 'c-alpha'}, traj, len(rows), accumulators, last_frame=2)
+        traj.write_bytes(b'1' * 50)
+        assert load_state(output, {'mask': 'c-alpha'}, traj) is None
+
+    def test_get_incremental(self):
+        assert get_incremental({}, None, 'CpptrajRms') is False
+        assert get_incremental({'incremental': True}, None, 'CpptrajRms') is True
+        with pytest.raises(SystemExit):
+            get_incremental({'incremental': 'yes'}, None, 'CpptrajRms')
+
+    def test_append(self, tmp_path):
+        output = tmp_path / 'rms.dat'
+        output.write_text('#Frame RMSD_00001\n       1       0.0000\n       2       1.0000\n')
+        new_rows = [renumber(row, 2 + i + 1) for i, row in enumerate(['       2       3.0000\n'])]
+        append_rows(output, new_rows)
+        header, rows = read_rows(output)
+        assert rows[-1] == '       3       3.0000\n'
+        assert abs(averages(update_accumulators(None, rows))[0][0] - 4 / 3) < 1e-9
@@ -0,0 +1,51 @@
+import os
+import stat
+import subprocess
+from types import SimpleNamespace
+from biobb_analysis.runtime.mpi import unsafe_instructions, launcher_cmd
+from biobb_analysis.ambertools.common import get_launcher_cmd
+
+# runs the command once per rank, like mpirun on a single node
+FAKE_LAUNCHER = '#!/bin/sh\nshift\nN=$1\nshift\nfor RANK in $(seq 0 $((N - 1))); do OMPI_COMM_WORLD_RANK=$RANK "$@" || exit 1; done\n'
+
+
+def launcher_obj(**kwargs):
+    properties = dict(mpi_ranks=2, mpi_launcher='mpirun', mpi_binary_path='cpptraj.MPI', omp_threads=None,
+                      stdin_pipe=False, container_path=None, environment=None, out_log=None)
+    properties.update(kwargs)
+    return SimpleNamespace(**properties)
+
+
+class TestRuntimeMpi():
+    def test_unsafe_instructions(self):
+        instructions = 'parm top.prmtop\ntrajin traj.nc 1 -1 2\nstrip :WAT\nrms first out rms.dat\ntrajout out.dcd dcd\nrun\n'
+        assert unsafe_instructions(instructions) == []
+        assert unsafe_instructions(['parm top.prmtop', 'unwrap :1-10', 'trajout out.pdb pdb multi']) == ['unwrap :1-10', 'trajout out.pdb pdb multi']
+        assert unsafe_instructions(['trajout out.nc netcdf onlyframes 2-10', 'trajout out.xtc']) == ['trajout out.nc netcdf onlyframes 2-10', 'trajout out.xtc']
+
+    def test_launcher_cmd(self):
+        assert launcher_cmd(['cpptraj', '-i', 'in.in'], 4) == ['mpirun', '-np', '4', 'cpptraj.MPI', '-i', 'in.in']
+        assert launcher_cmd(['cpptraj'], 2, 'srun --mpi=pmix', '/opt/cpptraj.MPI') == ['srun', '--mpi=pmix', '-n', '2', '/opt/cpptraj.MPI']
+        assert launcher_cmd(['cpptraj'], 2, '/usr/bin/mpiexec --bind-to core')[:4] == ['/usr/bin/mpiexec', '--bind-to', 'core', '-np']
+
+    def test_serial_fallback(self, tmp_path):
+        cmd = ['cpptraj', '-i', 'in.in']
+        assert get_launcher_cmd(launcher_obj(mpi_ranks=1), cmd, ['parm top.prmtop']) == cmd
+        assert get_launcher_cmd(launcher_obj(), cmd, ['parm top.prmtop', 'unwrap']) == cmd
+        assert get_launcher_cmd(launcher_obj(mpi_launcher=str(tmp_path / 'missing')), cmd, ['parm top.prmtop']) == cmd
+        obj = launcher_obj(stdin_pipe=True, omp_threads=4)
+        assert get_launcher_cmd(obj, ['cpptraj'], ['parm top.prmtop']) == ['cpptraj']
+        assert obj.environment['OMP_NUM_THREADS'] == '4'
+
+    def test_local_ranks(self, tmp_path):
+        launcher = tmp_path / 'mpirun'
+        launcher.write_text(FAKE_LAUNCHER)
+        launcher.chmod(launcher.stat().st_mode | stat.S_IEXEC)
+        binary = tmp_path / 'cpptraj.MPI'
+        binary.write_text('#!/bin/sh\ntouch "$2.$OMPI_COMM_WORLD_RANK"\n')
+        binary.chmod(binary.stat().st_mode | stat.S_IEXEC)
+        cmd = get_launcher_cmd(launcher_obj(mpi_launcher=str(launcher), mpi_binary_path=str(binary)),
+                               ['cpptraj', '-i', str(tmp_path / 'in.in')], ['parm top.prmtop', 'trajin traj.nc', 'radgyr out rgyr.dat'])
+        assert cmd[:4] == [str(launcher), '-np', '2', str(binary)]
+        subprocess.run(cmd, check=True)
+        assert sorted(name for name in os.listdir(tmp_path) if name.startswith('in.in')) == ['in.in.0', 'in.in.1']
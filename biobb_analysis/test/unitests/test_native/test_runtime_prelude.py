@@ -0,0 +1,58 @@
+import subprocess
+from types import SimpleNamespace
+from biobb_analysis.ambertools.common import setup_structure, use_prelude_artifact
+
+# writes the trajout and parmwrite outputs of the instructions file
+FAKE_CPPTRAJ = '''import sys
+for line in open(sys.argv[2]):
+    words = line.split()
+    if words and words[0] == 'trajout' or words[:2] == ['parmwrite', 'out']:
+        open(words[1] if words[0] == 'trajout' else words[2], 'w').write(line)
+'''
+
+
+def prelude_obj(tmp_path, **kwargs):
+    (tmp_path / 'top.prmtop').write_text('top')
+    (tmp_path / 'traj.nc').write_text('traj')
+    (tmp_path / 'cpptraj.py').write_text(FAKE_CPPTRAJ)
+    obj = SimpleNamespace(prelude_cache_dir=str(tmp_path / 'prelude'), new_frames=None, container_path=None, stdin_pipe=False,
+                          stdin_text=None, instructions_file=str(tmp_path / 'instructions.in'), binary_path='cpptraj', runs=[],
+                          io_dict={'in': {'input_top_path': str(tmp_path / 'top.prmtop'), 'input_traj_path': str(tmp_path / 'traj.nc')}})
+    obj.__dict__.update(kwargs)
+
+    def run_biobb():
+        obj.runs.append(obj.cmd)
+        obj.return_code = subprocess.run(['python', str(tmp_path / 'cpptraj.py')] + obj.cmd[1:]).returncode
+    obj.run_biobb = run_biobb
+    return obj
+
+
+def block_instructions(tmp_path, start=1):
+    return ['parm ' + str(tmp_path / 'top.prmtop'), 'trajin ' + str(tmp_path / 'traj.nc') + ' %d -1 1' % start] + \
+        setup_structure(None) + ['strip !@CA', 'radgyr time 1 out rgyr.dat']
+
+
+class TestRuntimePrelude():
+    def test_prelude_artifact(self, tmp_path):
+        obj = prelude_obj(tmp_path)
+        instructions = use_prelude_artifact(obj, block_instructions(tmp_path), None)
+        assert len(obj.runs) == 1
+        entry = (tmp_path / 'prelude').iterdir().__next__()
+        assert instructions == ['parm ' + str(entry / 'prelude.parm7'), 'trajin ' + str(entry / 'prelude.nc'), 'strip !@CA', 'radgyr time 1 out rgyr.dat']
+        assert sorted(path.name for path in entry.iterdir()) == ['prelude.in', 'prelude.json', 'prelude.nc', 'prelude.parm7']
+        prelude = (entry / 'prelude.in').read_text().splitlines()
+        assert prelude[2:6] == setup_structure(None) and 'parmstrip ' + setup_structure(None)[-1][6:] in prelude
+        # the next analysis of the same slice reuses the artifact, other slices create their own one
+        assert use_prelude_artifact(obj, block_instructions(tmp_path), None) == instructions and len(obj.runs) == 1
+        assert use_prelude_artifact(obj, block_instructions(tmp_path, 5), None) != instructions and len(obj.runs) == 2
+        # a modified trajectory is set up again
+        (tmp_path / 'traj.nc').write_text('new traj')
+        use_prelude_artifact(obj, block_instructions(tmp_path), None)
+        assert len(obj.runs) == 3
+
+    def test_prelude_failure(self, tmp_path):
+        obj = prelude_obj(tmp_path, binary_path='false')
+        obj.run_biobb = lambda: setattr(obj, 'return_code', 1)
+        assert use_prelude_artifact(obj, block_instructions(tmp_path), None) == block_instructions(tmp_path)
+        assert use_prelude_artifact(prelude_obj(tmp_path, prelude_cache_dir=None), block_instructions(tmp_path), None) == block_instructions(tmp_path)
+        assert use_prelude_artifact(prelude_obj(tmp_path, new_frames=(3, 9)), block_instructions(tmp_path), None) == block_instructions(tmp_path)
@@ -0,0 +1,45 @@
+from biobb_analysis.runtime.progress import ProgressParser, ProgressReporter, run_with_progress
+from biobb_analysis.runtime.staging import StagingBiobbObject
+
+CPPTRAJ_OUTPUT = ('INPUT TRAJECTORIES (1 total):\n'
+                  '----- traj.nc (1-101, 2) -----\n'
+                  ' 0% 10% 20% 30% 40% 50% 60% 70% 80% 90% 100% Complete.\n\n'
+                  'Read 101 frames and processed 51 frames.\n'
+                  'TIME: Avg. throughput= 3045.1211 frames / second.\n')
+
+
+class TestRuntimeProgress():
+    def test_cpptraj_parser(self):
+        parser = ProgressParser()
+        # the progress bar is parsed before its line is complete
+        assert parser.feed(CPPTRAJ_OUTPUT[:CPPTRAJ_OUTPUT.index(' 40%') + 5])
+        assert (parser.frames, parser.total, parser.done) == (20, 51, False)
+        parser.feed(CPPTRAJ_OUTPUT[CPPTRAJ_OUTPUT.index(' 40%') + 5:])
+        assert (parser.frames, parser.total, parser.done, parser.fps) == (51, 51, True, 3045.1211)
+
+    def test_gmx_parser(self):
+        parser = ProgressParser(total=100)
+        assert parser.feed('\rReading frame       0 time    0.000   \rReading frame      10 time  100.000   ', 'stderr')
+        assert parser.frames == 11 and not parser.done
+        assert not parser.feed('\rReading frame', 'stdout')
+        parser.feed('\rLast frame         99 time  990.000   \n', 'stderr')
+        assert parser.frames == 100 and parser.done
+
+    def test_run_with_progress(self):
+        events = []
+        reporter = ProgressReporter(ProgressParser(total=20), events.append, interval=0.1)
+        cmd = "printf '\\rReading frame 9 time 9.0 ' >&2; sleep 0.5; cat; printf '\\rLast frame 19 time 19.0 \\n' >&2"
+        return_code, out, err = run_with_progress(cmd, reporter, stdin_text='selection\n')
+        assert return_code == 0 and out == b'selection\n'
+        # the job is reported as stalled while it does not write any progress
+        assert [event for event in events if event['frames'] == 10 and event['stalled'] > 0 and event['eta']]
+        assert events[-1]['frames'] == 20 and events[-1]['done'] and events[-1]['eta'] == 0
+
+    def test_progress_callback(self, tmp_path):
+        events = []
+        obj = StagingBiobbObject({'progress_callback': events.append})
+        obj.io_dict = {"in": {}, "out": {}}
+        obj.cmd = ['echo', "'Read 5 frames and processed 5 frames.'", '>', str(tmp_path / 'out.log')]
+        obj.execute_command()
+        assert obj.return_code == 0 and len(events) == 1
+        assert not events[0]['done'] and (tmp_path / 'out.log').exists()
@@ -0,0 +1,48 @@
+import os
+from biobb_analysis.runtime.staging import StagingBiobbObject, input_mount_path
+
+
+class TestRuntimeStaging():
+    def staged_object(self, tmp_path, container_path, container_staging='bind'):
+        (tmp_path / 'inputs').mkdir()
+        (tmp_path / 'outputs').mkdir()
+        for name in ['top.prmtop', 'traj.nc']:
+            (tmp_path / 'inputs' / name).write_text(name)
+        obj = StagingBiobbObject({'container_path': container_path, 'container_image': 'ambertools', 'container_volume_path': '/tmp', 'container_staging': container_staging})
+        obj.io_dict = {"in": {"input_top_path": str(tmp_path / 'inputs' / 'top.prmtop'), "input_traj_path": str(tmp_path / 'inputs' / 'traj.nc')},
+                       "out": {"output_cpptraj_path": str(tmp_path / 'outputs' / 'rms.dat')}}
+        obj.stage_files()
+        return obj
+
+    def test_bind_staging(self, tmp_path):
+        obj = self.staged_object(tmp_path, 'docker')
+        mount = input_mount_path(tmp_path.resolve() / 'inputs')
+        assert obj.stage_io_dict["in"] == {"input_top_path": mount + '/top.prmtop', "input_traj_path": mount + '/traj.nc'}
+        assert obj.stage_io_dict["out"] == {"output_cpptraj_path": '/tmp/rms.dat'}
+        # the inputs are not copied and the outputs are written next to their final path
+        assert os.listdir(obj.stage_io_dict["unique_dir"]) == []
+        assert obj.stage_io_dict["unique_dir"].startswith(str(tmp_path.resolve() / 'outputs'))
+
+        obj.cmd = ['cpptraj', '-i', '/tmp/instructions.in']
+        obj.create_cmd_line()
+        volume = obj.cmd.index(obj.stage_io_dict["unique_dir"] + ':/tmp')
+        assert obj.cmd[volume + 1:volume + 3] == ['-v', '%s:%s:ro' % (tmp_path.resolve() / 'inputs', mount)]
+
+        (tmp_path / obj.stage_io_dict["unique_dir"] / 'rms.dat').write_text('#Frame RMSD')
+        obj.copy_to_host()
+        assert (tmp_path / 'outputs' / 'rms.dat').read_text() == '#Frame RMSD'
+
+    def test_copy_fallback(self, tmp_path):
+        obj = self.staged_object(tmp_path, 'biobb_analysis_pool_docker')
+        assert obj.container_staging == 'copy'
+        assert sorted(os.listdir(obj.stage_io_dict["unique_dir"])) == ['top.prmtop', 'traj.nc']
+        obj.tmp_files.append(obj.stage_io_dict["unique_dir"])
+        obj.remove_tmp_files()
+
+    def test_stdin_pipe(self, tmp_path):
+        obj = StagingBiobbObject({'stdin_pipe': True})
+        obj.stdin_text = 'parm top.prmtop\n'
+        obj.cmd = ['cat', '>', str(tmp_path / 'stdin.txt')]
+        obj.execute_command()
+        assert obj.return_code == 0
+        assert (tmp_path / 'stdin.txt').read_text() == 'parm top.prmtop\n'
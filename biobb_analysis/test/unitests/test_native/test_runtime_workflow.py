@@ -0,0 +1,114 @@
+import threading
+import time
+import pytest
+from biobb_analysis.runtime.workflow import Workflow, get_block_class
+
+LAUNCHES = []
+LOCK = threading.Lock()
+RUNNING = [0, 0]
+
+
+class FakeBlock:
+    """ Writes the name of the block and its inputs to its outputs """
+
+    def __init__(self, properties=None, **paths):
+        self.paths = paths
+        self.properties = properties or {}
+
+    def launch(self):
+        with LOCK:
+            LAUNCHES.append((self.__class__.__name__, dict(self.paths), dict(self.properties)))
+            RUNNING[0] += 1
+            RUNNING[1] = max(RUNNING)
+        time.sleep(self.properties.get('sleep', 0))
+        with LOCK:
+            RUNNING[0] -= 1
+        if self.properties.get('fail'):
+            return 1
+        text = self.__class__.__name__ + ''.join(open(path).read() for key, path in sorted(self.paths.items()) if key.startswith('input_'))
+        for key, path in self.paths.items():
+            if key.startswith('output_'):
+                open(path, 'w').write(text)
+        return 0
+
+
+class GMXTrjConvTrj(FakeBlock):
+    pass
+
+
+class Analysis(FakeBlock):
+    pass
+
+
+class TestRuntimeWorkflow():
+    def setup_method(self):
+        LAUNCHES.clear()
+        RUNNING[:] = [0, 0]
+
+    def test_block_class(self):
+        assert get_block_class(Analysis) is Analysis
+        assert get_block_class('test_runtime_workflow:Analysis') is Analysis
+        assert get_block_class('cpptraj_rgyr').__name__ == 'CpptrajRgyr'
+        with pytest.raises(ValueError):
+            get_block_class('cpptraj_unknown')
+
+    def test_order_and_duplicates(self, tmp_path):
+        (tmp_path / 'in.txt').write_text('in')
+        workflow = Workflow(cpus=4, memory=1)
+        # declared out of order: the second step reads the output of the first one
+        workflow.add(Analysis, input_path=str(tmp_path / 'a.txt'), output_path=str(tmp_path / 'b.txt'), step_id='b')
+        workflow.add(Analysis, input_path=str(tmp_path / 'in.txt'), output_path=str(tmp_path / 'a.txt'), step_id='a')
+        workflow.add(Analysis, input_path=str(tmp_path / 'in.txt'), output_path=str(tmp_path / 'copy.txt'), step_id='copy')
+        workflow.add(Analysis, input_path=str(tmp_path / 'copy.txt'), output_path=str(tmp_path / 'c.txt'), step_id='c')
+        assert sorted(task.name for task in workflow.plan()) == ['block(a)', 'block(b)', 'block(c)', 'copy(copy)']
+        assert workflow.run() == {'b': 0, 'a': 0, 'copy': 0, 'c': 0}
+        assert [launch[1]['output_path'] for launch in LAUNCHES][0] == str(tmp_path / 'a.txt') and len(LAUNCHES) == 3
+        assert (tmp_path / 'copy.txt').read_text() == (tmp_path / 'a.txt').read_text() == 'Analysisin'
+        assert (tmp_path / 'b.txt').read_text() == (tmp_path / 'c.txt').read_text() == 'AnalysisAnalysisin'
+
+    def test_resources_and_failures(self, tmp_path):
+        (tmp_path / 'in.txt').write_text('in')
+        workflow = Workflow(cpus=2, memory=1)
+        for i in range(4):
+            workflow.add(Analysis, {'sleep': 0.2, 'index': i}, input_path=str(tmp_path / 'in.txt'), output_path=str(tmp_path / ('%d.txt' % i)))
+        failing = workflow.add(Analysis, {'fail': True}, input_path=str(tmp_path / 'in.txt'), output_path=str(tmp_path / 'fail.txt'))
+        child = workflow.add(Analysis, input_path=str(tmp_path / 'fail.txt'), output_path=str(tmp_path / 'child.txt'))
+        workflow.add(Analysis, input_path=str(tmp_path / 'child.txt'), output_path=str(tmp_path / 'grandchild.txt'))
+        return_codes = workflow.run()
+        assert RUNNING[1] == 2
+        assert return_codes[failing.id] == 1 and return_codes[child.id] is None and list(return_codes.values()).count(None) == 2
+        assert list(return_codes.values()).count(0) == 4 and not (tmp_path / 'child.txt').exists()
+
+    def test_trjconv_fusion(self, tmp_path):
+        (tmp_path / 'traj.xtc').write_text('traj')
+        workflow = Workflow(cpus=1)
+        workflow.add(GMXTrjConvTrj, {'selection': 'Protein'}, intermediate=True, input_traj_path=str(tmp_path / 'traj.xtc'),
+                     input_top_path=str(tmp_path / 'traj.xtc'), output_traj_path=str(tmp_path / 'protein.xtc'))
+        workflow.add(GMXTrjConvTrj, {'start': 10, 'dt': 5}, input_traj_path=str(tmp_path / 'protein.xtc'), output_traj_path=str(tmp_path / 'sliced.xtc'))
+        workflow.run()
+        assert len(LAUNCHES) == 1 and not (tmp_path / 'protein.xtc').exists()
+        assert LAUNCHES[0][1]['output_traj_path'] == str(tmp_path / 'sliced.xtc')
+        assert LAUNCHES[0][2] == {'selection': 'Protein', 'start': 10, 'dt': 5}
+        # both steps select frames: they can not be joined
+        LAUNCHES.clear()
+        workflow.steps[0].properties['end'] = 100
+        workflow.tasks = None
+        workflow.run()
+        assert len(LAUNCHES) == 2
+
+    def test_cpptraj_groups(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(Analysis, '__module__', 'biobb_analysis.ambertools.cpptraj_fake')
+        paths = {'input_top_path': str(tmp_path / 'top.prmtop'), 'input_traj_path': str(tmp_path / 'traj.nc')}
+        workflow = Workflow(cpus=1)
+        rgyr = workflow.add(Analysis, {'mask': 'c-alpha'}, output_cpptraj_path=str(tmp_path / 'rgyr.dat'), **paths)
+        rms = workflow.add(Analysis, {'mask': 'backbone'}, output_cpptraj_path=str(tmp_path / 'rms.dat'), **paths)
+        other = workflow.add(Analysis, {'binary_path': 'other'}, output_cpptraj_path=str(tmp_path / 'other.dat'), **paths)
+        # the stripped trajectory is read by the last step, that must run after it
+        strip = workflow.add(Analysis, output_cpptraj_path=str(tmp_path / 'strip.nc'), **paths)
+        last = workflow.add(Analysis, input_top_path=paths['input_top_path'], input_traj_path=str(tmp_path / 'strip.nc'),
+                            output_cpptraj_path=str(tmp_path / 'last.dat'))
+        dependent = workflow.add(Analysis, input_extra_path=str(tmp_path / 'rms.dat'), output_cpptraj_path=str(tmp_path / 'dep.dat'), **paths)
+        tasks = {task.name: task for task in workflow.plan()}
+        assert sorted(tasks) == sorted(['cpptraj(%s, %s, %s)' % (rgyr.id, rms.id, strip.id), 'block(%s)' % other.id, 'block(%s)' % last.id,
+                                        'block(%s)' % dependent.id])
+        assert [task.name for task in tasks['block(%s)' % last.id].deps] == ['cpptraj(%s, %s, %s)' % (rgyr.id, rms.id, strip.id)]
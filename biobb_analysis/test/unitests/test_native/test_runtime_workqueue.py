@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from biobb_analysis.runtime.workqueue import submit, claim, requeue_dead, status
+
+FAKE_BLOCK = '''import os
+import time
+from pathlib import Path
+
+
+def fake_block(output_path, properties=None):
+    # the first attempt of a hanging job never finishes
+    if properties.get('hang') and not Path(output_path + '.claimed').exists():
+        Path(output_path + '.claimed').write_text('')
+        time.sleep(60)
+    time.sleep(properties.get('sleep', 0))
+    with open(output_path, 'a') as output:
+        output.write('%d\\n' % os.getpid())
+    return 0
+'''
+
+
+def start_worker(tmp_path, queue_dir, *args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), str(Path(__file__).resolve().parents[4])]))
+    return subprocess.Popen([sys.executable, '-m', 'biobb_analysis', 'worker', str(queue_dir), '--poll_interval', '0.1',
+                             '--heartbeat_interval', '0.2', *args], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class TestRuntimeWorkqueue():
+    def test_claim_and_requeue(self, tmp_path):
+        first = submit(tmp_path, 'cpptraj_rgyr', {'input_top_path': 'top.prmtop'}, max_attempts=2)
+        submit(tmp_path, 'cpptraj_rgyr', {'input_top_path': 'top.prmtop'})
+        job, running_path = claim(tmp_path, 'node1-1')
+        assert job['id'] == first and running_path.name == first + '@node1-1.json'
+        assert status(tmp_path) == {'pending': 1, 'running': 1, 'done': 0, 'failed': 0}
+        # the worker never wrote its heartbeat
+        assert requeue_dead(tmp_path, 60) == [first]
+        job, running_path = claim(tmp_path, 'node1-2')
+        assert job['id'] == first and job['attempts'] == 1 and job['dead_workers'] == ['node1-1']
+        assert requeue_dead(tmp_path, 60) == [first]
+        assert status(tmp_path) == {'pending': 1, 'running': 0, 'done': 0, 'failed': 1}
+
+    def test_local_workers(self, tmp_path):
+        (tmp_path / 'fakeblock.py').write_text(FAKE_BLOCK)
+        queue_dir = tmp_path / 'queue'
+        outputs = [str(tmp_path / ('output%d.txt' % i)) for i in range(12)]
+        for output in outputs:
+            submit(queue_dir, 'fakeblock:fake_block', {'output_path': output}, {'sleep': 0.1})
+        workers = [start_worker(tmp_path, queue_dir, '--exit_when_empty') for _ in range(3)]
+        assert [worker.wait(timeout=60) for worker in workers] == [0, 0, 0]
+        assert status(queue_dir) == {'pending': 0, 'running': 0, 'done': 12, 'failed': 0}
+        # every job runs once
+        assert all(len(Path(output).read_text().split()) == 1 for output in outputs)
+
+    def test_dead_worker(self, tmp_path):
+        (tmp_path / 'fakeblock.py').write_text(FAKE_BLOCK)
+        queue_dir = tmp_path / 'queue'
+        output = str(tmp_path / 'output.txt')
+        job_id = submit(queue_dir, 'fakeblock:fake_block', {'output_path': output}, {'hang': True})
+        dead_worker = start_worker(tmp_path, queue_dir)
+        while not Path(output + '.claimed').exists():
+            time.sleep(0.1)
+        dead_worker.kill()
+        dead_worker.wait()
+        worker = start_worker(tmp_path, queue_dir, '--exit_when_empty', '--dead_timeout', '1')
+        assert worker.wait(timeout=60) == 0
+        job = json.loads((queue_dir / 'done' / (job_id + '.json')).read_text())
+        assert job['attempts'] == 1 and len(job['dead_workers']) == 1
+        assert Path(output).read_text().split() == [str(worker.pid)]
@@ -18,18 +18,21 @@ setuptools.setup(
         "Bioexcel": "https://bioexcel.eu/"
     },
     packages=setuptools.find_packages(exclude=['docs', 'test']),
-    install_requires=['biobb_common==3.9.0'],
+    install_requires=['biobb_common==3.9.0', 'numpy'],
     python_requires='>=3.7,<3.10',
     entry_points={
         "console_scripts": [
+            "biobb_analysis = biobb_analysis.cli:main",
             "cpptraj_average = biobb_analysis.ambertools.cpptraj_average:main",
             "cpptraj_bfactor = biobb_analysis.ambertools.cpptraj_bfactor:main",
             "cpptraj_convert = biobb_analysis.ambertools.cpptraj_convert:main",
             "cpptraj_dry = biobb_analysis.ambertools.cpptraj_dry:main",
+            "cpptraj_fanout = biobb_analysis.ambertools.cpptraj_fanout:main",
             "cpptraj_image = biobb_analysis.ambertools.cpptraj_image:main",
             "cpptraj_mask = biobb_analysis.ambertools.cpptraj_mask:main",
             "cpptraj_rgyr = biobb_analysis.ambertools.cpptraj_rgyr:main",
             "cpptraj_rms = biobb_analysis.ambertools.cpptraj_rms:main",
+            "cpptraj_rms2d = biobb_analysis.ambertools.cpptraj_rms2d:main",
             "cpptraj_rmsf = biobb_analysis.ambertools.cpptraj_rmsf:main",
             "cpptraj_slice = biobb_analysis.ambertools.cpptraj_slice:main",
             "cpptraj_snapshot = biobb_analysis.ambertools.cpptraj_snapshot:main",
@@ -41,7 +44,9 @@ setuptools.setup(
             "gmx_rms = biobb_analysis.gromacs.gmx_rms:main",
             "gmx_trjconv_str_ens = biobb_analysis.gromacs.gmx_trjconv_str_ens:main",
             "gmx_trjconv_str = biobb_analysis.gromacs.gmx_trjconv_str:main",
-            "gmx_trjconv_trj = biobb_analysis.gromacs.gmx_trjconv_trj:main"
+            "gmx_trjconv_trj = biobb_analysis.gromacs.gmx_trjconv_trj:main",
+            "biobb_analysis_pool_docker = biobb_analysis.runtime.containers:main",
+            "biobb_analysis_pool_singularity = biobb_analysis.runtime.containers:main"
         ]
     },
     classifiers=(